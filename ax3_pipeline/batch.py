@@ -0,0 +1,218 @@
+"""
+Runs the same pipeline over a whole cohort of participant recordings on a pool of worker processes.
+
+The raw arrays of the next participants are loaded (prefetched) in the main process while the workers compute, they
+are handed to the workers through shared memory instead of being pickled. A failure of a single participant is
+reported in the result instead of aborting the whole run, this includes worker processes that die (e.g. killed by the
+operating system when running out of memory).
+"""
+import multiprocessing
+import traceback
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .cwa import read_cwa
+
+CohortResult = namedtuple("CohortResult", ["results", "failures"])
+CohortResult.__doc__ = """
+results: OrderedDict participant_id -> epoch DataFrame (or the return value of the writer)
+failures: OrderedDict participant_id -> formatted traceback of the failure
+"""
+
+
+def default_loader(participant_input):
+    """
+    :param participant_input: path to a .cwa file or a (timestamps_ms, x, y, z) tuple
+    :return: (timestamps_ms, x, y, z) arrays
+    """
+    if isinstance(participant_input, str):
+        return read_cwa(participant_input)
+    return tuple(participant_input)
+
+
+def run_cohort(pipeline_factory, participants, loader=default_loader, writer=None, n_workers=None, n_prefetch=1,
+               max_tasks_per_worker=None, max_memory_bytes_per_worker=None, use_shared_memory=True):
+    """
+    Processes every participant with pipeline_factory(timestamps_ms).process(x, y, z)[0].
+    :param pipeline_factory: picklable (i.e. module level) function taking the timestamps of a participant and
+    returning the pipeline (e.g. the composition of example_pipeline.py)
+    :param participants: dict participant_id -> input or sequence of (participant_id, input) tuples
+    :param loader: picklable function turning an input into (timestamps_ms, x, y, z) arrays, runs in the main process
+    :param writer: optional picklable function (participant_id, df) called in the worker (e.g. to write the epoch
+    DataFrame to disk), its return value is collected instead of the DataFrame
+    :param n_workers: number of worker processes (defaults to the number of CPUs)
+    :param n_prefetch: number of participants loaded ahead of time
+    :param max_tasks_per_worker: number of participants after which a worker process is replaced (releases memory
+    that was not given back to the operating system), workers are then started with the 'spawn' method
+    :param max_memory_bytes_per_worker: address space limit of each worker (Linux/macOS only), participants exceeding
+    it fail with a MemoryError (or with a terminated worker if the allocation aborts the process)
+    :param use_shared_memory: whether raw arrays are handed to the workers via shared memory (otherwise pickled)
+    :return: CohortResult
+    """
+    items = list(participants.items()) if isinstance(participants, dict) else list(participants)
+    n_workers = multiprocessing.cpu_count() if n_workers is None else n_workers
+    results, failures = OrderedDict(), OrderedDict()
+    in_flight = deque()
+    if use_shared_memory:
+        # workers must share the resource tracker of the main process, otherwise the tracker started by a worker
+        # would unlink the attached segments as soon as that worker is replaced
+        resource_tracker.ensure_running()
+
+    def make_pool(max_workers):
+        if max_tasks_per_worker is None:
+            return ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(max_memory_bytes_per_worker,))
+        # replacing workers is not supported with the fork start method
+        return ProcessPoolExecutor(max_workers, multiprocessing.get_context("spawn"), _init_worker,
+                                   (max_memory_bytes_per_worker,), max_tasks_per_child=max_tasks_per_worker)
+
+    def store(participant_id, arrays, future):
+        try:
+            succeeded, value = future.result()
+        except Exception:
+            # e.g. the return value of the writer could not be pickled
+            succeeded, value = False, traceback.format_exc()
+        finally:
+            _release(arrays)
+        (results if succeeded else failures)[participant_id] = value
+
+    def run_isolated(participant_id, arrays):
+        # a single worker pool, a terminated worker can only be caused by this participant
+        with make_pool(1) as isolated:
+            future = isolated.submit(_process_participant, pipeline_factory, participant_id, _describe(arrays), writer)
+            store(participant_id, arrays, future)
+
+    def recover():
+        # a worker died, the pool cannot tell which participant caused it and fails all pending tasks, so these are
+        # rerun one by one
+        nonlocal pool
+        pool.shutdown(wait=True)
+        suspects = []
+        while in_flight:
+            participant_id, arrays, future = in_flight.popleft()
+            if future.done() and not isinstance(future.exception(), BrokenProcessPool):
+                store(participant_id, arrays, future)
+            else:
+                suspects.append((participant_id, arrays))
+        for participant_id, arrays in suspects:
+            run_isolated(participant_id, arrays)
+        pool = make_pool(n_workers)
+
+    def submit(participant_id, arrays):
+        try:
+            future = pool.submit(_process_participant, pipeline_factory, participant_id, _describe(arrays), writer)
+        except BrokenProcessPool:
+            recover()
+            future = pool.submit(_process_participant, pipeline_factory, participant_id, _describe(arrays), writer)
+        in_flight.append((participant_id, arrays, future))
+
+    def collect():
+        participant_id, arrays, future = in_flight[0]
+        if isinstance(future.exception(), BrokenProcessPool):
+            recover()
+        else:
+            in_flight.popleft()
+            store(participant_id, arrays, future)
+
+    pool = make_pool(n_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            loading = deque(prefetcher.submit(_load, loader, participant_input, use_shared_memory)
+                            for _, participant_input in items[:n_prefetch + 1])
+
+            for i, (participant_id, _) in enumerate(items):
+                if i + n_prefetch + 1 < len(items):
+                    loading.append(prefetcher.submit(_load, loader, items[i + n_prefetch + 1][1], use_shared_memory))
+                try:
+                    arrays = loading.popleft().result()
+                except Exception:
+                    failures[participant_id] = traceback.format_exc()
+                    continue
+
+                submit(participant_id, arrays)
+                # bounds the number of participants held in memory
+                while len(in_flight) > n_workers:
+                    collect()
+
+            while in_flight:
+                collect()
+    finally:
+        pool.shutdown(wait=True)
+        for _, arrays, _ in in_flight:
+            _release(arrays)
+
+    return CohortResult(results, failures)
+
+
+def _init_worker(max_memory_bytes):
+    if max_memory_bytes is not None:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, max_memory_bytes))
+
+
+def _load(loader, participant_input, use_shared_memory):
+    arrays = [np.asarray(a) for a in loader(participant_input)]
+    if not use_shared_memory:
+        return arrays
+
+    shared = []
+    try:
+        for a in arrays:
+            shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+            shared.append((shm, a.shape, a.dtype.str))
+    except Exception:
+        _release(shared)
+        raise
+    return shared
+
+
+def _release(arrays):
+    for a in arrays:
+        if isinstance(a, tuple):
+            a[0].close()
+            a[0].unlink()
+
+
+def _describe(arrays):
+    """
+    :return: picklable description of the arrays (shared memory segments are referenced by name)
+    """
+    return [(a[0].name, a[1], a[2]) if isinstance(a, tuple) else a for a in arrays]
+
+
+def _attach(arrays):
+    """
+    :return: numpy arrays and the attached shared memory segments (which need to be closed after use)
+    """
+    segments, r = [], []
+    for a in arrays:
+        if isinstance(a, tuple):
+            shm = shared_memory.SharedMemory(name=a[0])
+            segments.append(shm)
+            r.append(np.ndarray(a[1], dtype=a[2], buffer=shm.buf))
+        else:
+            r.append(a)
+    return r, segments
+
+
+def _process_participant(pipeline_factory, participant_id, arrays, writer):
+    segments = []
+    try:
+        (timestamps_ms, *data), segments = _attach(arrays)
+        df = pipeline_factory(timestamps_ms).process(*data)[0]
+        # the output must not reference the shared memory which is released by the main process
+        df = df.copy(deep=True)
+        del timestamps_ms, data
+        return True, df if writer is None else writer(participant_id, df)
+    except Exception:
+        return False, traceback.format_exc()
+    finally:
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                pass
@@ -2,18 +2,28 @@ import warnings
 
 import pandas as pd
 
+from .daily_features import day_index
+
 
 def filter_noncompliant_weartime_days(acc_epoch_df, min_weartime_percentage=0.5, max_weartime_percentage=0.8,
-                                      epoch_length_s=5):
+                                      epoch_length_s=5, tz=None, day_start_hour=0):
+    """
+    Removes all days whose weartime (fraction of valid epochs) is outside of the given range.
+    :param acc_epoch_df: datetime indexed epoch DataFrame (non-wear epochs removed or NaN)
+    :param min_weartime_percentage: minimum fraction of the day with valid epochs
+    :param max_weartime_percentage: maximum fraction of the day with valid epochs
+    :param epoch_length_s: epoch length in seconds
+    :param tz: time zone the day boundaries refer to (see daily_features.day_index)
+    :param day_start_hour: hour at which a day starts (e.g. 12 for noon-to-noon windows)
+    :return: epoch DataFrame restricted to compliant days
+    """
     assert isinstance(acc_epoch_df.index, pd.DatetimeIndex), "Epoch DataFrame must have a DateTimeIndex"
 
-    days = []
-    for idx, day in acc_epoch_df.resample("d"):
-        p_weartime = day.x_mean.count() * epoch_length_s / 86400
-        if p_weartime >= min_weartime_percentage and p_weartime <= max_weartime_percentage:
-            days.append(day)
-    if not days:
+    days = day_index(acc_epoch_df.index, tz, day_start_hour).to_numpy()
+    p_weartime = acc_epoch_df.x_mean.notna().groupby(days).transform("sum").to_numpy() * epoch_length_s / 86400
+    compliant = (p_weartime >= min_weartime_percentage) & (p_weartime <= max_weartime_percentage)
+    if not compliant.any():
         warnings.warn("No weartime compliant days found for participant df: %s" % str(acc_epoch_df.head(1)))
         return pd.DataFrame()
 
-    return pd.concat(days)
\ No newline at end of file
+    return acc_epoch_df[compliant]
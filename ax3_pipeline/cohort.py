@@ -0,0 +1,147 @@
+"""
+Participant index of a cohort epoch table (one DataFrame with the epochs of all participants).
+
+Cohort groups the rows by participant once and keeps the offset range of every participant, so the epochs of a
+participant are a slice of the (grouped) table instead of a boolean mask scan over all rows:
+
+    cohort = Cohort(epoch_table)
+    df = cohort["p001"]                                     # zero-copy slice
+    for participant, df in cohort.iter_participants(columns=["mean_enmo", "x_mean"]):
+        ...
+    daily = cohort.daily_features(tz="Europe/Zurich")       # one row per participant and day
+    compliant = cohort.filter_noncompliant_weartime_days()  # Cohort of the compliant days
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .cleaning import filter_noncompliant_weartime_days
+from .daily_features import DailyFeatureEngine
+
+
+class Cohort(object):
+
+    def __init__(self, df, participant_column="participant_id"):
+        """
+        Rows of the same participant are grouped by one stable sort (keeping their order, e.g. by time), which is
+        skipped if they are already contiguous. Rows without participant are dropped.
+        :param df: DataFrame with the rows of all participants
+        :param participant_column: name of the column identifying the participants
+        """
+        codes, participants = pd.factorize(df[participant_column], sort=False)
+        if np.any(codes < 0):
+            df, codes = df[codes >= 0], codes[codes >= 0]
+
+        # codes are non-negative, so the prepended -2 marks the first row as the start of a participant
+        starts = np.flatnonzero(np.diff(codes, prepend=-2))
+        if len(starts) != len(participants):
+            # participants are interleaved, the only copy of the table
+            order = np.argsort(codes, kind="stable")
+            df, codes = df.take(order), codes[order]
+            starts = np.flatnonzero(np.diff(codes, prepend=-2))
+
+        self._df = df
+        self._participant_column = participant_column
+        self._starts = starts
+        self._stops = np.append(starts[1:], len(codes))[:len(starts)]
+        self._participants = participants[codes[starts]]
+        self._positions = {p: i for i, p in enumerate(self._participants)}
+
+    @classmethod
+    def from_parts(cls, parts, participant_column="participant_id"):
+        """
+        :param parts: iterable of DataFrames, each with the rows of a single participant
+        :return: Cohort of the concatenated parts (no additional sort)
+        """
+        parts = [p for p in parts if len(p) > 0]
+        if len(parts) == 0:
+            return cls(pd.DataFrame(columns=[participant_column]), participant_column)
+        return cls(pd.concat(parts), participant_column)
+
+    @property
+    def participants(self):
+        """
+        :return: participant ids in the order of the grouped table
+        """
+        return list(self._participants)
+
+    @property
+    def table(self):
+        """
+        :return: the grouped table (all participants)
+        """
+        return self._df
+
+    def __len__(self):
+        return len(self._participants)
+
+    def __contains__(self, participant):
+        return participant in self._positions
+
+    def __iter__(self):
+        return iter(self._participants)
+
+    def offsets(self, participant):
+        """
+        :return: start and stop (exclusive) row offsets of the participant within the grouped table
+        """
+        i = self._positions[participant]
+        return int(self._starts[i]), int(self._stops[i])
+
+    def __getitem__(self, participant):
+        """
+        :return: rows of the participant (a slice of the grouped table, pandas returns a view where possible)
+        """
+        start, stop = self.offsets(participant)
+        return self._df.iloc[start:stop]
+
+    def get(self, participant, columns=None):
+        """
+        :param participant: participant id
+        :param columns: optional subset of columns (only these are copied for the participant)
+        """
+        start, stop = self.offsets(participant)
+        if columns is None:
+            return self._df.iloc[start:stop]
+        return self._df.iloc[start:stop][list(columns)]
+
+    def iter_participants(self, columns=None, participants=None):
+        """
+        Lazily yields the rows of one participant at a time.
+        :param columns: optional subset of columns
+        :param participants: optional subset of participants (defaults to all)
+        :return: iterator of (participant, DataFrame)
+        """
+        for participant in self._participants if participants is None else participants:
+            yield participant, self.get(participant, columns)
+
+    def apply(self, function, columns=None):
+        """
+        :param function: function(DataFrame) applied to the rows of every participant
+        :param columns: optional subset of columns passed to the function
+        :return: OrderedDict participant -> result
+        """
+        return OrderedDict((p, function(df)) for p, df in self.iter_participants(columns))
+
+    def daily_features(self, tz=None, day_start_hour=0, engine=None):
+        """
+        :param tz: time zone the day boundaries refer to (see daily_features.day_index)
+        :param day_start_hour: hour at which a day starts
+        :param engine: optional DailyFeatureEngine (e.g. with registered features), overrides tz and day_start_hour
+        :return: DataFrame with the daily features indexed by participant and day
+        """
+        engine = DailyFeatureEngine(tz, day_start_hour) if engine is None else engine
+        daily = self.apply(engine.process)
+        if len(daily) == 0:
+            return pd.DataFrame()
+        return pd.concat(daily.values(), keys=list(daily.keys()), names=[self._participant_column, "day"])
+
+    def filter_noncompliant_weartime_days(self, **kwargs):
+        """
+        Applies cleaning.filter_noncompliant_weartime_days per participant.
+        :param kwargs: arguments of cleaning.filter_noncompliant_weartime_days
+        :return: Cohort with the compliant days of all participants
+        """
+        parts = (filter_noncompliant_weartime_days(df, **kwargs) for _, df in self.iter_participants())
+        return Cohort.from_parts(parts, self._participant_column)
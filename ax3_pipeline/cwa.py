@@ -0,0 +1,207 @@
+"""
+Memory-mapped reader for raw Axivity (AX3) .cwa files.
+
+The binary file is never loaded as a whole, the 512 byte data blocks are decoded in batches of vectorized numpy
+operations and the results can directly be fed into EpochGenerator and the filter blocks, e.g.:
+
+    timestamps_ms, x, y, z = read_cwa("participant.cwa")
+    epoch_gen = EpochGenerator(timestamps_ms=timestamps_ms)
+
+NOTE: timestamps are taken from the device clock as is (no time zone information is stored in the file).
+"""
+import warnings
+from typing import Iterator, Tuple
+
+import numpy as np
+
+BLOCK_SIZE = 512
+
+_BLOCK_DTYPE = np.dtype([
+    ("packet_header", "<u2"),
+    ("packet_length", "<u2"),
+    ("device_fractional", "<u2"),
+    ("session_id", "<u4"),
+    ("sequence_id", "<u4"),
+    ("timestamp", "<u4"),
+    ("light", "<u2"),
+    ("temperature", "<u2"),
+    ("events", "u1"),
+    ("battery", "u1"),
+    ("sample_rate", "u1"),
+    ("num_axes_bps", "u1"),
+    ("timestamp_offset", "<i2"),
+    ("sample_count", "<u2"),
+    ("sample_data", "u1", (480,)),
+    ("checksum", "<u2")
+])
+
+_DATA_PACKET_HEADER = 0x5841  # "AX"
+_DATA_PACKET_LENGTH = 508
+
+
+def n_data_blocks(path: str) -> int:
+    """
+    :param path: path to the .cwa file
+    :return: number of data blocks in the file
+    """
+    return _memmap_blocks(path).shape[0]
+
+
+def read_cwa(path: str, start_block=0, n_blocks=None, n_blocks_per_batch=10000, validate_checksum=True) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes the accelerometer samples of a (range of) data blocks of a .cwa file.
+    :param path: path to the .cwa file
+    :param start_block: index of the first data block to decode
+    :param n_blocks: number of data blocks to decode (defaults to all remaining blocks)
+    :param n_blocks_per_batch: number of blocks decoded at once, bounds the size of temporary arrays
+    :param validate_checksum: whether to skip blocks with an invalid checksum
+    :return: POSIX timestamps in ms (int64) and x, y, z accelerations in g (float32)
+    """
+    blocks = _memmap_blocks(path)
+    stop_block = blocks.shape[0] if n_blocks is None else min(start_block + n_blocks, blocks.shape[0])
+    blocks = blocks[start_block:stop_block]
+
+    batches = [slice(i, i + n_blocks_per_batch) for i in range(0, blocks.shape[0], n_blocks_per_batch)]
+    valid = [_valid_blocks(blocks[b], validate_checksum) for b in batches]
+    n_samples = sum(int(np.sum(_sample_counts(blocks[b][v]))) for b, v in zip(batches, valid))
+
+    timestamps_ms = np.empty(n_samples, dtype=np.int64)
+    xyz = np.empty((3, n_samples), dtype=np.float32)
+    i = 0
+    for b, v in zip(batches, valid):
+        t, a = _decode_blocks(np.asarray(blocks[b][v]))
+        timestamps_ms[i:i + len(t)] = t
+        xyz[:, i:i + len(t)] = a
+        i += len(t)
+
+    return timestamps_ms, xyz[0], xyz[1], xyz[2]
+
+
+def iter_cwa(path: str, n_samples_per_chunk=720 * 500, n_blocks_per_batch=10000, validate_checksum=True) \
+        -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Decodes a .cwa file chunk by chunk. All chunks except the last one contain exactly n_samples_per_chunk samples,
+    hence chunks are epoch aligned if n_samples_per_chunk is a multiple of the epoch length.
+    :param path: path to the .cwa file
+    :param n_samples_per_chunk: number of samples per yielded chunk (defaults to one hour of 5s epochs @100 Hz)
+    :param n_blocks_per_batch: number of blocks decoded at once
+    :param validate_checksum: whether to skip blocks with an invalid checksum
+    :return: iterator over POSIX timestamps in ms (int64) and x, y, z accelerations in g (float32)
+    """
+    blocks = _memmap_blocks(path)
+    remainder = None
+    for start in range(0, blocks.shape[0], n_blocks_per_batch):
+        batch = blocks[start:start + n_blocks_per_batch]
+        t, a = _decode_blocks(np.asarray(batch[_valid_blocks(batch, validate_checksum)]))
+        if remainder is not None:
+            t, a = np.concatenate([remainder[0], t]), np.concatenate([remainder[1], a], axis=1)
+
+        n_full = len(t) - len(t) % n_samples_per_chunk
+        for i in range(0, n_full, n_samples_per_chunk):
+            yield t[i:i + n_samples_per_chunk], a[0, i:i + n_samples_per_chunk], \
+                a[1, i:i + n_samples_per_chunk], a[2, i:i + n_samples_per_chunk]
+        remainder = t[n_full:], a[:, n_full:]
+
+    if remainder is not None and len(remainder[0]) > 0:
+        yield remainder[0], remainder[1][0], remainder[1][1], remainder[1][2]
+
+
+def _memmap_blocks(path):
+    header = np.memmap(path, dtype="<u2", mode="r", shape=(2,))
+    if header[0] != 0x444D:  # "MD"
+        raise ValueError("%s is not a valid .cwa file (missing header packet)" % path)
+    header_size = int(header[1]) + 4
+    n_blocks = (_file_size(path) - header_size) // BLOCK_SIZE
+    if n_blocks <= 0:
+        return np.empty(0, dtype=_BLOCK_DTYPE)
+    return np.memmap(path, dtype=_BLOCK_DTYPE, mode="r", offset=header_size, shape=(n_blocks,))
+
+
+def _file_size(path):
+    with open(path, "rb") as f:
+        return f.seek(0, 2)
+
+
+def _valid_blocks(blocks, validate_checksum):
+    valid = (blocks["packet_header"] == _DATA_PACKET_HEADER) & (blocks["packet_length"] == _DATA_PACKET_LENGTH)
+    valid &= (blocks["sample_count"] > 0) & (blocks["sample_rate"] > 0)
+    if validate_checksum:
+        # the 16 bit words of a valid block sum up to zero
+        words = np.asarray(blocks).view(np.dtype(("<u2", BLOCK_SIZE // 2))).astype(np.uint32)
+        valid &= (np.sum(words, axis=1) & 0xFFFF) == 0
+
+    n_invalid = len(valid) - np.count_nonzero(valid)
+    if n_invalid > 0:
+        warnings.warn("Skipping %d invalid data blocks" % n_invalid)
+    return valid
+
+
+def _decode_blocks(blocks):
+    """
+    :param blocks: valid data blocks
+    :return: timestamps in ms and a (3, n_samples) array with the x, y, z accelerations in g
+    """
+    num_axes = blocks["num_axes_bps"] >> 4
+    bytes_per_sample = blocks["num_axes_bps"] & 0x0F
+    if len(blocks) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((3, 0), dtype=np.float32)
+    if np.any(num_axes != 3) or np.any(bytes_per_sample != bytes_per_sample[0]):
+        raise ValueError("Only 3-axis recordings with a constant sample format are supported")
+
+    if bytes_per_sample[0] == 0:
+        # packed format: 4 bytes per sample, 3x 10 bit signed values and a shared 2 bit exponent (units of 1/256 g)
+        packed = blocks["sample_data"].view("<u4").astype(np.int32)
+        exponent = (packed >> 30) & 0x03
+        xyz = np.stack([(((packed >> shift) & 0x3FF) ^ 0x200) - 0x200 for shift in (0, 10, 20)])
+        acc = np.left_shift(xyz, exponent).astype(np.float32) / np.float32(256)
+    elif bytes_per_sample[0] == 2:
+        # unpacked format: 3x int16 per sample, the accelerometer scale is stored in the top bits of the light field
+        acc = blocks["sample_data"].view("<i2").reshape(len(blocks), -1, 3).transpose(2, 0, 1)
+        scale = np.left_shift(1, 8 + ((blocks["light"] >> 13) & 0x07)).astype(np.float32)
+        acc = acc.astype(np.float32) / scale.reshape(1, -1, 1)
+    else:
+        raise ValueError("Unsupported number of bytes per sample: %d" % bytes_per_sample[0])
+
+    n_slots = acc.shape[2]
+    in_block = np.arange(n_slots).reshape(1, -1) < _sample_counts(blocks).reshape(-1, 1)
+
+    frequency = 3200.0 / np.left_shift(1, 15 - (blocks["sample_rate"].astype(np.int64) & 0x0F))
+    block_time_s, timestamp_offset = _block_times(blocks, frequency)
+    sample_time_s = block_time_s.reshape(-1, 1) + \
+        (np.arange(n_slots).reshape(1, -1) - timestamp_offset.reshape(-1, 1)) / frequency.reshape(-1, 1)
+
+    timestamps_ms = np.round(sample_time_s[in_block] * 1000).astype(np.int64)
+    return timestamps_ms, acc[:, in_block]
+
+
+def _sample_counts(blocks):
+    """
+    :return: number of samples in every block, bounded by the capacity of the block's sample format
+    """
+    bytes_per_sample = blocks["num_axes_bps"].astype(np.int64) & 0x0F
+    capacity = np.where(bytes_per_sample == 0, 480 // 4, 480 // np.maximum(bytes_per_sample * 3, 1))
+    return np.minimum(blocks["sample_count"].astype(np.int64), capacity)
+
+
+def _block_times(blocks, frequency):
+    """
+    :return: POSIX time (in seconds) of the sample at timestamp_offset for every block and the timestamp offsets
+    """
+    packed = blocks["timestamp"].astype(np.int64)
+    year = ((packed >> 26) & 0x3F) + 2000
+    month = (packed >> 22) & 0x0F
+    day = (packed >> 17) & 0x1F
+    seconds_of_day = ((packed >> 12) & 0x1F) * 3600 + ((packed >> 6) & 0x3F) * 60 + (packed & 0x3F)
+
+    date = (year - 1970).astype("datetime64[Y]") + (month - 1).astype("timedelta64[M]")
+    date = date.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+    block_time_s = date.astype(np.int64) * 86400 + seconds_of_day
+
+    # newer firmware stores a fractional part (1/32768 s) and shifts timestamp_offset for backwards compatibility
+    timestamp_offset = blocks["timestamp_offset"].astype(np.int64)
+    has_fraction = (blocks["device_fractional"] & 0x8000) != 0
+    fraction = ((blocks["device_fractional"].astype(np.int64) & 0x7FFF) << 1) * has_fraction
+    timestamp_offset += (fraction * frequency.astype(np.int64)) >> 16
+
+    return block_time_s + fraction / 65536.0, timestamp_offset
@@ -1,8 +1,154 @@
 """
 Extract daily aggregations from axivity epochs DataFrame.
+
+DailyFeatureEngine computes all daily features (and user-registered ones) from a single day index at once, the
+individual functions below compute one feature each.
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+def day_index(index: pd.DatetimeIndex, tz=None, day_start_hour=0) -> pd.DatetimeIndex:
+    """
+    Assigns every timestamp to the day it belongs to.
+    :param index: DatetimeIndex of the epochs (naive timestamps are interpreted as UTC if a time zone is given)
+    :param tz: time zone the day boundaries refer to, if None the timestamps are used as they are
+    :param day_start_hour: hour at which a day starts (e.g. 12 for noon-to-noon windows)
+    :return: day labels (naive, local midnight of the date the day window starts on)
+    """
+    if tz is not None:
+        index = (index.tz_localize("UTC") if index.tz is None else index).tz_convert(tz).tz_localize(None)
+    elif index.tz is not None:
+        index = index.tz_localize(None)
+    return (index - pd.Timedelta(hours=day_start_hour)).floor("D")
+
+
+DailyFeature = namedtuple("DailyFeature", ["name", "values", "aggregation", "positive_only", "columns"],
+                          defaults=(None,))
+DailyFeature.__doc__ = """
+name: name of the daily feature
+values: epoch column name or function(acc_epoch_df) -> pd.Series with the epoch values to aggregate
+aggregation: name of a pandas groupby reduction (e.g. "mean", "sum", "count") or a float for a quantile
+positive_only: whether days with a non-positive result are set to NaN
+columns: epoch columns the values function requires, the feature is skipped if any is missing (a column name as values
+requires just that column)
 """
 
 
+def _required_columns(feature):
+    if isinstance(feature.values, str):
+        return (feature.values,)
+    return () if feature.columns is None else tuple(feature.columns)
+
+
+def _std_sum(acc_epoch_df):
+    return acc_epoch_df.x_std + acc_epoch_df.y_std + acc_epoch_df.z_std
+
+
+def _enmo_fraction(lower, upper):
+    def fraction(acc_epoch_df):
+        enmo = acc_epoch_df.mean_enmo
+        return ((enmo >= lower) & (enmo < upper)).astype(np.float64).where(enmo.notna())
+    return fraction
+
+
+DEFAULT_DAILY_FEATURES = (
+    DailyFeature("mean_daily_enmo", "mean_enmo", "mean", False),
+    DailyFeature("sum_daily_enmo", "mean_enmo", "sum", True),
+    DailyFeature("mean_daily_std_sum", _std_sum, "mean", False, ("x_std", "y_std", "z_std")),
+    DailyFeature("mean_daily_signal_energy", "total_energy", "mean", False),
+    DailyFeature("sum_daily_signal_energy", "total_energy", "sum", True),
+    DailyFeature("mean_daily_velocity", "mean_velocity", "mean", False),
+    DailyFeature("total_daily_distance", "approximate_distance", "sum", True),
+    DailyFeature("relative_daily_sedentary", _enmo_fraction(-np.inf, 0.03), "mean", False, ("mean_enmo",)),
+    DailyFeature("relative_daily_lpa", _enmo_fraction(0.03, 0.1), "mean", False, ("mean_enmo",)),
+    DailyFeature("relative_daily_mvpa", _enmo_fraction(0.1, np.inf), "mean", False, ("mean_enmo",)),
+    DailyFeature("mean_daily_spectral_entropy", "spectral_entropy", "mean", False),
+    DailyFeature("enmo_25_quantile", "mean_enmo", 0.25, False),
+    DailyFeature("enmo_50_quantile", "mean_enmo", 0.5, False),
+    DailyFeature("enmo_75_quantile", "mean_enmo", 0.75, False),
+)
+
+
+class DailyFeatureEngine(object):
+
+    def __init__(self, tz=None, day_start_hour=0, features=DEFAULT_DAILY_FEATURES):
+        """
+        Computes all daily features with one grouping of the epoch DataFrame by day and a single vectorized reduction
+        per aggregation type. Features whose (declared) epoch columns are missing are skipped.
+        :param tz: time zone the day boundaries refer to (see day_index)
+        :param day_start_hour: hour at which a day starts (e.g. 12 for noon-to-noon windows)
+        :param features: sequence of DailyFeature
+        """
+        self._tz = tz
+        self._day_start_hour = day_start_hour
+        self._features = OrderedDict((f.name, f) for f in features)
+
+    @property
+    def features(self):
+        return list(self._features.values())
+
+    def register(self, name, values, aggregation="mean", positive_only=False, columns=None):
+        """
+        Adds a user-defined daily feature (replaces an existing feature with the same name).
+        :param name: name of the daily feature
+        :param values: epoch column name or function(acc_epoch_df) -> pd.Series with the epoch values to aggregate
+        :param aggregation: name of a pandas groupby reduction (e.g. "mean", "sum", "count") or a float for a quantile
+        :param positive_only: whether days with a non-positive result are set to NaN
+        :param columns: epoch columns required by a values function, the feature is skipped if any is missing (errors
+        raised by the function itself are not caught)
+        :return: self
+        """
+        self._features[name] = DailyFeature(name, values, aggregation, positive_only, columns)
+        return self
+
+    def day_index(self, acc_epoch_df):
+        return day_index(acc_epoch_df.index, self._tz, self._day_start_hour)
+
+    def process(self, acc_epoch_df):
+        """
+        :param acc_epoch_df: datetime indexed epoch DataFrame
+        :return: DataFrame with one row per day (including days without epochs) and one column per daily feature
+        """
+        assert isinstance(acc_epoch_df.index, pd.DatetimeIndex), "Epoch DataFrame must have a DateTimeIndex"
+        days = self.day_index(acc_epoch_df)
+
+        values = OrderedDict()
+        for f in self._features.values():
+            if any(c not in acc_epoch_df.columns for c in _required_columns(f)):
+                continue
+            values[f.name] = acc_epoch_df[f.values] if isinstance(f.values, str) else f.values(acc_epoch_df)
+        values = pd.DataFrame(values, index=acc_epoch_df.index)
+        grouped = values.groupby(days.to_numpy(), sort=True)
+
+        aggregations = OrderedDict()
+        for name in values.columns:
+            aggregations.setdefault(self._features[name].aggregation, []).append(name)
+        r = []
+        for aggregation, columns in aggregations.items():
+            if isinstance(aggregation, float):
+                r.append(grouped[columns].quantile(aggregation))
+            else:
+                r.append(grouped[columns].agg(aggregation))
+        r = pd.concat(r, axis=1)[values.columns] if r else pd.DataFrame(index=pd.DatetimeIndex([]))
+
+        if len(r) > 0:
+            r = r.reindex(pd.date_range(r.index.min(), r.index.max(), freq="D"))
+        for name in values.columns:
+            if self._features[name].positive_only:
+                r[name] = r[name].where(r[name] > 0)
+        return r
+
+
+def daily_features(acc_epoch_df, tz=None, day_start_hour=0):
+    """
+    :return: DataFrame with all default daily features (one row per day)
+    """
+    return DailyFeatureEngine(tz, day_start_hour).process(acc_epoch_df)
+
+
 def mean_daily_enmo(acc_epoch_df):
     s = acc_epoch_df.mean_enmo.resample("d").mean()
     s.name = "mean_daily_enmo"
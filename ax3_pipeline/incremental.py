@@ -0,0 +1,113 @@
+"""
+Incremental processing of recordings that grow over time (e.g. remote monitoring with daily uploads).
+
+After every run a checkpoint is written that holds the raw samples still needed by the next run: the context the
+zero-phase filters need in front of the first new epoch (their transient length, see ChunkedComposition) and all samples
+of epochs that could not be finalized yet because the filters lacked samples behind them. A later run only processes
+the newly appended samples plus this bounded context and emits the new epochs together with the daily features of
+all affected days. The results match a full recompute within the filter tolerance of the ChunkedComposition (the
+relative magnitude of the truncated filter transients, 1e-6 by default).
+
+NOTE: a zero-phase (forward-backward) filter depends on future samples, persisting the forward filter state alone can
+not reproduce it, which is why the checkpoint stores the raw context instead. As in chunked execution, all processors
+following the EpochGenerator must work epoch-wise and post-processors that need the whole recording (e.g.
+NonWeartimeCalculator) have to be applied to the accumulated epochs.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .daily_features import DailyFeatureEngine
+
+_STATE_FILE = "state.json"
+_TAIL_FILE = "tail.npz"
+_EPOCHS_FILE = "epochs.pkl"
+
+
+class IncrementalPipeline(object):
+
+    def __init__(self, pipeline_factory, checkpoint_dir, daily_feature_engine=None):
+        """
+        :param pipeline_factory: function taking the timestamps of the samples to process and returning a
+        ChunkedComposition whose FeatureConcat was constructed with the EpochGenerator (see ChunkedComposition)
+        :param checkpoint_dir: directory of the participant's checkpoint (created if it does not exist)
+        :param daily_feature_engine: DailyFeatureEngine used for the daily features (defaults to all default features)
+        """
+        self._pipeline_factory = pipeline_factory
+        self._checkpoint_dir = checkpoint_dir
+        self._daily_feature_engine = DailyFeatureEngine() if daily_feature_engine is None else daily_feature_engine
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _load_state(self):
+        path = os.path.join(self._checkpoint_dir, _STATE_FILE)
+        if not os.path.exists(path):
+            return {"offset": 0, "emitted_until": 0}, [np.empty(0, dtype=np.int64)] + [np.empty(0)] * 3, None
+        with open(path) as f:
+            state = json.load(f)
+        with np.load(os.path.join(self._checkpoint_dir, _TAIL_FILE)) as tail:
+            arrays = [tail["timestamps_ms"], tail["x"], tail["y"], tail["z"]]
+        with open(os.path.join(self._checkpoint_dir, _EPOCHS_FILE), "rb") as f:
+            epochs = pickle.load(f)
+        return state, arrays, epochs
+
+    def _save_state(self, state, arrays, epochs):
+        # the state file is written last, an interrupted checkpoint therefore leaves the previous state file in place
+        np.savez(os.path.join(self._checkpoint_dir, _TAIL_FILE),
+                 timestamps_ms=arrays[0], x=arrays[1], y=arrays[2], z=arrays[3])
+        with open(os.path.join(self._checkpoint_dir, _EPOCHS_FILE), "wb") as f:
+            pickle.dump(epochs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path = os.path.join(self._checkpoint_dir, _STATE_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, os.path.join(self._checkpoint_dir, _STATE_FILE))
+
+    def process(self, timestamps_ms, x, y, z, final=False):
+        """
+        :param timestamps_ms: timestamps of the samples appended since the last run
+        :param x: appended x samples
+        :param y: appended y samples
+        :param z: appended z samples
+        :param final: whether the recording ended, all remaining epochs are then emitted
+        :return: DataFrame with the new epochs and DataFrame with the daily features of all days with new epochs
+        """
+        state, tail, epochs = self._load_state()
+        arrays = [np.concatenate([t, np.asarray(a)]) for t, a in zip(tail, (timestamps_ms, x, y, z))]
+        offset, emitted_until = state["offset"], state["emitted_until"]
+        global_end = offset + len(arrays[0])
+
+        pipeline = self._pipeline_factory(arrays[0])
+        hop, padding = pipeline.n_samples_per_hop, pipeline.padding_samples
+        n_samples_per_epoch = max(p.n_samples_per_epoch for p in pipeline.iter_processors()
+                                  if hasattr(p, "n_samples_per_epoch"))
+        context = -(-padding // hop) * hop
+
+        # epochs are final once the filters have seen enough samples behind them
+        last_sample = global_end - (0 if final else padding) - n_samples_per_epoch
+        finalized_until = max(emitted_until, (last_sample // hop + 1) * hop if last_sample >= 0 else 0)
+
+        new_epochs = None
+        if finalized_until > emitted_until:
+            df = pipeline.process(*arrays[1:])[0]
+            first = pd.to_datetime(arrays[0][emitted_until - offset], unit="ms")
+            last = pd.to_datetime(arrays[0][finalized_until - offset], unit="ms") \
+                if finalized_until - offset < len(arrays[0]) else None
+            new_epochs = df[(df.index >= first) & ((df.index < last) if last is not None else True)]
+
+        if new_epochs is None or new_epochs.empty:
+            daily = pd.DataFrame()
+            new_epochs = pd.DataFrame() if new_epochs is None else new_epochs
+        else:
+            epochs = new_epochs if epochs is None else pd.concat([epochs, new_epochs])
+            days = self._daily_feature_engine.day_index(epochs)
+            affected = days >= self._daily_feature_engine.day_index(new_epochs).min()
+            daily = self._daily_feature_engine.process(epochs[affected])
+            # only the epochs of the last day can contribute to days affected by later runs
+            epochs = epochs[days >= days.max()]
+
+        new_offset = max(finalized_until - context, offset)
+        tail = [a[new_offset - offset:] for a in arrays]
+        self._save_state({"offset": int(new_offset), "emitted_until": int(finalized_until)}, tail, epochs)
+        return new_epochs, daily
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from .features import FeatureExtractor
+from .signals import is_signal
+
+_PARTIALS = ("count", "sum", "sum_of_squares", "min", "max")
+_QUANTILES = (("median", 0.5), ("q_5", 0.05), ("q_95", 0.95))
+
+
+class EpochAggregates(FeatureExtractor):
+
+    def __init__(self, suffix="", n_bins=None, value_range=(-8., 8.), name=None):
+        """
+        Mergeable partial aggregates of every (base) epoch: sample count, sum, sum of squares, min, max and optionally
+        a fixed-bin histogram as quantile sketch. Coarser resolutions are derived from the aggregates with merge (no
+        second pass over the samples) and the features with summary_statistics:
+
+            aggregates = EpochAggregates(suffix="_enmo", n_bins=200, value_range=(0., 2.))
+            df = pipeline.process(x, y, z)[0]                      # 5s aggregates, e.g. behind EuclideanNormMinusOne
+            minutes = aggregates.merge(df, "60s")                  # hierarchical, e.g. merge(minutes, "1h")
+            features = aggregates.summary_statistics(minutes)      # mean_enmo, std_enmo, ..., q_95_enmo
+
+        The sums are accumulated in float64 independent of the precision policy. Mean, std, min, max and the energy (sum
+        of squares, equal to the TotalEnergy of the samples by Parseval's theorem) are exact up to floating point
+        rounding at every resolution. Quantiles (median, q_5, q_95) are estimated from the histogram, for samples inside
+        value_range they deviate by at most half a bin width, (value_range[1] - value_range[0]) / (2 * n_bins), from
+        np.quantile of the samples; samples outside are counted in the first or last bin (the estimates are clipped to
+        the exact min and max).
+        :param suffix: appended to the column names, e.g. '_enmo' (axis prefixes are prepended as by the other feature
+        extractors)
+        :param n_bins: number of histogram bins, None disables the quantile sketch
+        :param value_range: (lower, upper) range of the histogram in g
+        :param name:
+        """
+        if n_bins is not None and n_bins < 1:
+            raise ValueError("n_bins must be positive, got: %d" % n_bins)
+        if value_range[1] <= value_range[0]:
+            raise ValueError("value_range must be increasing, got: %s" % (value_range,))
+        partials = [p + suffix for p in _PARTIALS]
+        bins = [] if n_bins is None else ["bin_%d%s" % (i, suffix) for i in range(n_bins)]
+        super().__init__(feature_names=tuple(partials + bins), name=name)
+        self._suffix = suffix
+        self._n_bins = n_bins
+        self._value_range = tuple(value_range)
+
+    @property
+    def bin_width(self):
+        if self._n_bins is None:
+            return None
+        return (self._value_range[1] - self._value_range[0]) / self._n_bins
+
+    def process(self, *data):
+        """
+        :param data: epoched arrays (n_epochs, n_samples_per_epoch) of each axis or an epoched Signal
+        :return: single DataFrame with the partial aggregates of every axis
+        """
+        values, axis = self._per_axis(data, self._aggregate)
+        if is_signal(data):
+            # the stacked results hold the axes in the first dimension
+            values = [[v[i] for v in values] for i in range(len(axis))]
+        frames = []
+        for i, partials in enumerate(values):
+            frames.append(pd.DataFrame(dict(zip([axis[i] + f for f in self._feature_names[:len(_PARTIALS)]],
+                                                partials[:len(_PARTIALS)]))))
+            if self._n_bins is not None:
+                frames.append(pd.DataFrame(partials[-1], columns=[axis[i] + f for f in
+                                                                   self._feature_names[len(_PARTIALS):]]))
+        return (pd.concat(frames, axis=1),)
+
+    def _aggregate(self, d):
+        """
+        :param d: epochs in the last two dimensions
+        :return: count, sum, sum of squares, min, max (and histogram counts) of every epoch
+        """
+        n = d.shape[-1]
+        r = [np.full(d.shape[:-1], n, dtype=np.int64),
+             np.add.reduce(d, axis=-1, dtype=np.float64),
+             np.einsum("...j,...j->...", d, d, dtype=np.float64),
+             np.min(d, axis=-1),
+             np.max(d, axis=-1)]
+        if self._n_bins is not None:
+            lower = self._value_range[0]
+            bins = np.floor((d - lower) * (1 / self.bin_width)).astype(np.int64)
+            np.clip(bins, 0, self._n_bins - 1, out=bins)
+            # one bincount over all epochs, each epoch has its own range of bins
+            bins += np.arange(int(np.prod(d.shape[:-1])), dtype=np.int64).reshape(d.shape[:-1] + (1,)) * self._n_bins
+            counts = np.bincount(bins.ravel(), minlength=bins.size // n * self._n_bins)
+            r.append(counts.astype(np.int32).reshape(d.shape[:-1] + (self._n_bins,)))
+        return r
+
+    def _prefixes(self, df):
+        count = "count" + self._suffix
+        return [c[:-len(count)] for c in df.columns if c.endswith(count)]
+
+    def merge(self, df, resolution):
+        """
+        Combines the aggregates of all epochs starting in the same interval of the given resolution (aligned to the
+        clock, epochs that were removed, e.g. bad epochs, are simply missing in the counts).
+        :param df: datetime indexed (sorted) DataFrame with the aggregates of this block (at any resolution)
+        :param resolution: pandas frequency, e.g. '30s', '60s' or '1h'
+        :return: DataFrame with the merged aggregates indexed by the interval starts
+        """
+        assert isinstance(df.index, pd.DatetimeIndex), "Expected datetime indexed DataFrame"
+        if len(df) == 0:
+            return df.copy()
+        interval = df.index.floor(resolution)
+        starts = np.flatnonzero(np.concatenate([[True], interval[1:] != interval[:-1]]))
+
+        minima = {prefix + "min" + self._suffix for prefix in self._prefixes(df)}
+        maxima = {prefix + "max" + self._suffix for prefix in self._prefixes(df)}
+        merged = {}
+        for column in df.columns:
+            v = df[column].to_numpy()
+            if column in minima:
+                merged[column] = np.minimum.reduceat(v, starts)
+            elif column in maxima:
+                merged[column] = np.maximum.reduceat(v, starts)
+            else:
+                # counts, sums and histogram counts
+                merged[column] = np.add.reduceat(v, starts)
+        return pd.DataFrame(merged, index=interval[starts], columns=df.columns)
+
+    def summary_statistics(self, df):
+        """
+        :param df: DataFrame with the aggregates of this block (at any resolution)
+        :return: DataFrame with mean, median, std, min, max, q_5, q_95 and energy of every axis (named as by
+        TimeDomainSummaryStatistics, the quantiles are only estimated with a histogram, see EpochAggregates)
+        """
+        features = {}
+        for prefix in self._prefixes(df):
+            def column(partial):
+                return df[prefix + partial + self._suffix].to_numpy()
+
+            count = column("count")
+            mean = column("sum") / count
+            std = np.sqrt(np.maximum(column("sum_of_squares") / count - mean * mean, 0))
+            quantiles = {}
+            if self._n_bins is not None:
+                histogram = df[[prefix + f for f in self._feature_names[len(_PARTIALS):]]].to_numpy()
+                quantiles = self._quantiles(histogram, count, column("min"), column("max"))
+            for feature, value in (("mean", mean), ("median", quantiles.get("median")), ("std", std),
+                                   ("min", column("min")), ("max", column("max")), ("q_5", quantiles.get("q_5")),
+                                   ("q_95", quantiles.get("q_95")), ("energy", column("sum_of_squares"))):
+                if value is not None:
+                    features[prefix + feature + self._suffix] = self._as_feature(value)
+        return pd.DataFrame(features, index=df.index)
+
+    def _quantiles(self, histogram, count, minimum, maximum):
+        """
+        Linear interpolation between the estimated order statistics (as np.quantile), every order statistic is
+        estimated by the center of its bin (clipped to the exact min and max).
+        """
+        cumulative = np.cumsum(histogram, axis=1)
+        width = self.bin_width
+
+        def order_statistic(k):
+            # bin containing the k-th (0-based) smallest sample
+            b = np.count_nonzero(cumulative <= k[:, np.newaxis], axis=1)
+            return np.clip(self._value_range[0] + (b + 0.5) * width, minimum, maximum)
+
+        r = {}
+        for feature, q in _QUANTILES:
+            position = q * (count - 1)
+            lower = np.floor(position).astype(np.int64)
+            a = order_statistic(lower)
+            b = order_statistic(np.minimum(lower + 1, count - 1))
+            r[feature] = a + (b - a) * (position - lower)
+        return r
@@ -1,8 +1,31 @@
 import abc
+import contextlib
+import functools
+import hashlib
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+
+Chunk = namedtuple("Chunk", ["start", "stop", "padding_before", "padding_after"])
+Chunk.__doc__ = """
+Sample window processed by a ChunkedComposition. start and stop (exclusive) are the sample indices of the chunk within the
+full recording, the data handed to the processors additionally contains padding_before samples in front and
+padding_after samples behind the chunk.
+"""
 
 
 class DataProcessor(abc.ABC):
 
+    def __init_subclass__(cls, **kwargs):
+        # every implementation of process is wrapped by dataprocessor_hook, so callbacks and profiling apply to all blocks
+        super().__init_subclass__(**kwargs)
+        process = cls.__dict__.get("process")
+        if process is not None and not getattr(process, "__isabstractmethod__", False) \
+                and not getattr(process, "_is_hooked", False):
+            cls.process = dataprocessor_hook(process)
+
     def __init__(self, name=None):
         self._callbacks = []
         self._callback_arguments = []
@@ -15,6 +38,27 @@ class DataProcessor(abc.ABC):
     def name(self):
         return self.__class__.__name__ if self._name is None else self._name
 
+    @property
+    def signature(self):
+        """
+        Hashable description of the processor class and its parameters. Processors with equal signatures are expected to
+        produce the same output for the same input, which allows ProcessingGraph to compute them only once.
+        """
+        if self._callbacks:
+            # callbacks are side effects that must not be merged with other instances
+            return self.__class__, _Identity(id(self))
+        state = {k: v for k, v in vars(self).items() if k not in _NON_PARAMETER_ATTRIBUTES}
+        return (self.__class__, _freeze(state))
+
+    @property
+    def cacheable(self):
+        """
+        Whether the signature identifies the output beyond the running process (required by caching.CachedProcessor).
+        Processors with callbacks or parameters without value representation are identified by the object identity,
+        which is reused by other objects in other processes.
+        """
+        return not _contains_identity(self.signature)
+
     def add_callback(self, callback_function, arguments=()):
         if not isinstance(arguments, tuple):
             raise ValueError(
@@ -24,21 +68,202 @@ class DataProcessor(abc.ABC):
         self._callback_arguments.append(arguments)
         return self
 
+    def begin_chunk(self, chunk):
+        """
+        Called by a ChunkedComposition before the data of a chunk is processed. Processors whose output depends on the
+        position within the full recording (e.g. EpochGenerator) override this, it is a no-op by default.
+        :param chunk: Chunk describing the currently processed sample window
+        """
+        pass
+
+    def end_chunks(self):
+        """
+        Called by a ChunkedComposition once all chunks were processed (or processing was aborted).
+        """
+        pass
+
+    def project(self, columns):
+        """
+        Projection pushdown (see DataProcessorComposition.select_features): returns a processor computing at least the
+        requested output feature columns or None if this processor does not contribute to any of them. Processors
+        that are no feature extractors are needed whenever their consumers are, so they return themselves by default.
+        :param columns: set of requested output column names
+        """
+        return self
+
+    def required_columns(self, columns):
+        """
+        :param columns: set of output column names requested from this processor
+        :return: set of column names this processor needs in its input (e.g. the std columns for non-wear detection)
+        """
+        return columns
+
     @abc.abstractmethod
     def process(self, *data):
         raise NotImplementedError
 
 
+# attributes that do not influence the output (including results of the last call, e.g. of AutoCalibration)
+_NON_PARAMETER_ATTRIBUTES = {"_callbacks", "_callback_arguments", "_name", "_executor", "_result", "_memory_report",
+                             "_record_memory"}
+
+
+def map_with_executor(executor, function, items):
+    """
+    Applies function to all items, concurrently if an executor (e.g. a ThreadPoolExecutor) is provided. Results are
+    returned in the order of the items. Tasks that have not been started by the time their result is needed are run
+    in the calling thread, so nested calls sharing the same (bounded) pool cannot deadlock.
+    :param executor: concurrent.futures.Executor or None for sequential execution
+    :param function: function taking a single item
+    :param items: sequence of items
+    :return: list of results
+    """
+    items = list(items)
+    if executor is None or len(items) < 2:
+        return [function(item) for item in items]
+
+    if _active_profiler is not None:
+        # calls made on the executor threads are recorded below the calling processor
+        function = _active_profiler.bind(function)
+    futures = [executor.submit(function, item) for item in items[1:]]
+    results = [function(items[0])]
+    for future, item in zip(futures, items[1:]):
+        results.append(function(item) if future.cancel() else future.result())
+    return results
+
+
+class _Identity(int):
+    """
+    Object identity (id) as part of a signature, only meaningful within the running process.
+    """
+    pass
+
+
+def _contains_identity(signature):
+    if isinstance(signature, _Identity):
+        return True
+    return isinstance(signature, tuple) and any(_contains_identity(v) for v in signature)
+
+
+def _freeze(value):
+    """
+    Converts (nested) parameter values into a hashable representation, unknown objects are represented by identity.
+    """
+    if isinstance(value, DataProcessor):
+        return value.signature
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, np.ndarray):
+        # digest instead of hash() so signatures are stable across processes (see caching.DiskCache)
+        return value.dtype.str, value.shape, hashlib.blake2b(np.ascontiguousarray(value).data).hexdigest()
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return _Identity(id(value))
+
+
+Precision = namedtuple("Precision", ["compute", "signal", "feature", "flag"])
+Precision.__doc__ = """
+Pipeline-wide precision policy, captured by the blocks when they are constructed (see precision_policy).
+compute: working precision of the filters
+signal: dtype of the filtered signals, all derived intermediates (epochs, magnitudes, spectra) keep it
+feature: dtype of floating point features, None keeps the dtype of the intermediate they are computed from
+flag: dtype of indicator features (ActivityClasses)
+"""
+
+# float64 filtering with float32 signals, the behaviour of the blocks without a policy
+DEFAULT_PRECISION = Precision(np.dtype(np.float64), np.dtype(np.float32), None, np.dtype(np.int32))
+# float32 end to end, halves memory footprint and bandwidth of the filters compared to DEFAULT_PRECISION
+SINGLE_PRECISION = Precision(np.dtype(np.float32), np.dtype(np.float32), np.dtype(np.float32), np.dtype(np.int8))
+DOUBLE_PRECISION = Precision(np.dtype(np.float64), np.dtype(np.float64), np.dtype(np.float64), np.dtype(np.int8))
+
+_active_precision = DEFAULT_PRECISION
+
+
+def set_precision(precision):
+    """
+    Activates a precision policy for all blocks constructed afterwards.
+    :param precision: Precision (e.g. SINGLE_PRECISION), None restores DEFAULT_PRECISION
+    :return: the previously active policy
+    """
+    global _active_precision
+    previous = _active_precision
+    _active_precision = DEFAULT_PRECISION if precision is None else Precision(*[
+        None if t is None else np.dtype(t) for t in precision])
+    return previous
+
+
+def get_precision():
+    return _active_precision
+
+
+@contextlib.contextmanager
+def precision_policy(precision):
+    """
+    Blocks constructed inside the with block use the given precision policy:
+
+        with precision_policy(SINGLE_PRECISION):
+            pipeline = build_pipeline(timestamps_ms)
+    """
+    previous = set_precision(precision)
+    try:
+        yield get_precision()
+    finally:
+        set_precision(previous)
+
+
+_hook_state = threading.local()
+_active_profiler = None
+
+
+def set_profiler(profiler):
+    """
+    Activates a profiler (see profiling.Profiler) for all DataProcessors, None disables profiling.
+    """
+    global _active_profiler
+    _active_profiler = profiler
+
+
 def dataprocessor_hook(f):
-        def wrapper(self, *args):
-            assert isinstance(self, DataProcessor), "Behavior is not defined for instances that are not of type " \
-                                                    "DataProcessor"
-            r = f(self, *args)
-            for cb_func, cb_args in zip(self._callbacks, self._callback_arguments):
-                if len(cb_args) == 0:
-                    cb_func(r)
-                elif len(cb_args) == 1:
-                    cb_func(r, cb_args[0])
-                else:
-                    cb_func(r, *cb_args)
-        return wrapper
+    """
+    Wraps the process method of a DataProcessor: records the call with the active profiler (if any), calls the
+    registered callbacks with the result and returns the result. Calls of overridden process methods via super() are
+    passed through, so callbacks and profiling apply once per processor call.
+    """
+    @functools.wraps(f)
+    def wrapper(self, *args):
+        assert isinstance(self, DataProcessor), "Behavior is not defined for instances that are not of type " \
+                                                "DataProcessor"
+        active = getattr(_hook_state, "active", None)
+        if active is None:
+            active = _hook_state.active = set()
+        if id(self) in active:
+            return f(self, *args)
+
+        active.add(id(self))
+        try:
+            profiler = _active_profiler
+            if profiler is None:
+                r = f(self, *args)
+            else:
+                record, r = profiler.start(self, args), None
+                try:
+                    r = f(self, *args)
+                finally:
+                    profiler.stop(record, r)
+        finally:
+            active.discard(id(self))
+
+        for cb_func, cb_args in zip(self._callbacks, self._callback_arguments):
+            if len(cb_args) == 0:
+                cb_func(r)
+            elif len(cb_args) == 1:
+                cb_func(r, cb_args[0])
+            else:
+                cb_func(r, *cb_args)
+        return r
+    wrapper._is_hooked = True
+    return wrapper
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .base import *
+from .compositions import DataProcessorComposition
+from .misc import OneSidedPowerSpectrum
+from .signals import Signal
+
+
+class DiskCache(object):
+    """
+    Content-addressed on-disk store for processor outputs. Arrays (also the data of signals and power spectra, whose
+    remaining attributes are kept in the entry metadata) are stored as .npy files and loaded memory-mapped, the
+    least recently used entries are evicted once the size budget is exceeded. Several processes may share a directory.
+    """
+
+    def __init__(self, directory, max_bytes=10 * 1024 ** 3):
+        """
+        :param directory: cache directory (created if it does not exist)
+        :param max_bytes: size budget of the cache directory in bytes
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _entries(self):
+        """
+        :return: list of (last access time, size in bytes, path) of all cache entries
+        """
+        entries = []
+        for key in os.listdir(self._directory):
+            path = os.path.join(self._directory, key)
+            meta = os.path.join(path, "meta.json")
+            if key.startswith(".") or not os.path.exists(meta):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(meta), size, path))
+        return entries
+
+    @property
+    def size_bytes(self):
+        return sum(e[1] for e in self._entries())
+
+    def get(self, key):
+        """
+        :param key: entry key (see CachedProcessor)
+        :return: the stored outputs (arrays memory-mapped) or None if the key is not cached
+        """
+        path = os.path.join(self._directory, key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                items = json.load(f)
+            r = tuple(_load_item(path, item) for item in items)
+            os.utime(os.path.join(path, "meta.json"))
+        except (OSError, ValueError):
+            # missing or concurrently evicted entry
+            return None
+        return r
+
+    def put(self, key, outputs):
+        """
+        Stores the outputs under the key and evicts the least recently used entries if the size budget is exceeded.
+        :param key: entry key
+        :param outputs: tuple of processor outputs
+        """
+        path = os.path.join(self._directory, key)
+        if os.path.exists(path):
+            return
+        tmp_path = os.path.join(self._directory, ".%s.%s" % (key, uuid.uuid4().hex))
+        os.makedirs(tmp_path)
+        try:
+            items = [_store_item(tmp_path, i, d) for i, d in enumerate(outputs)]
+            with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+                json.dump(items, f)
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process stored the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class CachedProcessor(DataProcessorComposition):
+
+    def __init__(self, processor, cache, name=None):
+        """
+        Opt-in caching of the outputs of a processor (e.g. a filter or a whole sub-pipeline). Outputs are keyed by the
+        processor class and parameters (see DataProcessor.signature) and a digest of the input data, so re-running a
+        pipeline only recomputes the changed stages and everything downstream of them.
+        :param processor: the processor whose outputs are cached, it (and all nested processors) must be cacheable
+        (see DataProcessor.cacheable), i.e. without callbacks
+        :param cache: DiskCache
+        :param name:
+        """
+        super().__init__(processor, name=name)
+        self._cache = cache
+        _check_cacheable(processor)
+
+    @property
+    def processor(self):
+        return self._processors[0]
+
+    @property
+    def signature(self):
+        return self.__class__, self.processor.signature
+
+    def project(self, columns):
+        processor = self.processor.project(columns)
+        return None if processor is None else self._with_processors([processor])
+
+    def required_columns(self, columns):
+        return self.processor.required_columns(columns)
+
+    def key(self, *data):
+        """
+        :return: cache key of the processor applied to the data
+        """
+        # callbacks may have been added after construction
+        _check_cacheable(self.processor)
+        h = hashlib.blake2b(repr(self.processor.signature).encode(), digest_size=20)
+        for d in data:
+            _update_digest(h, d)
+        return h.hexdigest()
+
+    def process(self, *data):
+        key = self.key(*data)
+        r = self._cache.get(key)
+        if r is None:
+            r = tuple(self.processor.process(*data))
+            self._cache.put(key, r)
+        return r
+
+
+def _check_cacheable(processor):
+    if not processor.cacheable:
+        raise ValueError("%s cannot be cached persistently, its signature depends on object identities (processors "
+                         "with callbacks or parameters without value representation)" % processor.name)
+
+
+def _update_digest(h, d):
+    if isinstance(d, Signal):
+        h.update(("signal%r,%r,%r" % (d.sampling_frequency, d.start_time_ms, d.axes)).encode())
+        _update_digest(h, d.data)
+    elif isinstance(d, OneSidedPowerSpectrum):
+        h.update(b"spectrum%d" % d.n_samples)
+        _update_digest(h, d.power)
+    elif isinstance(d, np.ndarray):
+        h.update(("%s%s" % (d.dtype.str, d.shape)).encode())
+        h.update(np.ascontiguousarray(d).data)
+    elif isinstance(d, pd.Series):
+        h.update(("series%r" % (d.name,)).encode())
+        _update_digest(h, d.to_numpy())
+        _update_index_digest(h, d.index)
+    elif isinstance(d, pd.DataFrame):
+        h.update(("frame%r" % (list(d.columns),)).encode())
+        for c in range(d.shape[1]):
+            _update_digest(h, d.iloc[:, c].to_numpy())
+        _update_index_digest(h, d.index)
+    else:
+        h.update(pickle.dumps(d))
+
+
+def _update_index_digest(h, index):
+    if isinstance(index, pd.RangeIndex):
+        h.update(("range%d,%d,%d" % (index.start, index.stop, index.step)).encode())
+    else:
+        _update_digest(h, np.asarray(index))
+
+
+def _store_item(path, i, d):
+    if isinstance(d, Signal) and isinstance(d.data, (np.ndarray, OneSidedPowerSpectrum)):
+        item = _store_item(path, i, d.data)
+        item.update(kind="signal", data_kind=item["kind"], sampling_frequency=_json_value(d.sampling_frequency),
+                    start_time_ms=_json_value(d.start_time_ms), axes=list(d.axes))
+        return item
+    if isinstance(d, OneSidedPowerSpectrum):
+        np.save(os.path.join(path, "%d.npy" % i), d.power)
+        return {"kind": "power_spectrum", "file": "%d.npy" % i, "n_samples": int(d.n_samples)}
+    if isinstance(d, np.ndarray) and d.dtype != object:
+        np.save(os.path.join(path, "%d.npy" % i), d)
+        return {"kind": "ndarray", "file": "%d.npy" % i}
+    if isinstance(d, pd.Series) and isinstance(d.index, pd.RangeIndex) and d.index.start == 0 and d.index.step == 1 \
+            and (d.name is None or isinstance(d.name, str)):
+        np.save(os.path.join(path, "%d.npy" % i), d.to_numpy())
+        return {"kind": "series", "file": "%d.npy" % i, "name": d.name}
+    with open(os.path.join(path, "%d.pkl" % i), "wb") as f:
+        pickle.dump(d, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"kind": "pickle", "file": "%d.pkl" % i}
+
+
+def _json_value(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _load_item(path, item):
+    file_path = os.path.join(path, item["file"])
+    if item["kind"] == "pickle":
+        with open(file_path, "rb") as f:
+            return pickle.load(f)
+    if item["kind"] == "signal":
+        data = _load_item(path, dict(item, kind=item["data_kind"]))
+        return Signal(data, item["sampling_frequency"], item["start_time_ms"], item["axes"])
+    a = np.load(file_path, mmap_mode="r")
+    if item["kind"] == "power_spectrum":
+        return OneSidedPowerSpectrum(a, item["n_samples"])
+    if item["kind"] == "series":
+        return pd.Series(a, name=item["name"], copy=False)
+    return a
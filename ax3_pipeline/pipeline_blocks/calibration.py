@@ -0,0 +1,168 @@
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .base import *
+from .signals import is_signal
+
+CalibrationResult = namedtuple("CalibrationResult", ["offset", "scale", "temperature_coefficient",
+                                                     "reference_temperature", "n_stationary_epochs", "error_before",
+                                                     "error_after", "success"])
+CalibrationResult.__doc__ = """
+Calibration of the last processed recording, calibrated = offset + scale * raw + temperature_coefficient *
+(T - reference_temperature) (per axis). The reference temperature is the mean temperature of the stationary epochs the
+fit is based on (NaN without temperature). The errors are the mean distances (in g) of the stationary epoch means from
+the unit sphere. If success is False the data was passed on unchanged.
+"""
+
+
+class AutoCalibration(DataProcessor):
+
+    def __init__(self, temperature=None, n_samples_per_epoch=1000, max_std=13/1000, max_abs_mean_g=2.,
+                 min_axis_coverage_g=0.3, max_iterations=1000, tolerance=1e-10, max_error_g=0.01, inplace=True,
+                 name=None):
+        """
+        Auto-calibration to local gravity (van Hees et al. 2014, 'Autocalibration of accelerometer data for free-living
+        physical activity assessment using local gravity and temperature'). Stationary epochs (std of every axis below
+        max_std, the criterion of NonWeartimeCalculator) should measure exactly 1 g, per-axis offset and scale (and
+        optionally a temperature coefficient) are fitted by iteratively re-weighted least squares to the epoch means,
+        which moves them onto the unit sphere. As the fit only uses epoch summaries its cost is small compared to the
+        filters. The correction is applied to the raw x, y, z signals (arrays or a Signal), so the block is placed
+        before LowpassButterworthFilter (and outside a ChunkedComposition, as the fit needs the whole recording).
+        :param temperature: optional sensor temperature of every sample (same length as the signals)
+        :param n_samples_per_epoch: number of samples per epoch used to detect stationary periods (defaults to 10s)
+        :param max_std: maximum std (in g) of every axis for an epoch to be stationary
+        :param max_abs_mean_g: epochs with an absolute axis mean above this value (in g) are ignored (clipping)
+        :param min_axis_coverage_g: stationary epoch means have to exceed +- this value on every axis, otherwise the
+        orientations do not constrain the fit and the data is not calibrated
+        :param max_iterations: maximum number of least squares iterations
+        :param tolerance: the iteration stops once the error improves by less than this value
+        :param max_error_g: the calibration is rejected if the error after calibration exceeds this value (in g)
+        :param inplace: whether the input arrays are corrected in place (otherwise calibrated copies are returned),
+        arrays that are not writeable or not of a floating point type are always copied
+        :param name:
+        """
+        super().__init__(name)
+        if temperature is not None:
+            temperature = temperature.to_numpy() if isinstance(temperature, pd.Series) else np.asarray(temperature)
+        self._temperature = temperature
+        self._n_samples_per_epoch = n_samples_per_epoch
+        self._max_std = max_std
+        self._max_abs_mean_g = max_abs_mean_g
+        self._min_axis_coverage_g = min_axis_coverage_g
+        self._max_iterations = max_iterations
+        self._tolerance = tolerance
+        self._max_error_g = max_error_g
+        self._inplace = inplace
+        self._result = None
+
+    @property
+    def result(self):
+        """
+        :return: CalibrationResult of the last processed recording (None before processing)
+        """
+        return self._result
+
+    def process(self, *data):
+        axes = data[0].as_tuple() if is_signal(data) else \
+            tuple(d.to_numpy() if isinstance(d, pd.Series) else np.asarray(d) for d in data)
+        assert len(axes) == 3, "Expected three arrays corresponding to x, y, z axis"
+        if self._temperature is not None and len(self._temperature) != len(axes[0]):
+            raise ValueError("Got %d temperature values for %d samples" % (len(self._temperature), len(axes[0])))
+
+        means, stds, temperature = self._epoch_summaries(axes)
+        stationary = np.all(stds < self._max_std, axis=1) & np.all(np.abs(means) <= self._max_abs_mean_g, axis=1)
+        self._result = fit_calibration(means[stationary], None if temperature is None else temperature[stationary],
+                                       self._min_axis_coverage_g, self._max_iterations, self._tolerance,
+                                       self._max_error_g)
+        if not self._result.success:
+            warnings.warn("Auto-calibration failed (%d stationary epochs, error %.4f g), data is not calibrated" %
+                          (self._result.n_stationary_epochs, self._result.error_after))
+            return data
+
+        # relative to the reference of the fit, the mean temperature of the stationary epochs
+        centered_temperature = None if self._temperature is None else \
+            self._temperature - self._result.reference_temperature
+        if is_signal(data):
+            return data[0].with_data(self._apply(data[0].data, (slice(None), np.newaxis), centered_temperature)),
+        return tuple(self._apply(d, i, centered_temperature) for i, d in enumerate(axes))
+
+    def _epoch_summaries(self, axes):
+        """
+        :return: (n_epochs, 3) arrays of the epoch means and standard deviations and the mean epoch temperatures
+        """
+        n = self._n_samples_per_epoch
+        n_epochs = len(axes[0]) // n
+        means = np.empty((n_epochs, 3))
+        stds = np.empty((n_epochs, 3))
+        for i, d in enumerate(axes):
+            epochs = d[:n_epochs * n].reshape(n_epochs, n)
+            means[:, i] = np.add.reduce(epochs, axis=1, dtype=np.float64) / n
+            squared_mean = np.einsum("ij,ij->i", epochs, epochs, dtype=np.float64) / n
+            stds[:, i] = np.sqrt(np.maximum(squared_mean - means[:, i] ** 2, 0))
+        temperature = None
+        if self._temperature is not None:
+            temperature = np.add.reduce(self._temperature[:n_epochs * n].reshape(n_epochs, n), axis=1,
+                                        dtype=np.float64) / n
+        return means, stds, temperature
+
+    def _apply(self, d, index, centered_temperature):
+        """
+        :param d: array of one axis (index is the axis) or of all axes (index selects the coefficient per axis)
+        :param centered_temperature: temperature minus the reference temperature of the fit (or None)
+        """
+        r = self._result
+        if not (self._inplace and d.flags.writeable and np.issubdtype(d.dtype, np.floating)):
+            d = d.astype(np.result_type(d.dtype, np.float32))
+        d *= r.scale[index]
+        d += r.offset[index]
+        if centered_temperature is not None:
+            d += centered_temperature * r.temperature_coefficient[index]
+        return d
+
+
+def fit_calibration(means, temperature=None, min_axis_coverage_g=0.3, max_iterations=1000, tolerance=1e-10,
+                    max_error_g=0.01):
+    """
+    Fits per-axis offset, scale and (optionally) temperature coefficient that move the stationary points onto the unit
+    sphere (see AutoCalibration).
+    :param means: (n, 3) array of the axis means of stationary epochs
+    :param temperature: optional mean temperature of each epoch
+    :return: CalibrationResult
+    """
+    n = len(means)
+    offset, scale, temperature_coefficient = np.zeros(3), np.ones(3), np.zeros(3)
+    error_before = np.mean(np.abs(np.linalg.norm(means, axis=1) - 1)) if n > 0 else np.nan
+    reference_temperature = np.mean(temperature) if temperature is not None and n > 0 else np.nan
+    covered = n > 0 and np.all(means.min(axis=0) < -min_axis_coverage_g) and \
+        np.all(means.max(axis=0) > min_axis_coverage_g)
+    if not covered:
+        return CalibrationResult(offset, scale, temperature_coefficient, reference_temperature, n, error_before,
+                                 error_before, False)
+
+    t = np.zeros(n) if temperature is None else temperature - reference_temperature
+    error = error_before
+    for _ in range(max_iterations):
+        calibrated = offset + means * scale + t[:, np.newaxis] * temperature_coefficient
+        norm = np.linalg.norm(calibrated, axis=1)
+        closest = calibrated / norm[:, np.newaxis]
+        # points far from the sphere (e.g. misclassified epochs) get less weight
+        weights = np.sqrt(np.minimum(1 / np.maximum(np.abs(norm - 1), 1e-12), 100))
+
+        for i in range(3):
+            columns = [np.ones(n), means[:, i]] + ([] if temperature is None else [t])
+            design = np.stack(columns, axis=1) * weights[:, np.newaxis]
+            coefficients = np.linalg.lstsq(design, closest[:, i] * weights, rcond=None)[0]
+            offset[i], scale[i] = coefficients[:2]
+            if temperature is not None:
+                temperature_coefficient[i] = coefficients[2]
+
+        calibrated = offset + means * scale + t[:, np.newaxis] * temperature_coefficient
+        previous_error, error = error, np.mean(np.abs(np.linalg.norm(calibrated, axis=1) - 1))
+        if abs(previous_error - error) < tolerance:
+            break
+
+    return CalibrationResult(offset, scale, temperature_coefficient, reference_temperature, n, error_before, error,
+                             error <= max_error_g)
@@ -1,6 +1,11 @@
+import copy
 from collections import OrderedDict
 
+import numpy as np
+import pandas as pd
+
 from .base import *
+from .signals import Signal
 
 
 class DataProcessorComposition(DataProcessor):
@@ -16,6 +21,65 @@ class DataProcessorComposition(DataProcessor):
     def processors(self):
         return OrderedDict(("%d_%s" % (i, p.name), p) for i, p in enumerate(self._processors))
 
+    def iter_processors(self):
+        """
+        Depth-first iteration over all (nested) processors of this composition, every instance is yielded only once
+        even if it is used in several branches (e.g. a shared EpochGenerator).
+        """
+        seen = set()
+        for p in self._processors:
+            nested = p.iter_processors() if isinstance(p, DataProcessorComposition) else ()
+            for q in (p, *nested):
+                if id(q) not in seen:
+                    seen.add(id(q))
+                    yield q
+
+    def use_executor(self, executor):
+        """
+        Shares an executor (e.g. concurrent.futures.ThreadPoolExecutor) with this composition and all nested processors
+        supporting concurrent execution. The heavy numpy/scipy operations release the GIL, so threads scale well.
+        :param executor: concurrent.futures.Executor or None to switch back to sequential execution
+        :return: self
+        """
+        for p in (self, *self.iter_processors()):
+            if hasattr(p, "_executor"):
+                p._executor = executor
+        return self
+
+    def compile(self, record_memory=False):
+        """
+        :param record_memory: whether the graph records the memory held by the intermediates (see
+        ProcessingGraph.memory_report)
+        :return: ProcessingGraph that executes this composition with identical sub-pipelines computed only once
+        """
+        from .graph import ProcessingGraph
+        return ProcessingGraph(self, record_memory)
+
+    def select_features(self, columns):
+        """
+        Prunes all branches and statistics that cannot contribute to the requested columns before anything is executed
+        (projection pushdown), e.g. the integration branch of the example pipeline if only ENMO features are needed.
+        Feature extractors are matched by their declared feature names (with or without axis prefix), post-processors
+        declare the columns they depend on (see DataProcessor.required_columns).
+        :param columns: names of the requested output columns, e.g. ['mean_enmo', 'x_std', 'spectral_entropy']
+        :return: composition whose output is the DataFrame of this composition restricted to the columns (in the given
+        order), it shares the (stateful) processors like EpochGenerator with this composition
+        """
+        from .postprocessors import SelectColumns
+        extractors = [p for p in self.iter_processors() if hasattr(p, "feature_names")]
+        unknown = [c for c in columns if not any(p.project({c}) is not None for p in extractors)]
+        if unknown:
+            raise ValueError("Columns %s are not computed by any feature extractor of the composition" % unknown)
+        return SequentialComposition(self.project(set(columns)), SelectColumns(columns))
+
+    def _with_processors(self, processors):
+        """
+        :return: shallow copy of this composition with the given processors
+        """
+        composition = copy.copy(self)
+        composition._processors = processors
+        return composition
+
     @abc.abstractmethod
     def process(self, *data):
         raise NotImplementedError()
@@ -23,12 +87,26 @@ class DataProcessorComposition(DataProcessor):
 
 class ParallelComposition(DataProcessorComposition):
 
+    def __init__(self, *data_processors, executor=None, name=None):
+        """
+        :param data_processors: independent branches that all receive the same input
+        :param executor: optional concurrent.futures.Executor used to run the branches concurrently, outputs are
+        always returned in branch order
+        :param name:
+        """
+        super().__init__(*data_processors, name=name)
+        self._executor = executor
+
     def process(self, *data):
         r = []
-        for dp in self._processors:
-            r.extend([*dp.process(*data)])
+        for output in map_with_executor(self._executor, lambda dp: dp.process(*data), self._processors):
+            r.extend([*output])
         return tuple(r)
 
+    def project(self, columns):
+        branches = [b for b in (p.project(columns) for p in self._processors) if b is not None]
+        return self._with_processors(branches) if branches else None
+
 
 class SequentialComposition(DataProcessorComposition):
 
@@ -43,3 +121,114 @@ class SequentialComposition(DataProcessorComposition):
             for p in self._processors[1:]:
                 tmp_data = p.process(*tmp_data)
             return tmp_data
+
+    def project(self, columns):
+        # from the output backwards: every processor only feeds the following one, so the composition is not needed
+        # as soon as one of them is not
+        processors = []
+        for p in reversed(self._processors):
+            projected = p.project(columns)
+            if projected is None:
+                return None
+            processors.insert(0, projected)
+            columns = p.required_columns(columns)
+        return self._with_processors(processors)
+
+    def required_columns(self, columns):
+        for p in reversed(self._processors):
+            columns = p.required_columns(columns)
+        return columns
+
+
+class ChunkedComposition(SequentialComposition):
+    """
+    Sequential composition that streams the input signals through its processors in fixed-size, epoch aligned chunks,
+    so peak memory depends on the chunk size rather than on the recording length (input arrays may be memory-mapped).
+
+    Every chunk is extended by padding samples on both sides, so the filters see enough context for their output to
+    match filtering the whole signal, the EpochGenerator then cuts the padding off again. All processors following the
+    EpochGenerator must therefore work epoch-wise, which holds for all blocks in this package. Post-processors that
+    require the whole epoch DataFrame (e.g. NonWeartimeCalculator) have to be placed after the chunked composition and
+    FeatureConcat must be constructed with the EpochGenerator instance instead of its timestamps.
+    """
+
+    def __init__(self, *data_processors, n_epochs_per_chunk=720, padding_samples=None, tolerance=1e-6, name=None):
+        """
+        :param data_processors: processors that are applied sequentially to every chunk
+        :param n_epochs_per_chunk: number of epochs starting in each chunk (defaults to 720, i.e. one hour of 5s epochs)
+        :param padding_samples: number of samples added on each side of a chunk, if None it is derived from the decay
+        time of the filters contained in the composition
+        :param tolerance: relative filter impulse response magnitude considered as decayed (only used if
+        padding_samples is None)
+        :param name:
+        """
+        super().__init__(*data_processors, name=name)
+        if n_epochs_per_chunk < 1:
+            raise ValueError("n_epochs_per_chunk must be positive, got: %d" % n_epochs_per_chunk)
+        self._n_epochs_per_chunk = n_epochs_per_chunk
+        self._padding_samples = padding_samples
+        self._tolerance = tolerance
+
+    @property
+    def padding_samples(self):
+        if self._padding_samples is not None:
+            return self._padding_samples
+        # the transients of consecutive filters add up, summing over all filters is conservative for parallel branches,
+        # overlapping epochs additionally need the samples following the chunk
+        processors = list(self.iter_processors())
+        return sum(p.transient_length(self._tolerance) for p in processors if hasattr(p, "transient_length")) + \
+            max([p.context_samples for p in processors if hasattr(p, "context_samples")], default=0)
+
+    @property
+    def n_samples_per_hop(self):
+        n = {p.n_samples_per_hop for p in self.iter_processors() if hasattr(p, "n_samples_per_hop")}
+        if len(n) != 1:
+            raise ValueError("Chunked execution requires exactly one epoch hop size, found: %s" % sorted(n))
+        return n.pop()
+
+    def iter_chunks(self, *data):
+        """
+        Processes the data chunk by chunk and yields the outputs of every chunk as soon as it is finished.
+        :param data: full length sequences (np.array, np.memmap or pd.Series) or a Signal
+        """
+        n_samples = _length(data[0])
+        assert all(_length(d) == n_samples for d in data), "all input sequences must have the same length"
+        chunk_size = self._n_epochs_per_chunk * self.n_samples_per_hop
+        padding = self.padding_samples
+        processors = list(self.iter_processors())
+
+        try:
+            for start in range(0, n_samples, chunk_size):
+                stop = min(start + chunk_size, n_samples)
+                lower, upper = max(start - padding, 0), min(stop + padding, n_samples)
+                chunk = Chunk(start, stop, start - lower, upper - stop)
+                for p in processors:
+                    p.begin_chunk(chunk)
+                yield super().process(*[_slice(d, lower, upper) for d in data])
+        finally:
+            for p in processors:
+                p.end_chunks()
+
+    def process(self, *data):
+        outputs = [*self.iter_chunks(*data)]
+        assert len(outputs) > 0, "no data provided"
+        return tuple(_concat([o[i] for o in outputs]) for i in range(len(outputs[0])))
+
+
+def _length(d):
+    return d.n_samples if isinstance(d, Signal) else len(d)
+
+
+def _slice(d, start, stop):
+    if isinstance(d, Signal):
+        return d.slice_samples(start, stop)
+    return d.iloc[start:stop] if isinstance(d, pd.Series) else d[start:stop]
+
+
+def _concat(parts):
+    if isinstance(parts[0], (pd.Series, pd.DataFrame)):
+        return pd.concat(parts)
+    if isinstance(parts[0], Signal):
+        # raw samples and epochs (the second dimension) are concatenated
+        return parts[0].with_data(np.concatenate([p.data for p in parts], axis=1))
+    return np.concatenate(parts)
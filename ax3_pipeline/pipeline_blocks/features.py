@@ -1,4 +1,8 @@
+import copy
+
 from .base import *
+from .misc import OneSidedPowerSpectrum, power_spectrum
+from .signals import is_signal
 import pandas as pd
 import numpy as np
 
@@ -14,11 +18,50 @@ class FeatureExtractor(DataProcessor):
         super().__init__(name)
         self._feature_names = feature_names
         self._axes = ["x_", "y_", "z_"]
+        # None keeps the dtype of the input (see Precision)
+        self._feature_dtype = get_precision().feature
 
     @abc.abstractmethod
     def process(self, *data):
         raise NotImplementedError
 
+    @property
+    def feature_names(self):
+        """
+        :return: list of the declared feature names (output columns are prefixed by the axis for multi-axis input)
+        """
+        if isinstance(self._feature_names, str):
+            return [self._feature_names]
+        return list(self._feature_names)
+
+    def project(self, columns):
+        return self if any(self._requested(columns, f) for f in self.feature_names) else None
+
+    def _requested(self, columns, feature_name):
+        return any(axis + feature_name in columns for axis in ("", *self._axes))
+
+    def _as_feature(self, values):
+        """
+        :return: floating point feature values in the dtype of the precision policy
+        """
+        return values if self._feature_dtype is None else np.asarray(values).astype(self._feature_dtype, copy=False)
+
+    def _values_dtype(self, dtype):
+        """
+        :return: dtype of the features computed from an intermediate of the given dtype
+        """
+        return np.result_type(dtype, np.float32) if self._feature_dtype is None else self._feature_dtype
+
+    def _per_axis(self, data, function):
+        """
+        Applies function (vectorized along the last dimension) to all axes, in a single call on the stacked data of a
+        Signal or once per array of the tuple interface.
+        :return: list of the per-axis results and list of the feature name prefixes of the axes
+        """
+        if is_signal(data):
+            return list(function(data[0].data)), data[0].column_prefixes
+        return [function(d) for d in data], [""] if len(data) == 1 else self._axes
+
 
 class ApproximateDistance(FeatureExtractor):
 
@@ -27,42 +70,97 @@ class ApproximateDistance(FeatureExtractor):
         self.si_unit = "m"
 
     def process(self, *data):
-        axis = [""] if len(data) == 1 else self._axes
-        return tuple([pd.Series(d, name=axis[i] + self._feature_names) for i, d in enumerate(data)])
+        values, axis = self._per_axis(data, self._as_feature)
+        return tuple([pd.Series(d, name=axis[i] + self._feature_names) for i, d in enumerate(values)])
 
 
 class TimeDomainSummaryStatistics(FeatureExtractor):
 
     def __init__(self, feature_names=None, name=None):
-        super().__init__(feature_names=(
-            "mean",
-            "median",
-            "std",
-            "min",
-            "max",
-            "q_5",
-            "q_95"
-        ) if feature_names is None else feature_names, name=name)
+        super().__init__(feature_names=_STATISTICS if feature_names is None else feature_names, name=name)
+        # statistic computed for each feature name
+        self._statistics = _STATISTICS
+
+    def project(self, columns):
+        """
+        Keeps only the requested statistics (e.g. std for non-wear detection), the order statistics are not selected at
+        all if none of them is requested.
+        """
+        selected = [i for i, f in enumerate(self._feature_names) if self._requested(columns, f)]
+        if len(selected) == 0:
+            return None
+        projected = copy.copy(self)
+        projected._feature_names = tuple(self._feature_names[i] for i in selected)
+        projected._statistics = tuple(self._statistics[i] for i in selected)
+        return projected
 
     def process(self, *data):
-        r = []
+        """
+        All statistics are computed in a single fused pass per axis: order statistics are selected by one partition of
+        every epoch, mean and standard deviation from the sum and sum of squares (accumulated in float64 without
+        temporary arrays). The result is a single DataFrame with one column per axis and statistic.
+        """
+        if is_signal(data):
+            d = data[0].data
+            assert d.ndim == 3, "data is supposed to be an epoched Signal (n_axes, n_epochs, n_samples_per_epoch)"
+            values = np.empty((d.shape[1], d.shape[0], len(self._feature_names)), dtype=self._values_dtype(d.dtype))
+            # the statistics of all axes are written in one pass into the (epoch, axis, statistic) ordered columns
+            _epoch_statistics(d, values.transpose(1, 0, 2), self._statistics)
+            columns = [axis + feature_name for axis in data[0].column_prefixes for feature_name in self._feature_names]
+            return (pd.DataFrame(values.reshape(d.shape[1], -1), columns=columns),)
+
         data_size = len(data)
+        n_statistics = len(self._feature_names)
+        values = None
+        columns = []
         for i, d in enumerate(data):
             assert len(
                 d.shape) == 2, "data is supposed to be a 2d array where rows correspond to epochs and columns to the " \
                                "values of a given epoch"
+            if values is None:
+                values = np.empty((d.shape[0], n_statistics * data_size), dtype=self._values_dtype(d.dtype))
+            _epoch_statistics(d, values[:, i * n_statistics:(i + 1) * n_statistics], self._statistics)
             axis = "" if data_size == 1 else self._axes[i]
-            features = [
-                pd.Series(np.mean(d, axis=1), name=axis + self._feature_names[0]),
-                pd.Series(np.median(d, axis=1), name=axis + self._feature_names[1]),
-                pd.Series(np.std(d, axis=1), name=axis + self._feature_names[2]),
-                pd.Series(np.min(d, axis=1), name=axis + self._feature_names[3]),
-                pd.Series(np.max(d, axis=1), name=axis + self._feature_names[4]),
-                pd.Series(np.quantile(d, 0.05, axis=1).astype(np.float32), name=axis + self._feature_names[5]),
-                pd.Series(np.quantile(d, 0.95, axis=1).astype(np.float32), name=axis + self._feature_names[6])
-            ]
-            r.extend(features)
-        return tuple(r)
+            columns.extend([axis + feature_name for feature_name in self._feature_names])
+        return (pd.DataFrame(values, columns=columns),)
+
+
+_STATISTICS = ("mean", "median", "std", "min", "max", "q_5", "q_95")
+_QUANTILES = {"median": 0.5, "q_5": 0.05, "q_95": 0.95}
+
+
+def _epoch_statistics(d, out, statistics=_STATISTICS):
+    """
+    Writes the given statistics (see _STATISTICS, quantiles with linear interpolation as np.quantile) of every epoch
+    (last dimension) of d into the last dimension of out (in the order of statistics).
+    """
+    n = d.shape[-1]
+    column = {s: i for i, s in enumerate(statistics)}
+    quantiles = [(column[s], q * (n - 1)) for s, q in _QUANTILES.items() if s in column]
+    kth = {0} if "min" in column else set()
+    if "max" in column:
+        kth.add(n - 1)
+    for _, position in quantiles:
+        kth.update((int(np.floor(position)), min(int(np.floor(position)) + 1, n - 1)))
+    selected = np.partition(d, sorted(kth), axis=-1) if kth else None
+
+    if "mean" in column or "std" in column:
+        mean = np.add.reduce(d, axis=-1, dtype=np.float64) / n
+        if "mean" in column:
+            out[..., column["mean"]] = mean
+        if "std" in column:
+            squared_total = np.einsum("...j,...j->...", d, d, dtype=np.float64)
+            out[..., column["std"]] = np.sqrt(np.maximum(squared_total / n - mean * mean, 0))
+    if "min" in column:
+        out[..., column["min"]] = selected[..., 0]
+    if "max" in column:
+        out[..., column["max"]] = selected[..., n - 1]
+
+    for i, position in quantiles:
+        lower = int(np.floor(position))
+        a = selected[..., lower].astype(np.float64)
+        b = selected[..., min(lower + 1, n - 1)].astype(np.float64)
+        out[..., i] = a + (b - a) * (position - lower)
 
 
 class EnmoSummaryStatistics(TimeDomainSummaryStatistics):
@@ -101,9 +199,11 @@ class TotalEnergy(FeatureExtractor):
         super().__init__(feature_names="total_energy", name=name)
 
     def process(self, *data):
-        axis = [""] if len(data) == 1 else self._axes
-        return tuple([pd.Series(np.sum(np.power(np.abs(d), 2), axis=1)/d.shape[1], name=axis[i] + self._feature_names)
-                      for i, d in enumerate(data)])
+        """
+        :param data: OneSidedPowerSpectrum (see PowerSpectrum) or full complex spectra (see Dft1d) of each axis
+        """
+        values, axis = self._per_axis(data, lambda d: self._as_feature(_total_energy(d)))
+        return tuple([pd.Series(energy, name=axis[i] + self._feature_names) for i, energy in enumerate(values)])
 
 
 class SpectralEntropy(FeatureExtractor):
@@ -112,15 +212,33 @@ class SpectralEntropy(FeatureExtractor):
         super().__init__(feature_names="spectral_entropy", name=name)
 
     def process(self, *data):
-        r = []
-        axis = [""] if len(data) == 1 else self._axes
-        for i, d in enumerate(data):
-            assert len(d.shape) == 2, "Operations are only defined on an Epoch 2d array"
-            amp = (np.power(np.abs(d), 2) / d.shape[1]) + 0.000000000000000000000001
-            scaled_amp = amp / np.sum(amp, axis=1).reshape(-1, 1)
-            entropy = -1*np.sum(scaled_amp*np.log(scaled_amp), axis=1)
-            r.append(pd.Series(entropy, name=axis[i] + self._feature_names))
-        return tuple(r)
+        if not is_signal(data):
+            for d in data:
+                assert len(d.shape) == 2, "Operations are only defined on an Epoch 2d array"
+        values, axis = self._per_axis(data, lambda d: self._as_feature(_spectral_entropy(d)))
+        return tuple([pd.Series(entropy, name=axis[i] + self._feature_names) for i, entropy in enumerate(values)])
+
+
+def _weighted_sum(a, weights):
+    # the same (2d) matrix-vector product for any number of leading dimensions keeps the results independent of them
+    return a.reshape(-1, a.shape[-1]).dot(weights).reshape(a.shape[:-1])
+
+
+def _total_energy(d):
+    if isinstance(d, OneSidedPowerSpectrum):
+        return _weighted_sum(d.power, d.weights) / d.n_samples
+    return np.sum(np.power(np.abs(d), 2), axis=-1)/d.shape[-1]
+
+
+def _spectral_entropy(d):
+    if isinstance(d, OneSidedPowerSpectrum):
+        # mirrored bins are identical, weighting the one-sided bins gives the entropy of the full spectrum
+        amp = (d.power / d.n_samples) + 0.000000000000000000000001
+        scaled_amp = amp / _weighted_sum(amp, d.weights)[..., np.newaxis]
+        return -1*_weighted_sum(scaled_amp*np.log(scaled_amp), d.weights)
+    amp = (np.power(np.abs(d), 2) / d.shape[-1]) + 0.000000000000000000000001
+    scaled_amp = amp / np.sum(amp, axis=-1)[..., np.newaxis]
+    return -1*np.sum(scaled_amp*np.log(scaled_amp), axis=-1)
 
 
 class ActivityClasses(FeatureExtractor):
@@ -136,18 +254,136 @@ class ActivityClasses(FeatureExtractor):
         super().__init__(feature_names=["sedentary", "moderate", "vigorous"], name=name)
         self._moderate_to_vigorous_pa_threshold_g = moderate_to_vigorous_pa_threshold_g
         self._vigorous_pa_threshold_g = vigorous_pa_threshold_g
+        self._flag_dtype = get_precision().flag
 
     def process(self, *data):
         r = []
-        axis = [""] if len(data) == 1 else self._axes
-        for i, d in enumerate(data):
-            means = np.mean(d, axis=1)
-            sedentary = pd.Series((means < self._moderate_to_vigorous_pa_threshold_g) * 1,
-                                  name=axis[i]+self._feature_names[0])
-            moderate = pd.Series(((means >= self._moderate_to_vigorous_pa_threshold_g) &
-                                  (means < self._vigorous_pa_threshold_g)) * 1,
-                                 name=axis[i]+self._feature_names[1])
-            vigorous = pd.Series((means >= self._vigorous_pa_threshold_g) * 1,
-                                 name=axis[i]+self._feature_names[2])
-            r.extend([sedentary.astype(np.int32), moderate.astype(np.int32), vigorous.astype(np.int32)])
+        values, axis = self._per_axis(data, lambda d: np.mean(d, axis=-1))
+        for i, means in enumerate(values):
+            r.extend(self._classify(means, axis[i]))
         return tuple(r)
+
+    def _classify(self, means, axis=""):
+        """
+        :param means: epoch means
+        :param axis: feature name prefix
+        :return: sedentary, moderate and vigorous indicator Series
+        """
+        sedentary = pd.Series((means < self._moderate_to_vigorous_pa_threshold_g).astype(self._flag_dtype),
+                              name=axis+self._feature_names[0])
+        moderate = pd.Series(((means >= self._moderate_to_vigorous_pa_threshold_g) &
+                              (means < self._vigorous_pa_threshold_g)).astype(self._flag_dtype),
+                             name=axis+self._feature_names[1])
+        vigorous = pd.Series((means >= self._vigorous_pa_threshold_g).astype(self._flag_dtype),
+                             name=axis+self._feature_names[2])
+        return sedentary, moderate, vigorous
+
+
+class FusedEnmoFeatures(FeatureExtractor):
+
+    def __init__(self, epoch_generator, n_epochs_per_batch=128, moderate_to_vigorous_pa_threshold_g=68.7/1000,
+                 vigorous_pa_threshold_g=266.8/1000, workers=-1, name=None):
+        """
+        Computes the ENMO branch of the example pipeline, i.e. the outputs of
+
+            SequentialComposition(
+                EuclideanNormMinusOne(),
+                epoch_generator,
+                ParallelComposition(EnmoSummaryStatistics(), ActivityClasses(),
+                                    SequentialComposition(PowerSpectrum(), ParallelComposition(TotalEnergy(),
+                                                                                               SpectralEntropy()))))
+
+        from the filtered x, y, z signals (arrays or a Signal) in a single pass over batches of epochs. Only the epochs
+        of one batch are held at full resolution, so apart from the outputs the input is merely read once. The outputs
+        are identical to the ones of the composition.
+        :param epoch_generator: EpochGenerator defining the epochs (may be shared with other branches)
+        :param n_epochs_per_batch: number of epochs processed at once (the default keeps a batch of float32 epochs of
+        500 samples in a 256kB cache)
+        :param moderate_to_vigorous_pa_threshold_g: see ActivityClasses
+        :param vigorous_pa_threshold_g: see ActivityClasses
+        :param workers: number of threads used per transform (see PowerSpectrum)
+        :param name:
+        """
+        super().__init__(feature_names=None, name=name)
+        if n_epochs_per_batch < 1:
+            raise ValueError("n_epochs_per_batch must be positive, got: %d" % n_epochs_per_batch)
+        self._epoch_generator = epoch_generator
+        self._n_epochs_per_batch = n_epochs_per_batch
+        self._statistics = EnmoSummaryStatistics()
+        self._activity_classes = ActivityClasses(moderate_to_vigorous_pa_threshold_g, vigorous_pa_threshold_g)
+        self._workers = workers
+
+    @property
+    def feature_names(self):
+        return [*self._statistics.feature_names, *self._activity_classes.feature_names, "total_energy",
+                "spectral_entropy"]
+
+    @property
+    def n_samples_per_epoch(self):
+        return self._epoch_generator.n_samples_per_epoch
+
+    @property
+    def n_samples_per_hop(self):
+        return self._epoch_generator.n_samples_per_hop
+
+    @property
+    def context_samples(self):
+        return self._epoch_generator.context_samples
+
+    def begin_chunk(self, chunk):
+        # the epoch generator is not necessarily part of the chunked composition itself
+        self._epoch_generator.begin_chunk(chunk)
+
+    def end_chunks(self):
+        self._epoch_generator.end_chunks()
+
+    def process(self, *data):
+        if is_signal(data):
+            windows, valid = self._epoch_generator.windows(data[0].data)
+            windows = list(windows)
+        else:
+            assert len(data) == 3, "Expected three arrays corresponding to x, y, z axis"
+            epochs = [self._epoch_generator.windows(d.to_numpy() if isinstance(d, pd.Series) else d) for d in data]
+            windows, valid = [e[0] for e in epochs], epochs[0][1]
+
+        # bad epochs are skipped (instead of removed afterwards), so the batches contain the same epochs at the same
+        # positions as the arrays processed by the composed blocks, which keeps the (vectorized) FFT results identical
+        epoch_indices = None
+        if valid is not None and not self._epoch_generator.defers_bad_epoch_removal and not np.all(valid):
+            epoch_indices = np.flatnonzero(valid)
+        n_epochs = windows[0].shape[0] if epoch_indices is None else len(epoch_indices)
+
+        dtype = np.result_type(*[w.dtype for w in windows])
+        statistics = np.empty((n_epochs, len(self._statistics._feature_names)),
+                              dtype=self._statistics._values_dtype(dtype))
+        means = np.empty(n_epochs, dtype=dtype)
+        energy, entropy = None, None
+
+        for start in range(0, n_epochs, self._n_epochs_per_batch):
+            stop = min(start + self._n_epochs_per_batch, n_epochs)
+            batch = slice(start, stop) if epoch_indices is None else epoch_indices[start:stop]
+            # same element-wise operations (and order) as EuclideanNormMinusOne, applied to the epochs of the batch
+            enmo = np.square(windows[0][batch])
+            for w in windows[1:]:
+                enmo += np.square(w[batch])
+            np.sqrt(enmo, out=enmo)
+            enmo -= 1
+            np.maximum(enmo, 0, out=enmo)
+
+            _epoch_statistics(enmo, statistics[start:stop])
+            means[start:stop] = np.mean(enmo, axis=-1)
+            spectrum = power_spectrum(enmo, self._workers)
+            batch_energy, batch_entropy = _total_energy(spectrum), _spectral_entropy(spectrum)
+            if energy is None:
+                energy = np.empty(n_epochs, dtype=batch_energy.dtype)
+                entropy = np.empty(n_epochs, dtype=batch_entropy.dtype)
+            energy[start:stop] = batch_energy
+            entropy[start:stop] = batch_entropy
+
+        if energy is None:
+            energy = entropy = np.empty(0, dtype=dtype)
+
+        return (pd.DataFrame(statistics, columns=list(self._statistics._feature_names)),
+                *self._activity_classes._classify(means),
+                pd.Series(self._as_feature(energy), name="total_energy"),
+                pd.Series(self._as_feature(entropy), name="spectral_entropy"))
@@ -1,36 +1,84 @@
 from scipy import signal
 import numpy as np
-import pandas as pd
 
 from .base import *
+from .signals import is_signal
 
 
 class BaseButterworthFilter(DataProcessor):
 
-    def __init__(self, order, sampling_frequency, cutoff_frequency, btype):
+    def __init__(self, order, sampling_frequency, cutoff_frequency, btype, executor=None, dtype=None,
+                 output_dtype=None):
+        """
+        Zero-phase Butterworth filter in second-order sections (numerically stable also for very low cutoff
+        frequencies). Either a stacked (n_axes, n_samples) array, which is filtered along the last axis in a single call
+        and returned as such, a Signal or one array per axis (returned as rows of a single stacked array) can be passed.
+        :param order: filter order
+        :param sampling_frequency: sampling frequency of the signal (Hz)
+        :param cutoff_frequency: cutoff frequency (Hz)
+        :param btype: filter type passed to scipy.signal.butter
+        :param executor: optional concurrent.futures.Executor used to filter the axes concurrently
+        :param dtype: working precision of the filter (np.float32 halves the memory of the temporaries), defaults to the
+        compute dtype of the precision policy
+        :param output_dtype: dtype of the filtered signals, defaults to the signal dtype of the precision policy
+        """
         super().__init__()
+        self._executor = executor
         self.order = order
         self.sampling_frequency = sampling_frequency
         self.cutoff_frequency = cutoff_frequency
+        precision = get_precision()
+        self.dtype = np.dtype(precision.compute if dtype is None else dtype)
+        self.output_dtype = np.dtype(precision.signal if output_dtype is None else output_dtype)
 
         nyquist_frequency = 0.5 * sampling_frequency
         self._fc = cutoff_frequency / nyquist_frequency
 
-        self._b, self._a = signal.butter(self.order, self._fc, btype=btype, analog=False)
+        self._sos = signal.butter(self.order, self._fc, btype=btype, analog=False, output="sos")
 
     def process(self, *data: np.array):
-        r = [pd.Series(signal.filtfilt(self._b, self._a, d), dtype=np.float32) for d in data if len(d) > 0]
-        assert len(r) == len(data), "number of input does not match number of output arrays, maybe one array was empty"
-        return tuple(r)
+        stacked = len(data) == 1 and (is_signal(data) or np.ndim(data[0]) == 2)
+        if stacked:
+            x = np.asarray(data[0].data if is_signal(data) else data[0], dtype=self.dtype)
+        else:
+            assert all(len(d) > 0 for d in data), "empty input array"
+            x = np.empty((len(data), len(data[0])), dtype=self.dtype)
+            for i, d in enumerate(data):
+                x[i] = d
+        sos = self._sos.astype(self.dtype)
+
+        if self._executor is None:
+            r = signal.sosfiltfilt(sos, x, axis=-1).astype(self.output_dtype, copy=False)
+        else:
+            r = np.empty(x.shape, dtype=self.output_dtype)
+
+            def filter_axis(i):
+                r[i] = signal.sosfiltfilt(sos, x[i])
+
+            map_with_executor(self._executor, filter_axis, range(len(x)))
+        if is_signal(data):
+            return data[0].with_data(r),
+        return (r,) if stacked else tuple(r)
+
+    def transient_length(self, tolerance=1e-6):
+        """
+        :param tolerance: relative magnitude at which the impulse response is considered as decayed
+        :return: number of samples until the impulse response of the filter decayed below the tolerance, i.e. the
+        context required on each side of a signal chunk to reproduce the output of filtering the whole signal
+        """
+        pole_radius = np.max(np.abs(signal.sos2zpk(self._sos)[1]))
+        return int(np.ceil(np.log(tolerance) / np.log(pole_radius)))
 
 
 class LowpassButterworthFilter(BaseButterworthFilter):
 
-    def __init__(self, order=4, sampling_frequency=100, cutoff_frequency=20):
-        super().__init__(order, sampling_frequency, cutoff_frequency, "low")
+    def __init__(self, order=4, sampling_frequency=100, cutoff_frequency=20, executor=None,
+                 dtype=None, output_dtype=None):
+        super().__init__(order, sampling_frequency, cutoff_frequency, "low", executor, dtype, output_dtype)
 
 
 class HighpassButterworthFilter(BaseButterworthFilter):
 
-    def __init__(self, order=2, sampling_frequency=100, cutoff_frequency=0.1):
-        super().__init__(order, sampling_frequency, cutoff_frequency, "high")
+    def __init__(self, order=2, sampling_frequency=100, cutoff_frequency=0.1, executor=None,
+                 dtype=None, output_dtype=None):
+        super().__init__(order, sampling_frequency, cutoff_frequency, "high", executor, dtype, output_dtype)
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+
+import pandas as pd
+
+from .base import *
+from .compositions import ParallelComposition, SequentialComposition, ChunkedComposition
+from .profiling import held_bytes, _describe_all
+
+
+class Node(object):
+    """
+    A processor applied to the concatenated outputs of its input nodes. The input node of the graph has no processor.
+    """
+
+    def __init__(self, index, processor, inputs):
+        self.index = index
+        self.processor = processor
+        self.inputs = inputs
+        self.n_consumers = 0
+
+    def __repr__(self):
+        return "Node(%d, %s, inputs=%s)" % (
+            self.index, "input" if self.processor is None else self.processor.name, [n.index for n in self.inputs])
+
+
+class ProcessingGraph(DataProcessor):
+    """
+    Explicit DAG representation of a (nested) composition. Nodes are keyed by the processor signature (class and
+    parameters) and their input nodes, so identical sub-pipelines applied to the same input are executed only once and
+    their output is shared. Intermediate outputs are released as soon as their last consumer has been executed, the
+    memory held by them can be recorded in the memory_report of the last run.
+    """
+
+    def __init__(self, composition, record_memory=False, name=None):
+        """
+        :param composition: the composition (or single processor) to compile
+        :param record_memory: whether the dtypes and bytes of the intermediates are recorded (see memory_report), this
+        traverses all held intermediates after every node
+        :param name:
+        """
+        super().__init__(name)
+        self._composition = composition
+        self._record_memory = record_memory
+        self._nodes = OrderedDict()
+        input_node = self._node(None, ())
+        self._outputs = self._compile(composition, (input_node,))
+        for node in self._outputs:
+            node.n_consumers += 1
+        self._memory_report = []
+
+    @property
+    def nodes(self):
+        """
+        :return: graph nodes in topological (execution) order
+        """
+        return list(self._nodes.values())
+
+    def memory_report(self):
+        """
+        :return: DataFrame with one row per executed node of the last run: output dtypes, bytes of the output and bytes
+        of all intermediates held after the node was executed (views and shared buffers are counted once, the input
+        data is not included)
+        """
+        if not self._record_memory:
+            raise ValueError("Memory is not recorded, the graph has to be compiled with record_memory=True")
+        return pd.DataFrame(self._memory_report,
+                            columns=["node", "processor", "output_dtypes", "output_bytes", "held_bytes"])
+
+    def project(self, columns):
+        composition = self._composition.project(columns)
+        return None if composition is None else ProcessingGraph(composition, self._record_memory, self._name)
+
+    def required_columns(self, columns):
+        return self._composition.required_columns(columns)
+
+    def _node(self, processor, inputs):
+        key = (None if processor is None else processor.signature, tuple(n.index for n in inputs))
+        node = self._nodes.get(key)
+        if node is None:
+            node = Node(len(self._nodes), processor, inputs)
+            self._nodes[key] = node
+            for n in inputs:
+                n.n_consumers += 1
+        return node
+
+    def _compile(self, processor, inputs):
+        """
+        :return: nodes whose concatenated outputs correspond to the output of the processor
+        """
+        if isinstance(processor, ParallelComposition):
+            return tuple(n for p in processor.processors.values() for n in self._compile(p, inputs))
+        if isinstance(processor, SequentialComposition) and not isinstance(processor, ChunkedComposition):
+            assert len(processor.processors) > 0, "at least one processor must be provided"
+            for p in processor.processors.values():
+                inputs = self._compile(p, inputs)
+            return inputs
+        # all other processors (including special compositions like ChunkedComposition) are executed as a whole
+        return self._node(processor, inputs),
+
+    def process(self, *data):
+        results = {}
+        remaining_consumers = {}
+        self._memory_report = []
+        for node in self._nodes.values():
+            if node.processor is None:
+                results[node.index] = data
+            else:
+                node_input = [d for n in node.inputs for d in results[n.index]]
+                results[node.index] = tuple(node.processor.process(*node_input))
+                del node_input
+                for n in node.inputs:
+                    remaining_consumers[n.index] = remaining_consumers.get(n.index, n.n_consumers) - 1
+                    if remaining_consumers[n.index] == 0:
+                        del results[n.index]
+                if self._record_memory:
+                    held = [d for index, r in results.items() if index != 0 for d in r]
+                    self._memory_report.append((node.index, node.processor.name,
+                                                _describe_all(results[node.index])[1], held_bytes(results[node.index]),
+                                                held_bytes(held)))
+
+        return tuple(d for n in self._outputs for d in results[n.index])
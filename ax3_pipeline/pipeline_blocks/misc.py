@@ -1,12 +1,26 @@
 import warnings
 
-from scipy.fftpack import fft
-from scipy.integrate import cumtrapz, trapz
 import numpy as np
 import pandas as pd
 from typing import Sequence
 
+try:
+    # scipy >= 1.6, the old names were removed in scipy 1.14
+    from scipy.integrate import cumulative_trapezoid as cumtrapz, trapezoid as trapz
+except ImportError:
+    from scipy.integrate import cumtrapz, trapz
+
+try:
+    # scipy >= 1.4 keeps single precision and supports worker threads
+    from scipy.fft import fft, rfft
+    _FFT_SUPPORTS_WORKERS = True
+except ImportError:
+    from scipy.fftpack import fft
+    from numpy.fft import rfft
+    _FFT_SUPPORTS_WORKERS = False
+
 from .base import *
+from .signals import is_signal
 
 
 class TrapezoidalIntegrator(DataProcessor):
@@ -18,23 +32,52 @@ class TrapezoidalIntegrator(DataProcessor):
         self._cumulative = cumulative
 
     def process(self, *data):
+        if is_signal(data):
+            return data[0].with_data(self._integrate(data[0].data)),
+        return tuple([self._integrate(d) for d in data])
+
+    def _integrate(self, d):
+        # integrates along the last axis, i.e. within every epoch (in the floating point precision of the input)
+        dtype = np.result_type(d.dtype, np.float32)
         if self._cumulative:
-            return tuple([cumtrapz(d, initial=self._first_value, dx=self._time_delta_s) for d in data])
-        else:
-            return tuple([trapz(d, dx=self._time_delta_s) for d in data])
+            return cumtrapz(d, initial=self._first_value, dx=self._time_delta_s, axis=-1).astype(dtype, copy=False)
+        return trapz(d, dx=self._time_delta_s, axis=-1).astype(dtype, copy=False)
 
 
 class EpochGenerator(DataProcessor):
 
-    def __init__(self, timestamps_ms=None, n_samples_per_epoch=500, name=None):
+    def __init__(self, timestamps_ms=None, n_samples_per_epoch=500, n_samples_per_hop=None,
+                 defer_bad_epoch_removal=False, partial_epochs="trim", missing_samples=None, name=None):
         """
         If a timestamp sequence is provided it will check whether it is continuous (no gaps inside an epoch) and remove
         and epochs with gaps.
+
+        Epochs are returned as views of the input wherever possible (also for overlapping windows, which are created
+        with stride tricks and must not be written to). Removing bad epochs copies the data, with
+        defer_bad_epoch_removal they are kept and only dropped by FeatureConcat (which then has to be constructed with
+        this EpochGenerator instance).
         :param timestamps_ms: POSIX timestamps with millisecond precision
         :param n_samples_per_epoch: the number of samples in each epoch (defaults to 500=5s)
+        :param n_samples_per_hop: the number of samples between the starts of consecutive epochs, defaults to
+        n_samples_per_epoch (non-overlapping epochs), e.g. 500 for 10s windows (n_samples_per_epoch=1000) with a 5s hop
+        :param defer_bad_epoch_removal: whether bad epochs are kept (see valid_epochs) and removed by FeatureConcat
+        :param partial_epochs: 'trim' drops an incomplete trailing epoch, 'pad' completes it by repeating the last
+        sample (copies the data) and 'error' raises a ValueError
+        :param missing_samples: optional boolean mask of samples without data (e.g. Resampler.missing_samples), epochs
+        containing any of them are bad (requires timestamps_ms)
         :param name:
         """
         super().__init__(name)
+        if missing_samples is not None and timestamps_ms is None:
+            raise ValueError("missing_samples requires a timestamp sequence")
+        if partial_epochs not in ("trim", "pad", "error"):
+            raise ValueError("partial_epochs must be one of 'trim', 'pad' or 'error', got: %s" % partial_epochs)
+        self._n_samples_per_epoch = n_samples_per_epoch
+        self._n_samples_per_hop = n_samples_per_epoch if n_samples_per_hop is None else n_samples_per_hop
+        self._defer_bad_epoch_removal = defer_bad_epoch_removal
+        self._partial_epochs = partial_epochs
+        self._chunk = None
+
         if timestamps_ms is None:
             self._timestamps = None
         else:
@@ -45,76 +88,272 @@ class EpochGenerator(DataProcessor):
                     "timestamp_ms must be either a numpy array or pandas Series, got: %s" % type(timestamps_ms))
 
             self._delta_t = int(np.median(np.diff(timestamps_ms)))
-            timestamps_ms = timestamps_ms.reshape(-1, n_samples_per_epoch)
-            self._bad_epoch_indices = np.where(np.diff(timestamps_ms) != self._delta_t)[0]
+            n_samples = len(timestamps_ms)
+            self._n_epochs = self._count_epochs(n_samples)
+
+            # an epoch is bad if any sample interval inside of it deviates from delta_t (O(n) via a cumulative sum)
+            n_gaps = np.concatenate([[0], np.cumsum(np.diff(timestamps_ms) != self._delta_t)])
+            first_sample = np.arange(self._n_epochs) * self._n_samples_per_hop
+            last_sample = np.minimum(first_sample + self._n_samples_per_epoch - 1, n_samples - 1)
+            self._valid_epochs = n_gaps[last_sample] == n_gaps[first_sample]
+            if missing_samples is not None:
+                if len(missing_samples) != n_samples:
+                    raise ValueError("Got %d missing_samples values for %d timestamps" %
+                                     (len(missing_samples), n_samples))
+                n_missing = np.concatenate([[0], np.cumsum(missing_samples)])
+                self._valid_epochs &= n_missing[last_sample + 1] == n_missing[first_sample]
+            self._bad_epoch_indices = np.flatnonzero(~self._valid_epochs)
 
             if len(self._bad_epoch_indices > 0):
                 warnings.warn(
-                    "Found %d bad epochs where delta_t != estimated delta_t of %d ms. Bad epochs will be removed!" %
-                    (len(self._bad_epoch_indices), self._delta_t))
-                timestamps_ms = np.delete(timestamps_ms, self._bad_epoch_indices, axis=0)
+                    "Found %d bad epochs where delta_t != estimated delta_t of %d ms or samples are missing. Bad epochs "
+                    "will be removed!" % (len(self._bad_epoch_indices), self._delta_t))
 
-            self._timestamps = timestamps_ms
+            # only the epoch start timestamps are kept, the full resolution timestamps are not needed anymore
+            self._epoch_timestamps = timestamps_ms[np.minimum(first_sample, n_samples - 1)]
+            self._epoch_timestamps = self._epoch_timestamps + self._delta_t * np.maximum(first_sample - n_samples + 1, 0)
+            self._timestamps = self._epoch_timestamps[self._valid_epochs]
 
-        self._n_samples_per_epoch = n_samples_per_epoch
+    @property
+    def n_samples_per_epoch(self):
+        return self._n_samples_per_epoch
+
+    @property
+    def n_samples_per_hop(self):
+        return self._n_samples_per_hop
+
+    @property
+    def context_samples(self):
+        """
+        :return: number of samples an epoch extends beyond the start of the next epoch (needed by ChunkedComposition)
+        """
+        return max(self._n_samples_per_epoch - self._n_samples_per_hop, 0)
+
+    @property
+    def defers_bad_epoch_removal(self):
+        return self._defer_bad_epoch_removal
 
     @property
     def timestamps(self):
         """
-        :return: epoch start timestamps if a timestamp sequence was provided
+        :return: epoch start timestamps of the valid epochs if a timestamp sequence was provided (restricted to the
+        current chunk during chunked execution)
         """
         if self._timestamps is None:
             raise ValueError("No timestamp sequence provided")
-        return self._timestamps[:, 0]
+        if self._chunk is None:
+            return self._timestamps
+        first_epoch, last_epoch = self._chunk_epoch_range()
+        return self._epoch_timestamps[first_epoch:last_epoch][self._valid_epochs[first_epoch:last_epoch]]
+
+    @property
+    def valid_epochs(self):
+        """
+        :return: boolean mask of the epochs returned by process (all True unless bad epoch removal is deferred)
+        """
+        if self._timestamps is None:
+            return None
+        first_epoch, last_epoch = (0, self._n_epochs) if self._chunk is None else self._chunk_epoch_range()
+        if self._defer_bad_epoch_removal:
+            return self._valid_epochs[first_epoch:last_epoch]
+        return np.ones(np.count_nonzero(self._valid_epochs[first_epoch:last_epoch]), dtype=bool)
+
+    def begin_chunk(self, chunk):
+        if chunk.start % self._n_samples_per_hop != 0:
+            raise ValueError("Chunk start %d is not aligned to epochs starting every %d samples" %
+                             (chunk.start, self._n_samples_per_hop))
+        if self._partial_epochs == "pad":
+            raise ValueError("Padding of partial epochs is not supported in chunked execution")
+        self._chunk = chunk
+
+    def end_chunks(self):
+        self._chunk = None
+
+    def _count_epochs(self, n_samples):
+        if n_samples < self._n_samples_per_epoch:
+            n_complete, n_covering = 0, int(n_samples > 0)
+        else:
+            n_complete = (n_samples - self._n_samples_per_epoch) // self._n_samples_per_hop + 1
+            n_covering = -(-(n_samples - self._n_samples_per_epoch) // self._n_samples_per_hop) + 1
+        if n_covering > n_complete and self._partial_epochs == "error":
+            raise ValueError("%d samples cannot be split into complete epochs of %d samples every %d samples" %
+                             (n_samples, self._n_samples_per_epoch, self._n_samples_per_hop))
+        return n_covering if self._partial_epochs == "pad" else n_complete
+
+    def _chunk_epoch_range(self):
+        """
+        :return: indices of the first and last (exclusive) epoch starting inside the current chunk
+        """
+        hop = self._n_samples_per_hop
+        first_epoch = self._chunk.start // hop
+        n_available = self._chunk.stop + self._chunk.padding_after
+        last_epoch = min(-(-self._chunk.stop // hop), (n_available - self._n_samples_per_epoch) // hop + 1)
+        if self._timestamps is not None:
+            last_epoch = min(last_epoch, self._n_epochs)
+        return first_epoch, max(last_epoch, first_epoch)
+
+    def _windows(self, d, n_epochs):
+        """
+        :return: view of the samples (last axis) of d split into n_epochs windows
+        """
+        n_required = (n_epochs - 1) * self._n_samples_per_hop + self._n_samples_per_epoch if n_epochs > 0 else 0
+        if d.shape[-1] < n_required:
+            d = np.pad(d, [(0, 0)] * (d.ndim - 1) + [(0, n_required - d.shape[-1])], mode="edge")
+        if self._n_samples_per_hop == self._n_samples_per_epoch:
+            return d[..., :n_required].reshape(d.shape[:-1] + (n_epochs, self._n_samples_per_epoch))
+        return np.lib.stride_tricks.as_strided(
+            d, shape=d.shape[:-1] + (n_epochs, self._n_samples_per_epoch),
+            strides=d.strides[:-1] + (d.strides[-1] * self._n_samples_per_hop, d.strides[-1]), writeable=False)
 
     def process(self, *data: Sequence):
         """
-        :param data: sequences of floating point values. Should be either np.array or pd.Series
+        :param data: sequences of floating point values. Should be either np.array or pd.Series, or a Signal
         :return: reshaped sequences into 2d arrays where rows correspond to epochs and columns to the respective values
+        (a Signal of shape (n_axes, n_epochs, n_samples_per_epoch) for Signal input)
         """
-        r = []
-        for d in data:
-            if isinstance(d, pd.Series):
-                d = d.to_numpy()
-            d = d.reshape(-1, self._n_samples_per_epoch)
-            if self._timestamps is not None:
-                d = np.delete(d, self._bad_epoch_indices, axis=0)
+        if is_signal(data):
+            return data[0].with_data(self._epochs(data[0].data)),
+        return tuple([self._epochs(d.to_numpy() if isinstance(d, pd.Series) else d) for d in data])
 
-            r.append(d.reshape(-1, self._n_samples_per_epoch))
-        return tuple(r)
+    def _epochs(self, d):
+        d, valid = self.windows(d)
+        if valid is not None and not self._defer_bad_epoch_removal and not np.all(valid):
+            d = d[..., valid, :]
+        return d
+
+    def windows(self, d):
+        """
+        :param d: samples (last dimension) of a single or of stacked axes
+        :return: epoch views of the data (or current chunk) including bad epochs and the mask of the valid epochs (None
+        if no timestamps were provided)
+        """
+        if self._chunk is not None:
+            # cut off the padding that was only needed by the preceding filters
+            first_epoch, last_epoch = self._chunk_epoch_range()
+            d = self._windows(d[..., self._chunk.padding_before:], last_epoch - first_epoch)
+            valid = None if self._timestamps is None else self._valid_epochs[first_epoch:last_epoch]
+        else:
+            n_epochs = self._count_epochs(d.shape[-1])
+            if self._timestamps is not None and n_epochs != self._n_epochs:
+                raise ValueError("Got %d epochs but %d epochs according to the timestamps" %
+                                 (n_epochs, self._n_epochs))
+            d = self._windows(d, n_epochs)
+            valid = None if self._timestamps is None else self._valid_epochs
+        return d, valid
+
+
+def _fft_kwargs(workers):
+    return {"workers": workers} if _FFT_SUPPORTS_WORKERS else {}
 
 
 class Dft1d(DataProcessor):
 
-    def __init__(self, name=None):
+    def __init__(self, workers=-1, name=None):
+        """
+        :param workers: number of threads used per transform (-1 uses all CPUs, ignored for scipy < 1.4)
+        :param name:
+        """
+        super().__init__(name)
+        self._workers = workers
+
+    def process(self, *data):
+        if is_signal(data):
+            return data[0].with_data(self._fft(data[0].data)),
+        return tuple([self._fft(d) for d in data])
+
+    def _fft(self, d):
+        # scipy.fftpack and numpy promote single precision input to complex128
+        dtype = np.result_type(np.asarray(d).dtype, np.complex64)
+        return fft(d, axis=-1, **_fft_kwargs(self._workers)).astype(dtype, copy=False)
+
+
+class OneSidedPowerSpectrum(object):
+    """
+    Power spectrum |X_k|^2 of real valued epochs restricted to the non-negative frequencies. The weights count how often
+    each bin occurs in the full (two-sided) spectrum, so weighted sums equal sums over the full spectrum.
+    """
+
+    def __init__(self, power, n_samples):
+        """
+        :param power: array whose last dimension corresponds to the frequency bins 0..n_samples//2 (2d with one row per
+        epoch, or 3d with the axes as first dimension)
+        :param n_samples: number of samples per epoch of the transformed signal
+        """
+        self.power = power
+        self.n_samples = n_samples
+        self.weights = np.full(power.shape[-1], 2, dtype=power.dtype)
+        self.weights[0] = 1
+        if n_samples % 2 == 0:
+            self.weights[-1] = 1
+
+    @property
+    def shape(self):
+        return self.power.shape
+
+
+class PowerSpectrum(DataProcessor):
+
+    def __init__(self, workers=-1, name=None):
+        """
+        Computes the one-sided power spectrum of real valued epochs with a real FFT (single precision is kept for
+        float32 input). It can be shared by all spectral features (TotalEnergy, SpectralEntropy) which then yield the
+        same values as when computed from the full Dft1d spectrum.
+        :param workers: number of threads used per transform (-1 uses all CPUs, ignored for scipy < 1.4)
+        :param name:
+        """
         super().__init__(name)
+        self._workers = workers
 
     def process(self, *data):
-        return tuple([fft(d) for d in data])
+        if is_signal(data):
+            assert data[0].data.ndim == 3, "Operations are only defined on an epoched Signal"
+            return data[0].with_data(power_spectrum(data[0].data, self._workers)),
+        r = []
+        for d in data:
+            assert len(d.shape) == 2, "Operations are only defined on an Epoch 2d array"
+            r.append(power_spectrum(d, self._workers))
+        return tuple(r)
+
+
+def power_spectrum(d, workers=-1):
+    """
+    :param d: real valued epochs (last dimension)
+    :param workers: number of threads used per transform (see PowerSpectrum)
+    :return: OneSidedPowerSpectrum of the epochs
+    """
+    spectrum = rfft(d, axis=-1, **_fft_kwargs(workers))
+    # numpy.fft (the fallback for scipy < 1.4) promotes single precision input to complex128
+    spectrum = spectrum.astype(np.result_type(d.dtype, np.complex64), copy=False)
+    power = np.square(spectrum.real)
+    power += np.square(spectrum.imag)
+    return OneSidedPowerSpectrum(power, d.shape[-1])
 
 
 class VectorMagnitude(DataProcessor):
 
     def process(self, *data):
+        if is_signal(data):
+            return data[0].with_data(np.sqrt(self._sum_of_squares(data[0].data))[np.newaxis], axes=("magnitude",)),
         if len(data) != 3:
             warnings.warn("Expected three arrays corresponding to x, y, z axis. Result might not be as expected!")
-            # the generic calculation is at least an order of magnitude slower
-            return self._calc_generic_vector_norm(data)
-        else:
-            squared = self._square(data)
-            return (np.sqrt(squared[0] + squared[1] + squared[2]),)
-
-    def _calc_generic_vector_norm(self, data):
-        return (np.sqrt(np.sum(self._square(data), axis=0)),)
+        return (np.sqrt(self._sum_of_squares(data)),)
 
-    def _square(self, data):
-        return np.array([np.power(d, 2) for d in data])
+    def _sum_of_squares(self, data):
+        total = np.square(np.asarray(data[0]))
+        for d in data[1:]:
+            total += np.square(np.asarray(d))
+        return total
 
 
 class EuclideanNormMinusOne(VectorMagnitude):
 
     def process(self, *data):
         norm = super().process(*data)[0]
+        if is_signal(data):
+            norm_minus_one = norm.data
+            norm_minus_one -= 1
+            np.maximum(norm_minus_one, 0, out=norm_minus_one)
+            return norm.with_data(norm_minus_one, axes=("enmo",)),
         norm_minus_one = norm - 1
         norm_minus_one[norm_minus_one < 0] = 0
         return (norm_minus_one,)
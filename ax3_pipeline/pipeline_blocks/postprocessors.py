@@ -1,23 +1,94 @@
 from .base import *
 import pandas as pd
 import numpy as np
-from typing import Tuple, Dict, Sequence
+from collections import namedtuple
+from typing import Tuple
 
-from ..util import merge_intervals_with_short_interruptions
+from .misc import EpochGenerator
+from ..daily_features import day_index
+from ..storage import write_features, EPOCH_TABLE
+from ..util import find_runs, merge_runs_with_short_interruptions, runs_to_mask
 
 
 class FeatureConcat(DataProcessor):
 
     def __init__(self, epoch_timestamps_ms, name=None):
+        """
+        :param epoch_timestamps_ms: epoch start timestamps or the EpochGenerator providing them, the latter is required
+        for chunked execution as the timestamps are then looked up at processing time
+        :param name:
+        """
         super().__init__(name)
         self._timestamps = epoch_timestamps_ms
 
+    @property
+    def timestamps(self):
+        if isinstance(self._timestamps, EpochGenerator):
+            return self._timestamps.timestamps
+        return self._timestamps
+
+    def begin_chunk(self, chunk):
+        if not isinstance(self._timestamps, EpochGenerator):
+            raise ValueError("FeatureConcat must be constructed with the EpochGenerator instance (instead of its "
+                             "timestamps) for chunked execution")
+
     def process(self, *data: pd.Series):
         df = pd.concat([*data], axis=1)
-        df.index = pd.to_datetime(self._timestamps, unit="ms")
+        if isinstance(self._timestamps, EpochGenerator) and self._timestamps.defers_bad_epoch_removal:
+            # bad epochs were kept as part of the (zero-copy) epoch views and are only dropped here
+            df = df[self._timestamps.valid_epochs]
+        df.index = pd.to_datetime(self.timestamps, unit="ms")
         return (df,)
 
 
+class SelectColumns(DataProcessor):
+
+    def __init__(self, columns, name=None):
+        """
+        Restricts the epoch DataFrame to the given columns (see DataProcessorComposition.select_features).
+        :param columns: names of the columns in output order
+        :param name:
+        """
+        super().__init__(name)
+        self._columns = list(columns)
+
+    def required_columns(self, columns):
+        return set(self._columns)
+
+    def process(self, *data: pd.DataFrame) -> Tuple[pd.DataFrame]:
+        assert len(data) == 1, "Expected exactly one epoch DataFrame"
+        missing = [c for c in self._columns if c not in data[0].columns]
+        if missing:
+            raise ValueError("Columns %s are not computed by the pipeline" % missing)
+        return (data[0][self._columns],)
+
+
+class ParquetSink(DataProcessor):
+
+    def __init__(self, root, participant_id, table=EPOCH_TABLE, tz=None, day_start_hour=0, name=None):
+        """
+        Companion of FeatureConcat that writes the epoch DataFrame to a columnar dataset partitioned by participant and
+        date (see storage.write_features) and passes it on unchanged.
+        :param root: root directory of the dataset
+        :param participant_id: participant identifier
+        :param table: name of the table
+        :param tz: time zone of the date partitions
+        :param day_start_hour: hour at which a date partition starts
+        :param name:
+        """
+        super().__init__(name)
+        self._root = root
+        self._participant_id = participant_id
+        self._table = table
+        self._tz = tz
+        self._day_start_hour = day_start_hour
+
+    def process(self, *data: pd.DataFrame) -> Tuple[pd.DataFrame]:
+        assert len(data) == 1, "Expected exactly one epoch DataFrame"
+        write_features(self._root, self._participant_id, data[0], self._table, self._tz, self._day_start_hour)
+        return data
+
+
 class NonWeartimeCalculator(DataProcessor):
 
     def __init__(
@@ -40,6 +111,10 @@ class NonWeartimeCalculator(DataProcessor):
         self._min_non_wear_interruption = min_non_wear_interruption_s
         self._remove = remove
 
+    def required_columns(self, columns):
+        # the still epochs are detected on the std of the (high-pass filtered) axes
+        return set(columns) | {"x_std", "y_std", "z_std"}
+
     def process(self, *data: pd.DataFrame) -> Tuple[pd.DataFrame]:
         """
         Calculate epochs as wear or non-wear based on a predefined mG threshold. If the SD in none of the three axes
@@ -57,32 +132,211 @@ class NonWeartimeCalculator(DataProcessor):
 
     @staticmethod
     def lable_non_weartime(e, min_duration=3600, max_std=13/1000, min_between_time_s=3600):
-        e['nw'] = np.where((e['x_std'] < max_std) & (e['y_std'] < max_std) &
-                           (e['z_std'] < max_std), True, False)
-        print(e.nw.head())
-        starts = e.index[(e['nw']) & (~e['nw'].shift(1).fillna(False))]
-        ends = e.index[(e['nw']) & (~e['nw'].shift(-1).fillna(False))]
+        """
+        Adds a 'nw' column that is NaN for non-wear epochs, otherwise it indicates whether the epoch was still. Still
+        segments lasting longer than min_duration are non-wear, non-wear segments interrupted by less than
+        min_between_time_s of wear time are merged (NOTE: after investigating on multiple persons it seems like these
+        short interruptions are often caused by external influences e.g. if someone puts something on a desk where the
+        accelerometer is placed). Runs in O(n) on integer indices.
+        :param e: datetime indexed epoch DataFrame with x_std, y_std and z_std columns (modified in place)
+        :param min_duration: minimum duration (in seconds) of a non-wear segment
+        :param max_std: maximum std (in g) of every axis for an epoch to be still
+        :param min_between_time_s: minimum wear time (in seconds) between non-wear segments
+        """
+        still = ((e['x_std'] < max_std) & (e['y_std'] < max_std) & (e['z_std'] < max_std)).to_numpy()
+        seconds = e.index.values.astype("datetime64[ns]").astype(np.int64) / 1e9
 
-        non_wear_intervals = [(start, end) for start, end in zip(starts, ends)
-                              if end > start + np.timedelta64(min_duration, 's')]
+        starts, ends = find_runs(still)
+        long_enough = (seconds[ends] - seconds[starts]) > min_duration
+        starts, ends = merge_runs_with_short_interruptions(
+            starts[long_enough], ends[long_enough], min_between_time_s, seconds)
 
-        if not non_wear_intervals:
-            return
+        e['nw'] = np.where(runs_to_mask(starts, ends, len(e)), np.nan, still)
 
-        valid_intervals = NonWeartimeCalculator._remove_short_interruptions(non_wear_intervals, min_between_time_s)
 
-        for episode in valid_intervals:
-            e.nw[episode[0]:episode[1]] = np.nan
+BoutDefinition = namedtuple("BoutDefinition", ["name", "columns", "min_duration_s", "max_interruption_fraction"])
+BoutDefinition.__doc__ = """
+name: class name of the bouts
+columns: indicator columns of the epoch DataFrame (see ActivityClasses), an epoch belongs to the class if any is set
+min_duration_s: minimum duration of a bout
+max_interruption_fraction: fraction of a bout that may consist of epochs of other classes (or missing epochs)
+"""
 
-    @staticmethod
-    def _remove_short_interruptions(non_wear_intervals: Sequence[Tuple[pd.Timestamp, pd.Timestamp]],
-                                    min_weartime_time: int) -> Dict[Tuple[pd.Timestamp, pd.Timestamp], None]:
-        """
-        Basically merges non-wear intervals interleaved with short wear-time segments to remove too short wear-time
-        intervals (NOTE: after investigating on multiple persons it seems like these are often caused by external
-        influences e.g. if someone puts something on a desk where the accelerometer is placed.
-        :param non_wear_intervals:
-        :param min_weartime_time: minimal weartime (in seconds) for an interleaved non-wear semgent to be left unchanged.
-        :return:
+# guideline MVPA bouts of at least 10 minutes with up to 20% interruptions, uninterrupted sedentary bouts of at least
+# one minute (for bout length distributions)
+DEFAULT_BOUTS = (
+    BoutDefinition("mvpa", ("moderate", "vigorous"), 600, 0.2),
+    BoutDefinition("sedentary", ("sedentary",), 60, 0.),
+)
+
+BoutResult = namedtuple("BoutResult", ["bouts", "daily"])
+BoutResult.__doc__ = """
+bouts: bout table (see find_bouts)
+daily: per-day bout summaries (see daily_bout_summary)
+"""
+
+
+class ActivityBouts(DataProcessor):
+
+    def __init__(self, definitions=DEFAULT_BOUTS, epoch_length_s=None, tz=None, day_start_hour=0, name=None):
         """
-        merge_intervals_with_short_interruptions(non_wear_intervals, min_weartime_time)
+        Detects activity bouts (see find_bouts) in the epoch DataFrame, which is passed on unchanged. The bout table and
+        the per-day summaries of the last processed DataFrame are available as result.
+        :param definitions: sequence of BoutDefinition
+        :param epoch_length_s: duration of an epoch, estimated from the index if None
+        :param tz: time zone the day boundaries refer to (see daily_features.day_index)
+        :param day_start_hour: hour at which a day starts
+        :param name:
+        """
+        super().__init__(name)
+        self._definitions = tuple(definitions)
+        self._epoch_length_s = epoch_length_s
+        self._tz = tz
+        self._day_start_hour = day_start_hour
+        self._result = None
+
+    @property
+    def result(self):
+        """
+        :return: BoutResult of the last processed DataFrame (None before processing)
+        """
+        return self._result
+
+    def process(self, *data: pd.DataFrame) -> Tuple[pd.DataFrame]:
+        assert len(data) == 1, "Expected exactly one epoch DataFrame"
+        assert isinstance(data[0].index, pd.DatetimeIndex), "Expected datetime indexed DataFrame"
+        bouts = find_bouts(data[0], self._definitions, self._epoch_length_s)
+        days = day_index(data[0].index, self._tz, self._day_start_hour).unique()
+        self._result = BoutResult(bouts, daily_bout_summary(bouts, days, self._definitions, self._tz,
+                                                            self._day_start_hour))
+        return data
+
+
+def find_bouts(acc_epoch_df, definitions=DEFAULT_BOUTS, epoch_length_s=None):
+    """
+    Bout detection in O(n): runs of epochs of a class (split at missing epochs) are merged from left to right. The next
+    run is joined if the interruption before it is at most max_interruption_fraction * min_duration_s long and the
+    joined run still spends at least 1 - max_interruption_fraction of its duration in the class, otherwise a new
+    candidate starts with it. Candidates lasting at least min_duration_s are bouts.
+    :param acc_epoch_df: datetime indexed (sorted) epoch DataFrame with the indicator columns of the definitions
+    :param definitions: sequence of BoutDefinition
+    :param epoch_length_s: duration of an epoch, estimated from the index if None
+    :return: DataFrame with one row per bout: start, end (exclusive), class, duration_s and the fraction of the
+    duration spent in the class, sorted by start
+    """
+    seconds = acc_epoch_df.index.values.astype("datetime64[ns]").astype(np.int64) / 1e9
+    if epoch_length_s is None:
+        epoch_length_s = float(np.median(np.diff(seconds))) if len(seconds) > 1 else 0.
+    # a new segment starts after missing epochs
+    continuous = np.diff(seconds) <= epoch_length_s
+
+    tables = []
+    for definition in definitions:
+        mask = np.zeros(len(acc_epoch_df), dtype=bool)
+        for column in definition.columns:
+            mask |= acc_epoch_df[column].to_numpy() > 0
+        starts, ends = _find_continuous_runs(mask, continuous)
+
+        n_in_class = np.concatenate([[0], np.cumsum(mask)])
+        max_interruption_s = definition.max_interruption_fraction * definition.min_duration_s
+        starts, ends = _merge_bout_runs(starts, ends, seconds, n_in_class, epoch_length_s, max_interruption_s,
+                                        1 - definition.max_interruption_fraction)
+
+        duration = seconds[ends] - seconds[starts] + epoch_length_s
+        fraction = (n_in_class[ends + 1] - n_in_class[starts]) * epoch_length_s / np.maximum(duration, 1e-9)
+        bout = duration >= definition.min_duration_s
+        tables.append(pd.DataFrame({
+            "start": acc_epoch_df.index[starts[bout]],
+            "end": acc_epoch_df.index[ends[bout]] + pd.Timedelta(seconds=epoch_length_s),
+            "class": definition.name,
+            "duration_s": duration[bout],
+            "fraction": fraction[bout]}))
+
+    bouts = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(
+        columns=["start", "end", "class", "duration_s", "fraction"])
+    bouts["class"] = pd.Categorical(bouts["class"], categories=[d.name for d in definitions])
+    return bouts.sort_values(["start", "class"], kind="stable").reset_index(drop=True)
+
+
+def _merge_bout_runs(starts, ends, seconds, n_in_class, epoch_length_s, max_interruption_s, min_fraction):
+    """
+    Greedy left to right merge of the runs (see find_bouts), every merged run satisfies the fraction condition.
+    Unlike util.merge_runs_with_short_interruptions, whether a run is joined does not only depend on the interruption
+    before it but also on the start of the candidate it would extend, which is the result of the previous decisions. A
+    chain of runs separated by short interruptions is therefore checked against the start of the chain at once, only the
+    runs following a failed check in the same chain (which starts a new candidate) are decided sequentially.
+    :param n_in_class: prefix sums of the class mask (length n + 1)
+    :return: starts and ends (inclusive) of the merged runs
+    """
+    def fraction_holds(first, last):
+        in_class_s = (n_in_class[ends[last] + 1] - n_in_class[starts[first]]) * epoch_length_s
+        duration = seconds[ends[last]] - seconds[starts[first]] + epoch_length_s
+        return in_class_s >= min_fraction * duration - 1e-6
+
+    # positions differ by the interruption plus one epoch
+    joinable = seconds[starts[1:]] - seconds[ends[:-1]] <= max_interruption_s + epoch_length_s + 1e-6
+    if not np.any(joinable):
+        return starts, ends
+
+    index = np.arange(len(starts))
+    chain_start = np.concatenate([[True], ~joinable])
+    chain_first = np.maximum.accumulate(np.where(chain_start, index, 0))
+    joined = ~chain_start & fraction_holds(chain_first, index)
+
+    # runs after a failed check within their chain belong to a candidate starting at or after the failed run
+    last_failure = np.maximum.accumulate(np.where(~chain_start & ~joined, index, -1))
+    sequential = np.flatnonzero(~chain_start[1:] & (last_failure[:-1] >= chain_first[1:])) + 1
+    if len(sequential) > 0:
+        # plain Python scalars, indexing numpy arrays element-wise is considerably slower
+        in_class_before, in_class_until = n_in_class[starts].tolist(), n_in_class[ends + 1].tolist()
+        start_s, end_s, joined_list = seconds[starts].tolist(), seconds[ends].tolist(), joined.tolist()
+        first = 0
+        for i in sequential.tolist():
+            if not joined_list[i - 1]:
+                first = i - 1
+            in_class_s = (in_class_until[i] - in_class_before[first]) * epoch_length_s
+            duration = end_s[i] - start_s[first] + epoch_length_s
+            joined_list[i] = in_class_s >= min_fraction * duration - 1e-6
+        joined = np.array(joined_list)
+    return starts[~joined], ends[np.append(~joined[1:], True)]
+
+
+def _find_continuous_runs(mask, continuous):
+    """
+    find_runs that additionally ends runs where consecutive rows are not continuous (missing epochs).
+    :param continuous: whether each row is continuous with the following one (length len(mask) - 1)
+    """
+    if np.all(continuous):
+        return find_runs(mask)
+    joined = mask[:-1] & mask[1:] & continuous
+    first = mask.copy()
+    first[1:] &= ~joined
+    last = mask.copy()
+    last[:-1] &= ~joined
+    return np.flatnonzero(first), np.flatnonzero(last)
+
+
+def daily_bout_summary(bouts, days, definitions=DEFAULT_BOUTS, tz=None, day_start_hour=0):
+    """
+    :param bouts: bout table (see find_bouts), bouts are assigned to the day they start on
+    :param days: day labels (see daily_features.day_index) that are reported, also if they contain no bouts
+    :param definitions: the definitions of the bouts
+    :param tz: time zone the day boundaries refer to
+    :param day_start_hour: hour at which a day starts
+    :return: DataFrame indexed by day with count, total, mean and max duration (in seconds) of the bouts of every class
+    """
+    days = pd.DatetimeIndex(days).sort_values()
+    day = day_index(pd.DatetimeIndex(bouts["start"]), tz, day_start_hour)
+    grouped = bouts["duration_s"].astype(np.float64).groupby([day, bouts["class"].astype(str)]).agg(
+        ["count", "sum", "mean", "max"])
+
+    summary = pd.DataFrame(index=days)
+    for definition in definitions:
+        values = grouped.xs(definition.name, level=1) if definition.name in grouped.index.get_level_values(1) \
+            else pd.DataFrame(columns=["count", "sum", "mean", "max"], dtype=np.float64)
+        values = values.reindex(days)
+        summary[definition.name + "_bout_count"] = values["count"].fillna(0).astype(np.int64)
+        summary[definition.name + "_bout_duration_s"] = values["sum"].fillna(0.)
+        summary[definition.name + "_mean_bout_duration_s"] = values["mean"]
+        summary[definition.name + "_max_bout_duration_s"] = values["max"]
+    return summary
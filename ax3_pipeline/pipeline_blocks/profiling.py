@@ -0,0 +1,245 @@
+import json
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import base
+from .signals import Signal
+
+
+class ProfileRecord(object):
+    """
+    Measurements of a single processor call. Times are in seconds, memory in bytes.
+    """
+
+    __slots__ = ("name", "path", "depth", "thread_id", "start", "wall_time", "cpu_time", "input_shapes",
+                 "input_dtypes", "output_shapes", "output_dtypes", "output_bytes", "memory_delta", "peak_memory_delta",
+                 "_cpu_start", "_memory_start", "_peak", "_parent", "_processor", "_child_calls", "_child_indices")
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__ if not k.startswith("_")}
+
+
+class Profiler(object):
+    """
+    Records wall time, CPU time (of the calling thread), input/output shapes and dtypes, output size and (optionally)
+    memory deltas of every processor call inside the with block:
+
+        with Profiler(trace_memory=True) as profiler:
+            pipeline.process(x, y, z)
+        profiler.summary()
+        profiler.to_chrome_trace("trace.json")  # open in chrome://tracing or https://ui.perfetto.dev
+
+    Calls are identified by their path, the position of every enclosing call within its parent composition and the
+    processor name (e.g. 0_SequentialComposition/2_ParallelComposition/0_SequentialComposition/1_EpochGenerator), so
+    equally named processors in different branches are kept apart. Memory is measured with tracemalloc (numpy reports
+    its allocations to it), which slows down execution. With concurrent execution (executor) the memory deltas of
+    overlapping calls cannot be separated. When no profiler is active the hook only checks a global variable.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: whether to record allocated and peak memory (using tracemalloc)
+        """
+        self._trace_memory = trace_memory
+        self._started_tracemalloc = False
+        self._records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._root_indices = {}
+        self._t0 = None
+
+    @property
+    def records(self):
+        return list(self._records)
+
+    def __enter__(self):
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._t0 = time.perf_counter()
+        base.set_profiler(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        base.set_profiler(None)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def bind(self, function):
+        """
+        :return: function whose calls are recorded below the currently profiled call of this thread, also if it is
+        executed on another thread (e.g. a task submitted to an executor, see base.map_with_executor)
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        if parent is None:
+            return function
+
+        def bound(*args, **kwargs):
+            task_stack = self._stack()
+            if task_stack and task_stack[-1] is parent:
+                return function(*args, **kwargs)
+            task_stack.append(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                task_stack.pop()
+        return bound
+
+    def _child_index(self, parent, processor):
+        """
+        :return: position of the processor within the parent composition, processors called by other processors (e.g.
+        the nodes of a ProcessingGraph) and top level calls are numbered in order of their first call
+        """
+        with self._lock:
+            if parent is None:
+                return self._root_indices.setdefault(id(processor), len(self._root_indices))
+            positions = [i for i, p in enumerate(getattr(parent._processor, "_processors", ())) if p is processor]
+            if positions:
+                # a processor used several times in the same composition is called once per position
+                n_calls = parent._child_calls.get(id(processor), 0)
+                parent._child_calls[id(processor)] = n_calls + 1
+                return positions[n_calls % len(positions)]
+            return parent._child_indices.setdefault(id(processor), len(parent._child_indices))
+
+    def start(self, processor, data):
+        stack = self._stack()
+        record = ProfileRecord()
+        record.name = processor.name
+        record._parent = stack[-1] if stack else None
+        record._processor, record._child_calls, record._child_indices = processor, {}, {}
+        element = "%d_%s" % (self._child_index(record._parent, processor), processor.name)
+        record.path = element if record._parent is None else record._parent.path + "/" + element
+        record.depth = 0 if record._parent is None else record._parent.depth + 1
+        record.thread_id = threading.get_ident()
+        record.input_shapes, record.input_dtypes, _ = _describe_all(data)
+        if self._trace_memory:
+            record._memory_start, record._peak = tracemalloc.get_traced_memory()[0], 0
+            tracemalloc.reset_peak()
+        stack.append(record)
+        record._cpu_start = time.thread_time()
+        record.start = time.perf_counter() - self._t0
+        return record
+
+    def stop(self, record, result):
+        record.wall_time = time.perf_counter() - self._t0 - record.start
+        record.cpu_time = time.thread_time() - record._cpu_start
+        self._stack().pop()
+        record._processor = record._child_calls = record._child_indices = None
+
+        if self._trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # nested calls reset the tracemalloc peak, their peaks are propagated to the parent instead
+            record._peak = max(record._peak, peak)
+            record.memory_delta = current - record._memory_start
+            record.peak_memory_delta = record._peak - record._memory_start
+            if record._parent is not None:
+                record._parent._peak = max(record._parent._peak, record._peak)
+        else:
+            record.memory_delta = record.peak_memory_delta = None
+
+        outputs = result if isinstance(result, tuple) else () if result is None else (result,)
+        record.output_shapes, record.output_dtypes, record.output_bytes = _describe_all(outputs)
+        self._records.append(record)
+
+    def to_frame(self):
+        """
+        :return: DataFrame with one row per recorded processor call (in order of completion)
+        """
+        return pd.DataFrame([r.as_dict() for r in self._records])
+
+    def summary(self):
+        """
+        :return: DataFrame with the aggregated measurements per processor path, sorted by total wall time
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        aggregations = {"name": "first", "wall_time": ["count", "sum", "mean"], "cpu_time": "sum",
+                        "output_bytes": "sum", "memory_delta": "sum", "peak_memory_delta": "max"}
+        summary = df.groupby("path").agg(aggregations)
+        summary.columns = ["name", "calls", "wall_time", "mean_wall_time", "cpu_time", "output_bytes", "memory_delta",
+                           "peak_memory_delta"]
+        return summary.sort_values("wall_time", ascending=False)
+
+    def to_chrome_trace(self, path=None):
+        """
+        :param path: optional file path the JSON trace is written to
+        :return: trace in the Chrome trace event format
+        """
+        events = []
+        for r in self._records:
+            args = {k: v for k, v in r.as_dict().items() if k not in ("name", "start", "wall_time", "thread_id")}
+            events.append({"name": r.name, "cat": "DataProcessor", "ph": "X", "ts": r.start * 1e6,
+                           "dur": r.wall_time * 1e6, "pid": 0, "tid": r.thread_id, "args": args})
+        trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(trace, f, default=str)
+        return trace
+
+
+def _describe(d):
+    """
+    :return: shape, dtype and size in bytes of an array-like (None shape for unknown types)
+    """
+    if isinstance(d, Signal):
+        d = d.data
+    if hasattr(d, "power"):
+        d = d.power
+    if isinstance(d, pd.DataFrame):
+        dtypes = sorted({str(t) for t in d.dtypes})
+        return d.shape, dtypes[0] if len(dtypes) == 1 else ",".join(dtypes), int(d.memory_usage(index=False).sum())
+    if isinstance(d, (np.ndarray, pd.Series)):
+        return d.shape, str(d.dtype), int(d.nbytes)
+    return None, type(d).__name__, 0
+
+
+def _describe_all(data):
+    described = [_describe(d) for d in data]
+    return [d[0] for d in described], [d[1] for d in described], sum(d[2] for d in described)
+
+
+def _buffers(d):
+    """
+    :return: (key, size in bytes) of the memory held by d, views are resolved to the array owning the memory
+    """
+    if isinstance(d, Signal):
+        d = d.data
+    if hasattr(d, "power"):
+        d = d.power
+    if isinstance(d, pd.DataFrame):
+        return [(id(d), int(d.memory_usage(index=False).sum()))]
+    if isinstance(d, pd.Series):
+        d = d.to_numpy()
+    if not isinstance(d, np.ndarray):
+        return []
+    root = d
+    while True:
+        if isinstance(root.base, np.ndarray):
+            root = root.base
+        elif isinstance(getattr(root.base, "base", None), np.ndarray):
+            # as_strided views are based on an intermediate object exposing the array interface
+            root = root.base.base
+        else:
+            break
+    return [(id(root), int(root.nbytes))]
+
+
+def held_bytes(data):
+    """
+    :param data: sequence of outputs (arrays, Signals, spectra, Series or DataFrames)
+    :return: bytes of memory held by the data, arrays sharing memory (views, epochs) are counted once
+    """
+    return sum(dict(b for d in data for b in _buffers(d)).values())
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from .base import *
+from .signals import Signal, is_signal
+
+
+class Resampler(DataProcessor):
+
+    def __init__(self, timestamps_ms, sampling_frequency=100, max_gap_ms=100, n_samples_per_chunk=720 * 500,
+                 name=None):
+        """
+        Linearly interpolates irregularly sampled signals (drift, jitter, single missing samples) onto an exact uniform
+        grid starting at the first timestamp. Grid samples inside gaps longer than max_gap_ms are interpolated as well
+        (so the filters see a continuous signal) but marked as missing, EpochGenerator then marks the epochs containing
+        them as bad instead of joining the data before and after the gap:
+
+            resampler = Resampler(timestamps_ms)
+            epoch_gen = EpochGenerator(resampler.timestamps, missing_samples=resampler.missing_samples)
+            SequentialComposition(resampler, LowpassButterworthFilter(), ...)
+
+        The grid is computed chunk by chunk, only the resampled output has the full length. Within a ChunkedComposition
+        (whose chunks refer to the grid) the inputs are resampled lazily instead, chunk by chunk without any full length
+        copy:
+
+            ChunkedComposition(LowpassButterworthFilter(), ..., epoch_gen, ...).process(*resampler.lazy(x, y, z))
+
+        Repeated timestamps are allowed, the last of their samples is used.
+        :param timestamps_ms: (non-decreasing) POSIX timestamps with millisecond precision of the input samples
+        :param sampling_frequency: sampling frequency of the grid (Hz), the sample interval has to be an integer number
+        of milliseconds
+        :param max_gap_ms: intervals between input samples above this value are gaps
+        :param n_samples_per_chunk: number of grid samples interpolated at once (bounds temporary arrays)
+        :param name:
+        """
+        super().__init__(name)
+        if isinstance(timestamps_ms, pd.Series):
+            timestamps_ms = timestamps_ms.to_numpy()
+        if not isinstance(timestamps_ms, np.ndarray):
+            raise TypeError("timestamp_ms must be either a numpy array or pandas Series, got: %s" % type(timestamps_ms))
+        if len(timestamps_ms) < 2:
+            raise ValueError("At least two samples are required for resampling")
+        delta_t = 1000 / sampling_frequency
+        if delta_t != int(delta_t):
+            raise ValueError("The sample interval of %s Hz is not an integer number of milliseconds" %
+                             sampling_frequency)
+        if n_samples_per_chunk < 1:
+            raise ValueError("n_samples_per_chunk must be positive, got: %d" % n_samples_per_chunk)
+
+        intervals = np.diff(timestamps_ms)
+        if np.any(intervals < 0):
+            raise ValueError("Timestamps must not decrease")
+
+        self._timestamps_ms = timestamps_ms
+        self._sampling_frequency = sampling_frequency
+        self._delta_t = int(delta_t)
+        self._max_gap_ms = max_gap_ms
+        self._n_samples_per_chunk = n_samples_per_chunk
+        self._start = int(np.ceil(timestamps_ms[0]))
+        self._n_samples = int((timestamps_ms[-1] - self._start) // self._delta_t) + 1
+
+        # only the grid index ranges of the gaps are kept (first and last grid sample inside of each gap)
+        gaps = np.flatnonzero(intervals > max_gap_ms)
+        self._gap_starts = np.floor((timestamps_ms[gaps] - self._start) / self._delta_t).astype(np.int64) + 1
+        self._gap_ends = np.ceil((timestamps_ms[gaps + 1] - self._start) / self._delta_t).astype(np.int64) - 1
+        non_empty = self._gap_starts <= self._gap_ends
+        self._gap_starts, self._gap_ends = self._gap_starts[non_empty], self._gap_ends[non_empty]
+
+    @property
+    def n_samples(self):
+        """
+        :return: number of samples of the resampled signals
+        """
+        return self._n_samples
+
+    @property
+    def timestamps(self):
+        """
+        :return: timestamps of the uniform grid (ms)
+        """
+        return self._start + np.arange(self._n_samples, dtype=np.int64) * self._delta_t
+
+    @property
+    def missing_samples(self):
+        """
+        :return: boolean mask of the grid samples inside of gaps
+        """
+        missing = np.zeros(self._n_samples + 1, dtype=np.int8)
+        np.add.at(missing, self._gap_starts, 1)
+        np.add.at(missing, self._gap_ends + 1, -1)
+        return np.cumsum(missing[:-1]) > 0
+
+    def lazy(self, *data):
+        """
+        :param data: arrays (or pd.Series, np.memmap) of the input samples
+        :return: ResampledArray of every input, the grid samples are only interpolated when they are sliced (e.g. by
+        ChunkedComposition)
+        """
+        return tuple(ResampledArray(self, d.to_numpy() if isinstance(d, pd.Series) else d) for d in data)
+
+    def process(self, *data):
+        if is_signal(data):
+            resampled, = self._resample([data[0].data])
+            return Signal(resampled, self._sampling_frequency, self._start, data[0].axes),
+        return tuple(self._resample([d.to_numpy() if isinstance(d, pd.Series) else np.asarray(d) for d in data]))
+
+    def _resample(self, arrays):
+        """
+        :param arrays: samples (last dimension) of single or of stacked axes, interpolation indices and weights are
+        shared by all arrays
+        """
+        for d in arrays:
+            if d.shape[-1] != len(self._timestamps_ms):
+                raise ValueError("Got %d samples but %d timestamps" % (d.shape[-1], len(self._timestamps_ms)))
+        out = [np.empty(d.shape[:-1] + (self._n_samples,), dtype=np.result_type(d.dtype, np.float32)) for d in arrays]
+        for start in range(0, self._n_samples, self._n_samples_per_chunk):
+            stop = min(start + self._n_samples_per_chunk, self._n_samples)
+            for o, r in zip(out, self._resample_range(arrays, start, stop)):
+                o[..., start:stop] = r
+        return out
+
+    def _resample_range(self, arrays, start, stop):
+        """
+        :return: grid samples start to stop (exclusive) of every array
+        """
+        t = self._timestamps_ms
+        grid = self._start + np.arange(start, stop, dtype=np.int64) * self._delta_t
+        # index of the last input sample at or before every grid sample
+        i = np.clip(np.searchsorted(t, grid, side="right") - 1, 0, len(t) - 2)
+        interval = t[i + 1] - t[i]
+        # the interval is only empty for a repeated last timestamp (at the last grid sample), which takes the last sample
+        w = np.divide(grid - t[i], interval, out=np.ones(len(grid)), where=interval > 0)
+        r = []
+        for d in arrays:
+            dtype = np.result_type(d.dtype, np.float32)
+            lower = d[..., i]
+            r.append(lower + w.astype(dtype, copy=False) * (d[..., i + 1] - lower))
+        return r
+
+
+class ResampledArray(object):
+    """
+    Lazily resampled input array (see Resampler.lazy), slices of it are interpolated on access.
+    """
+
+    def __init__(self, resampler, data):
+        if len(data) != len(resampler._timestamps_ms):
+            raise ValueError("Got %d samples but %d timestamps" % (len(data), len(resampler._timestamps_ms)))
+        self._resampler = resampler
+        self._data = data
+
+    @property
+    def dtype(self):
+        return np.result_type(self._data.dtype, np.float32)
+
+    @property
+    def shape(self):
+        return len(self),
+
+    def __len__(self):
+        return self._resampler.n_samples
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError("ResampledArray only supports slicing, got: %s" % type(item))
+        start, stop, step = item.indices(len(self))
+        if step != 1:
+            raise ValueError("ResampledArray only supports contiguous slices")
+        return self._resampler._resample_range([self._data], start, max(start, stop))[0]
+
+    def __array__(self, dtype=None):
+        return self[:] if dtype is None else self[:].astype(dtype)
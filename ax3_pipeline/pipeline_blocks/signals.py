@@ -0,0 +1,134 @@
+import numpy as np
+
+from .base import *
+
+
+class Signal(object):
+    """
+    Multi-axis signal held as a single contiguous array whose first dimension corresponds to the axes, i.e.
+    (n_axes, n_samples) for raw signals, (n_axes, n_epochs, n_samples_per_epoch) after epoching and (n_axes, n_epochs)
+    for per-epoch values. The data of a power spectrum is a OneSidedPowerSpectrum of such an array.
+
+    A block receiving a Signal processes all axes in one vectorized operation and returns a Signal (or the feature
+    Series/DataFrames), the tuple of per-axis arrays remains supported by all blocks (see StackAxes and UnstackAxes).
+    """
+
+    def __init__(self, data, sampling_frequency=100, start_time_ms=None, axes=("x", "y", "z")):
+        """
+        :param data: array whose first dimension corresponds to the axes
+        :param sampling_frequency: sampling frequency of the raw signal (Hz)
+        :param start_time_ms: POSIX timestamp (ms) of the first sample, optional
+        :param axes: axis labels, used as prefix of the feature names if there is more than one axis
+        """
+        if len(axes) != data.shape[0]:
+            raise ValueError("Got %d axis labels for %d axes" % (len(axes), data.shape[0]))
+        self.data = data
+        self.sampling_frequency = sampling_frequency
+        self.start_time_ms = start_time_ms
+        self.axes = tuple(axes)
+
+    @classmethod
+    def from_axes(cls, *data, sampling_frequency=100, start_time_ms=None, axes=("x", "y", "z")):
+        """
+        Stacks per-axis sequences (np.array or pd.Series) into one contiguous (n_axes, n_samples) array.
+        """
+        stacked = np.empty((len(data), len(data[0])), dtype=np.result_type(*[d.dtype for d in data]))
+        for i, d in enumerate(data):
+            stacked[i] = d
+        return cls(stacked, sampling_frequency, start_time_ms, axes[:len(data)])
+
+    def with_data(self, data, axes=None):
+        """
+        :return: Signal with the same sampling frequency and start time holding the new data
+        """
+        return Signal(data, self.sampling_frequency, self.start_time_ms, self.axes if axes is None else axes)
+
+    def as_tuple(self):
+        """
+        :return: tuple of per-axis arrays (views of the stacked data)
+        """
+        if hasattr(self.data, "power"):
+            # OneSidedPowerSpectrum
+            return tuple(type(self.data)(p, self.data.n_samples) for p in self.data.power)
+        return tuple(self.data)
+
+    @property
+    def n_axes(self):
+        return self.data.shape[0]
+
+    @property
+    def n_samples(self):
+        """
+        :return: number of samples of a raw signal (size of the last dimension)
+        """
+        return self.data.shape[-1]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    @property
+    def column_prefixes(self):
+        """
+        :return: prefix of the feature names of each axis (empty for a single axis)
+        """
+        return [""] if self.n_axes == 1 else [a + "_" for a in self.axes]
+
+    def slice_samples(self, start, stop):
+        """
+        :return: Signal holding the samples start..stop (exclusive) of a raw signal (a view)
+        """
+        start_time_ms = None if self.start_time_ms is None else \
+            self.start_time_ms + 1000. * start / self.sampling_frequency
+        return Signal(self.data[..., start:stop], self.sampling_frequency, start_time_ms, self.axes)
+
+    def __repr__(self):
+        return "Signal(shape=%s, dtype=%s, axes=%s)" % (self.shape, self.dtype, self.axes)
+
+
+def is_signal(data):
+    """
+    :return: whether the processor input (tuple) consists of a single Signal
+    """
+    return len(data) == 1 and isinstance(data[0], Signal)
+
+
+class StackAxes(DataProcessor):
+
+    def __init__(self, sampling_frequency=100, start_time_ms=None, axes=("x", "y", "z"), name=None):
+        """
+        Adapter converting per-axis arrays (the tuple interface) into a Signal.
+        :param sampling_frequency: sampling frequency of the signal (Hz)
+        :param start_time_ms: POSIX timestamp (ms) of the first sample, optional
+        :param axes: axis labels
+        :param name:
+        """
+        super().__init__(name)
+        self._sampling_frequency = sampling_frequency
+        self._start_time_ms = start_time_ms
+        self._axes = tuple(axes)
+
+    def process(self, *data):
+        if is_signal(data):
+            return data
+        return Signal.from_axes(*data, sampling_frequency=self._sampling_frequency,
+                                start_time_ms=self._start_time_ms, axes=self._axes),
+
+
+class UnstackAxes(DataProcessor):
+    """
+    Adapter converting a Signal into per-axis arrays (the tuple interface).
+    """
+
+    def process(self, *data):
+        if is_signal(data):
+            return data[0].as_tuple()
+        return data
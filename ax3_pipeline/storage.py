@@ -0,0 +1,99 @@
+"""
+Columnar (Parquet) storage of epoch and daily feature DataFrames.
+
+Datasets are partitioned by participant and date (hive layout: <root>/<table>/participant_id=<id>/date=<YYYY-MM-DD>/),
+so a new participant can be added without rewriting existing files and reading can be restricted to selected
+participants, dates and columns. Native dtypes (e.g. float32 features, int32 activity classes) are preserved, the
+DatetimeIndex is stored in the 'timestamp' column.
+
+Requires pyarrow (pip install ax3_pipeline[parquet]).
+"""
+import os
+import shutil
+
+import pandas as pd
+
+from .daily_features import day_index
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EPOCH_TABLE = "epochs"
+DAILY_TABLE = "daily"
+
+_PARTITIONING_SCHEMA = None if pa is None else pa.schema([("participant_id", pa.string()), ("date", pa.string())])
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for parquet storage, install it with: pip install pyarrow")
+
+
+def _participant_path(root, table, participant_id):
+    return os.path.join(root, table, "participant_id=%s" % participant_id)
+
+
+def write_features(root, participant_id, df: pd.DataFrame, table=EPOCH_TABLE, tz=None, day_start_hour=0):
+    """
+    Writes the (epoch or daily) feature DataFrame of a participant, an existing partition of the same participant is
+    replaced while all other participants remain untouched.
+    :param root: root directory of the dataset
+    :param participant_id: participant identifier
+    :param df: datetime indexed DataFrame
+    :param table: name of the table (e.g. EPOCH_TABLE or DAILY_TABLE)
+    :param tz: time zone of the date partitions (see daily_features.day_index)
+    :param day_start_hour: hour at which a date partition starts
+    :return: list of written files
+    """
+    _require_pyarrow()
+    assert isinstance(df.index, pd.DatetimeIndex), "Expected datetime indexed DataFrame"
+
+    participant_path = _participant_path(root, table, participant_id)
+    if os.path.exists(participant_path):
+        shutil.rmtree(participant_path)
+
+    files = []
+    df = df.rename_axis("timestamp").reset_index()
+    dates = day_index(pd.DatetimeIndex(df["timestamp"]), tz, day_start_hour).strftime("%Y-%m-%d")
+    for date, rows in df.groupby(dates.to_numpy(), sort=True):
+        path = os.path.join(participant_path, "date=%s" % date)
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, "part-0.parquet")
+        pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), file_path)
+        files.append(file_path)
+    return files
+
+
+def read_features(root, table=EPOCH_TABLE, columns=None, participants=None, start_date=None, end_date=None):
+    """
+    Reads (a subset of) a partitioned feature table, only the required files and columns are loaded.
+    :param root: root directory of the dataset
+    :param table: name of the table (e.g. EPOCH_TABLE or DAILY_TABLE)
+    :param columns: feature columns to read (defaults to all)
+    :param participants: participant identifiers to read (defaults to all)
+    :param start_date: first date partition to read (inclusive, str 'YYYY-MM-DD' or datetime-like)
+    :param end_date: last date partition to read (inclusive)
+    :return: DataFrame indexed by timestamp with additional 'participant_id' and 'date' (partition) columns
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(os.path.join(root, table), format="parquet",
+                         partitioning=ds.partitioning(_PARTITIONING_SCHEMA, flavor="hive"))
+
+    conditions = []
+    if participants is not None:
+        conditions.append(ds.field("participant_id").isin([str(p) for p in participants]))
+    if start_date is not None:
+        conditions.append(ds.field("date") >= pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+    if end_date is not None:
+        conditions.append(ds.field("date") <= pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    read_columns = None if columns is None else ["timestamp", "participant_id", "date", *columns]
+    df = dataset.to_table(columns=read_columns, filter=condition).to_pandas()
+    return df.set_index("timestamp")
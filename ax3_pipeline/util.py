@@ -1,5 +1,6 @@
 from typing import Dict, Tuple, Sequence
 
+import numpy as np
 import pandas as pd
 from scipy.stats import linregress
 
@@ -74,12 +75,55 @@ def merge_intervals_with_short_interruptions(timestamp_intervals: Sequence[Tuple
     return valid_intervals
 
 
+def find_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run-length encoding of the True values of a boolean mask in O(n).
+    :param mask: 1d boolean array
+    :return: start and (inclusive) end indices of all runs of True values
+    """
+    padded = np.concatenate([[False], np.asarray(mask, dtype=bool), [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[0::2], changes[1::2] - 1
+
+
+def merge_runs_with_short_interruptions(starts: np.ndarray, ends: np.ndarray, max_interruption_duration,
+                                        positions: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Integer index version of merge_intervals_with_short_interruptions: merges consecutive runs (as returned by
+    find_runs) if the interruption between them is shorter than max_interruption_duration.
+    :param starts: start indices of the runs (sorted)
+    :param ends: inclusive end indices of the runs
+    :param max_interruption_duration: maximum interruption for runs to be merged (in units of positions)
+    :param positions: position of every index (e.g. timestamps in seconds), defaults to the indices themselves
+    :return: start and (inclusive) end indices of the merged runs
+    """
+    if len(starts) == 0:
+        return starts, ends
+    positions = np.arange(np.max(ends) + 1) if positions is None else positions
+    short = (positions[starts[1:]] - positions[ends[:-1]]) < max_interruption_duration
+    return starts[np.concatenate([[True], ~short])], ends[np.concatenate([~short, [True]])]
+
+
+def runs_to_mask(starts: np.ndarray, ends: np.ndarray, n: int) -> np.ndarray:
+    """
+    :param starts: start indices of non-overlapping runs
+    :param ends: inclusive end indices of the runs
+    :param n: length of the mask
+    :return: boolean mask that is True inside the runs
+    """
+    delta = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, np.asarray(ends) + 1, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
 def get_participant_subset(df: pd.DataFrame) -> Dict[object, pd.DataFrame]:
     """
     In most of our datasets the 'participant_id' column identifies the respective anonymized participants, this utility
-    function returns a dict with individual DataFrame subsets.
+    function returns a dict with individual DataFrame subsets. The rows are grouped once (see cohort.Cohort, which
+    additionally allows lazy iteration without materializing all subsets).
     :param df: DataFrame with 'participant_id' column
     :return: dictionary where participant_id is the key and respective DataFrame subset the value
     """
-    return {participant: df[df.participant_id == participant]
-            for participant in set(df.participant_id)}
+    from .cohort import Cohort
+    return dict(Cohort(df).iter_participants())
@@ -0,0 +1,3 @@
+"""
+Benchmarks of the pipeline blocks, daily features and the example pipeline on synthetic recordings (see run.py).
+"""
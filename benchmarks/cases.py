@@ -0,0 +1,278 @@
+"""
+Benchmark cases: every block of ax3_pipeline.pipeline_blocks on inputs derived from a synthetic recording, the daily
+feature functions and the full example pipeline (also chunked, compiled to a ProcessingGraph and with cached stages).
+"""
+import inspect
+import shutil
+import tempfile
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+from ax3_pipeline import daily_features, storage
+from ax3_pipeline.pipeline_blocks.aggregates import EpochAggregates
+from ax3_pipeline.pipeline_blocks.base import precision_policy, SINGLE_PRECISION
+from ax3_pipeline.pipeline_blocks.caching import CachedProcessor, DiskCache
+from ax3_pipeline.pipeline_blocks.calibration import AutoCalibration
+from ax3_pipeline.pipeline_blocks.compositions import ChunkedComposition, SequentialComposition
+from ax3_pipeline.pipeline_blocks.features import ApproximateVelocity, ApproximateDistance, \
+    TimeDomainSummaryStatistics, EnmoSummaryStatistics, ActivityClasses, TotalEnergy, SpectralEntropy, \
+    FusedEnmoFeatures
+from ax3_pipeline.pipeline_blocks.filters import LowpassButterworthFilter, HighpassButterworthFilter
+from ax3_pipeline.pipeline_blocks.misc import EpochGenerator, TrapezoidalIntegrator, VectorMagnitude, \
+    EuclideanNormMinusOne, Dft1d, PowerSpectrum
+from ax3_pipeline.pipeline_blocks.postprocessors import FeatureConcat, NonWeartimeCalculator, ActivityBouts, \
+    ParquetSink
+from ax3_pipeline.pipeline_blocks.resampling import Resampler
+from ax3_pipeline.pipeline_blocks.signals import Signal, StackAxes
+from example_pipeline import build_pipeline
+
+Case = namedtuple("Case", ["name", "setup", "unit"])
+Case.__doc__ = """
+name: unique name of the case (group/name)
+setup: function(BenchmarkData) -> (function without arguments that runs the benchmarked code, number of processed items)
+unit: unit of the processed items (throughput is reported as unit/s)
+"""
+
+
+class BenchmarkData(object):
+    """
+    Inputs of the benchmark cases derived from a synthetic recording. Intermediate results are computed on first use
+    (with the library itself) and shared by all cases.
+    """
+
+    def __init__(self, timestamps_ms, x, y, z):
+        self.timestamps_ms = timestamps_ms
+        self.raw = (x, y, z)
+        self._cache = {}
+
+    @property
+    def n_samples(self):
+        return len(self.timestamps_ms)
+
+    def _get(self, key, function):
+        if key not in self._cache:
+            self._cache[key] = function()
+        return self._cache[key]
+
+    @property
+    def directory(self):
+        """
+        Temporary directory for the cases writing to disk, removed together with this object.
+        """
+        def create():
+            directory = tempfile.mkdtemp(prefix="ax3_benchmark_")
+            weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+            return directory
+        return self._get("directory", create)
+
+    @property
+    def signal(self):
+        return self._get("signal", lambda: Signal.from_axes(*self.raw, start_time_ms=self.timestamps_ms[0]))
+
+    @property
+    def epoch_generator(self):
+        return self._get("epoch_generator", lambda: EpochGenerator(self.timestamps_ms, defer_bad_epoch_removal=True))
+
+    @property
+    def filtered(self):
+        return self._get("filtered", lambda: LowpassButterworthFilter().process(*self.raw))
+
+    @property
+    def epochs(self):
+        return self._get("epochs", lambda: self.epoch_generator.process(*self.filtered))
+
+    @property
+    def signal_epochs(self):
+        return self._get("signal_epochs", lambda: self.epoch_generator.process(self.signal)[0])
+
+    @property
+    def magnitude_epochs(self):
+        return self._get("magnitude_epochs", lambda: VectorMagnitude().process(*self.epochs))
+
+    @property
+    def enmo_epochs(self):
+        return self._get("enmo_epochs", lambda: EuclideanNormMinusOne().process(*self.epochs))
+
+    @property
+    def power_spectra(self):
+        return self._get("power_spectra", lambda: PowerSpectrum().process(*self.enmo_epochs))
+
+    @property
+    def features(self):
+        return self._get("features", lambda: (
+            *TimeDomainSummaryStatistics().process(*self.epochs),
+            *EnmoSummaryStatistics().process(*self.enmo_epochs),
+            *TotalEnergy().process(*self.power_spectra)))
+
+    @property
+    def epoch_df(self):
+        return self._get("epoch_df", lambda: build_pipeline(self.timestamps_ms).process(*self.raw)[0])
+
+    @property
+    def n_epochs(self):
+        return len(self.epoch_df)
+
+
+def _block_case(name, processor_factory, inputs, items="samples"):
+    def setup(data):
+        processor, args = processor_factory(), inputs(data)
+        return (lambda: processor.process(*args)), data.n_samples if items == "samples" else data.n_epochs
+    return Case("blocks/" + name, setup, items)
+
+
+def _daily_case(name, function):
+    def setup(data):
+        df = data.epoch_df
+        return (lambda: function(df)), len(df)
+    return Case("daily_features/" + name, setup, "epochs")
+
+
+def _timestamped_epoch_generator(data):
+    # includes the gap detection of the constructor
+    return (lambda: EpochGenerator(data.timestamps_ms).process(*data.filtered)), data.n_samples
+
+
+def _resampler(data):
+    # includes the gap detection of the constructor
+    return (lambda: Resampler(data.timestamps_ms).process(*data.raw)), data.n_samples
+
+
+def _feature_concat(data):
+    processor, features = FeatureConcat(data.epoch_generator), data.features
+    return (lambda: processor.process(*features)), data.n_samples
+
+
+def _fused_enmo_features(data):
+    processor, filtered = FusedEnmoFeatures(data.epoch_generator), data.filtered
+    return (lambda: processor.process(*filtered)), data.n_samples
+
+
+def _merge_aggregates(data):
+    aggregates = EpochAggregates(suffix="_enmo", n_bins=200, value_range=(0., 2.))
+    df = FeatureConcat(data.epoch_generator).process(*aggregates.process(*data.enmo_epochs))[0]
+    return (lambda: aggregates.summary_statistics(aggregates.merge(df, "60s"))), len(df)
+
+
+def _example_pipeline(data):
+    return (lambda: build_pipeline(data.timestamps_ms).process(*data.raw)), data.n_samples
+
+
+def _chunked_pipeline(data):
+    # the example pipeline with the processors before the whole-DataFrame post-processor in one hour chunks
+    processors = list(build_pipeline(data.timestamps_ms).processors.values())
+    pipeline = SequentialComposition(ChunkedComposition(*processors[:-1], n_epochs_per_chunk=720), processors[-1])
+    return (lambda: pipeline.process(*data.raw)), data.n_samples
+
+
+def _compiled_pipeline(data):
+    graph = build_pipeline(data.timestamps_ms).compile()
+    return (lambda: graph.process(*data.raw)), data.n_samples
+
+
+def _compile(data):
+    pipeline = build_pipeline(data.timestamps_ms)
+    return (lambda: pipeline.compile()), len(pipeline.compile().nodes)
+
+
+def _cached_pipeline(warm):
+    def setup(data):
+        # the filter stage is cached, everything downstream is recomputed
+        processors = list(build_pipeline(data.timestamps_ms).processors.values())
+        cache = DiskCache(tempfile.mkdtemp(dir=data.directory))
+        pipeline = SequentialComposition(CachedProcessor(SequentialComposition(*processors[:2]), cache),
+                                         *processors[2:])
+        if warm:
+            pipeline.process(*data.raw)
+            return (lambda: pipeline.process(*data.raw)), data.n_samples
+
+        def run():
+            cache.clear()
+            return pipeline.process(*data.raw)
+        return run, data.n_samples
+    return setup
+
+
+def _parquet_sink(data):
+    processor, df = ParquetSink(data.directory, "p001"), data.epoch_df
+    return (lambda: processor.process(df)), data.n_epochs
+
+
+def _single_precision_pipeline(data):
+    with precision_policy(SINGLE_PRECISION):
+        pipeline = build_pipeline(data.timestamps_ms)
+    return (lambda: pipeline.process(*data.raw)), data.n_samples
+
+
+def _selected_features(data):
+    pipeline = build_pipeline(data.timestamps_ms).select_features(["mean_enmo", "sedentary", "spectral_entropy"])
+    return (lambda: pipeline.process(*data.raw)), data.n_samples
+
+
+def _daily_feature_functions():
+    # all public functions of the module computing daily features from the epoch DataFrame
+    return [(name, f) for name, f in inspect.getmembers(daily_features, inspect.isfunction)
+            if f.__module__ == daily_features.__name__ and not name.startswith("_")
+            and list(inspect.signature(f).parameters)[:1] == ["acc_epoch_df"]]
+
+
+def all_cases():
+    """
+    :return: list of all benchmark cases
+    """
+    cases = [
+        _block_case("StackAxes", StackAxes, lambda d: d.raw),
+        Case("blocks/Resampler", _resampler, "samples"),
+        _block_case("AutoCalibration", lambda: AutoCalibration(inplace=False), lambda d: d.raw),
+        _block_case("LowpassButterworthFilter", LowpassButterworthFilter, lambda d: d.raw),
+        _block_case("LowpassButterworthFilter[signal]", LowpassButterworthFilter, lambda d: (d.signal,)),
+        _block_case("LowpassButterworthFilter[float32]", lambda: LowpassButterworthFilter(dtype=np.float32),
+                    lambda d: (d.signal,)),
+        _block_case("HighpassButterworthFilter", HighpassButterworthFilter, lambda d: d.filtered),
+        _block_case("EpochGenerator", lambda: EpochGenerator(), lambda d: d.filtered),
+        Case("blocks/EpochGenerator[timestamps]", _timestamped_epoch_generator, "samples"),
+        _block_case("EpochGenerator[overlapping]", lambda: EpochGenerator(n_samples_per_epoch=1000,
+                                                                          n_samples_per_hop=500),
+                    lambda d: d.filtered),
+        _block_case("TrapezoidalIntegrator", TrapezoidalIntegrator, lambda d: d.epochs),
+        _block_case("TrapezoidalIntegrator[signal]", TrapezoidalIntegrator, lambda d: (d.signal_epochs,)),
+        _block_case("TrapezoidalIntegrator[non_cumulative]", lambda: TrapezoidalIntegrator(cumulative=False),
+                    lambda d: d.epochs),
+        _block_case("VectorMagnitude", VectorMagnitude, lambda d: d.epochs),
+        _block_case("VectorMagnitude[signal]", VectorMagnitude, lambda d: (d.signal_epochs,)),
+        _block_case("EuclideanNormMinusOne", EuclideanNormMinusOne, lambda d: d.epochs),
+        _block_case("Dft1d", Dft1d, lambda d: d.enmo_epochs),
+        _block_case("PowerSpectrum", PowerSpectrum, lambda d: d.enmo_epochs),
+        _block_case("TimeDomainSummaryStatistics", TimeDomainSummaryStatistics, lambda d: d.epochs),
+        _block_case("TimeDomainSummaryStatistics[signal]", TimeDomainSummaryStatistics,
+                    lambda d: (d.signal_epochs,)),
+        _block_case("EnmoSummaryStatistics", EnmoSummaryStatistics, lambda d: d.enmo_epochs),
+        _block_case("EpochAggregates", EpochAggregates, lambda d: d.epochs),
+        _block_case("EpochAggregates[enmo_histogram]",
+                    lambda: EpochAggregates(suffix="_enmo", n_bins=200, value_range=(0., 2.)),
+                    lambda d: d.enmo_epochs),
+        Case("blocks/EpochAggregates[merge_60s]", _merge_aggregates, "epochs"),
+        _block_case("ApproximateVelocity", ApproximateVelocity, lambda d: d.magnitude_epochs),
+        _block_case("ApproximateDistance", ApproximateDistance,
+                    lambda d: TrapezoidalIntegrator(cumulative=False).process(*d.magnitude_epochs)),
+        _block_case("ActivityClasses", ActivityClasses, lambda d: d.enmo_epochs),
+        _block_case("TotalEnergy", TotalEnergy, lambda d: d.power_spectra),
+        _block_case("SpectralEntropy", SpectralEntropy, lambda d: d.power_spectra),
+        Case("blocks/FusedEnmoFeatures", _fused_enmo_features, "samples"),
+        Case("blocks/FeatureConcat", _feature_concat, "samples"),
+        _block_case("NonWeartimeCalculator", NonWeartimeCalculator, lambda d: (d.epoch_df,), items="epochs"),
+        _block_case("ActivityBouts", ActivityBouts, lambda d: (d.epoch_df,), items="epochs"),
+    ]
+    if storage.pa is not None:
+        cases.append(Case("blocks/ParquetSink", _parquet_sink, "epochs"))
+    cases.extend(_daily_case(name, f) for name, f in _daily_feature_functions())
+    cases.append(Case("pipeline/example_pipeline", _example_pipeline, "samples"))
+    cases.append(Case("pipeline/example_pipeline[enmo_columns]", _selected_features, "samples"))
+    cases.append(Case("pipeline/example_pipeline[single_precision]", _single_precision_pipeline, "samples"))
+    cases.append(Case("pipeline/example_pipeline[chunked]", _chunked_pipeline, "samples"))
+    cases.append(Case("pipeline/example_pipeline[graph]", _compiled_pipeline, "samples"))
+    cases.append(Case("pipeline/compile", _compile, "nodes"))
+    cases.append(Case("pipeline/example_pipeline[cache_cold]", _cached_pipeline(warm=False), "samples"))
+    cases.append(Case("pipeline/example_pipeline[cache_warm]", _cached_pipeline(warm=True), "samples"))
+    return cases
@@ -0,0 +1,143 @@
+"""
+Runs the benchmark suite on a synthetic recording and compares the results against a stored baseline.
+
+    python -m benchmarks.run --hours 24 --output results.json
+    python -m benchmarks.run --hours 24 --baseline results.json --time-threshold 0.2
+
+Wall times are the best of --repeat runs, peak memory is measured in a separate run with tracemalloc (the peak of
+the Python and numpy allocations above the memory held before the run). The exit code is 1 if a case regressed.
+"""
+import argparse
+import gc
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from .cases import all_cases, BenchmarkData
+from .synthetic import generate_recording
+
+
+def measure(function, repeat=3, trace_memory=True):
+    """
+    :param function: function without arguments
+    :param repeat: number of timed runs
+    :param trace_memory: whether to measure the peak memory in an additional run
+    :return: best wall time in seconds and peak memory in bytes (None if not measured)
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+
+    peak = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            function()
+            peak = tracemalloc.get_traced_memory()[1] - start
+        finally:
+            tracemalloc.stop()
+    return min(times), peak
+
+
+def run(cases, data, repeat=3, trace_memory=True, log=sys.stdout):
+    """
+    :return: dict with the results of every case (seconds, throughput, unit, items, peak_memory_bytes)
+    """
+    results = {}
+    for case in cases:
+        function, n_items = case.setup(data)
+        seconds, peak = measure(function, repeat, trace_memory)
+        results[case.name] = {"seconds": seconds, "throughput": n_items / seconds, "unit": case.unit,
+                              "items": n_items, "peak_memory_bytes": peak}
+        if log is not None:
+            print("%-55s %10.4f s %14.0f %s/s %s" % (
+                case.name, seconds, n_items / seconds, case.unit,
+                "" if peak is None else "%10.1f MiB" % (peak / 2 ** 20)), file=log)
+    return results
+
+
+def compare(results, baseline, time_threshold=0.2, memory_threshold=0.1):
+    """
+    Compares the results of equal cases, differences below the thresholds (relative increase) are ignored.
+    :param results: results of the current run (see run)
+    :param baseline: stored results of an earlier run
+    :param time_threshold: tolerated relative increase of the wall time
+    :param memory_threshold: tolerated relative increase of the peak memory
+    :return: DataFrame with one row per case present in both runs and a 'regression' column
+    """
+    rows = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        time_ratio = r["seconds"] / b["seconds"]
+        memory_ratio = None
+        if r.get("peak_memory_bytes") is not None and b.get("peak_memory_bytes"):
+            memory_ratio = r["peak_memory_bytes"] / b["peak_memory_bytes"]
+        rows.append({"case": name, "seconds": r["seconds"], "baseline_seconds": b["seconds"], "time_ratio": time_ratio,
+                     "memory_ratio": memory_ratio,
+                     "regression": time_ratio > 1 + time_threshold or
+                                   (memory_ratio is not None and memory_ratio > 1 + memory_threshold)})
+    return pd.DataFrame(rows, columns=["case", "seconds", "baseline_seconds", "time_ratio", "memory_ratio",
+                                       "regression"]).set_index("case")
+
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "pandas": pd.__version__}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ax3_pipeline benchmarks on synthetic recordings")
+    parser.add_argument("--hours", type=float, default=24., help="recording length in hours (336 for 14 days)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic recording")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per case")
+    parser.add_argument("--filter", default=None, help="regular expression selecting the cases to run")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="JSON file with the results of an earlier run")
+    parser.add_argument("--time-threshold", type=float, default=0.2, help="tolerated relative wall time increase")
+    parser.add_argument("--memory-threshold", type=float, default=0.1, help="tolerated relative peak memory increase")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in all_cases() if args.filter is None or re.search(args.filter, c.name)]
+    data = BenchmarkData(*generate_recording(args.hours, seed=args.seed))
+    with warnings.catch_warnings():
+        # bad epochs of the synthetic gaps are expected
+        warnings.simplefilter("ignore")
+        results = run(cases, data, args.repeat, not args.no_memory)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"parameters": {"hours": args.hours, "seed": args.seed, "repeat": args.repeat},
+                       "environment": environment(), "results": results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["parameters"]["hours"] != args.hours or baseline["parameters"]["seed"] != args.seed:
+            warnings.warn("Baseline was measured on a different recording (%s)" % baseline["parameters"])
+        comparison = compare(results, baseline["results"], args.time_threshold, args.memory_threshold)
+        with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+            print(comparison)
+        if comparison["regression"].any():
+            print("Regressions: %s" % ", ".join(comparison.index[comparison["regression"]]))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
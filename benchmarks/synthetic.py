@@ -0,0 +1,129 @@
+"""
+Deterministic generator of synthetic AX3 recordings (100 Hz, x/y/z in g, millisecond timestamps).
+
+A recording consists of days with one still non-wear period (device lying flat) and wear time made of postures:
+gravity orientation changes with a short transition, a small postural noise and walking bouts (step frequency
+1.6-2.2 Hz with harmonics). Values are quantized to the 1/256 g resolution of the sensor. The timestamps contain gaps
+(missing samples) and single irregular sample intervals (jitter), which EpochGenerator reports as bad epochs.
+"""
+import numpy as np
+
+# 2020-01-01 00:00:00 UTC
+DEFAULT_START_TIME_MS = 1577836800000
+
+
+def generate_recording(duration_hours=24., sampling_frequency=100, seed=0, start_time_ms=DEFAULT_START_TIME_MS,
+                       non_wear_hours_per_day=2., walking_fraction=0.1, mean_posture_minutes=5., n_gaps_per_day=1,
+                       n_jitters_per_day=4, dtype=np.float32):
+    """
+    :param duration_hours: recording length in hours (e.g. 14 * 24 for a two-week recording)
+    :param sampling_frequency: sampling frequency (Hz)
+    :param seed: random seed, equal parameters and seeds produce identical recordings
+    :param start_time_ms: POSIX timestamp (ms) of the first sample
+    :param non_wear_hours_per_day: duration of the daily non-wear period
+    :param walking_fraction: probability of a posture segment being a walking bout
+    :param mean_posture_minutes: mean duration of a posture (exponentially distributed, at least 30 s)
+    :param n_gaps_per_day: number of gaps (1-30 minutes without samples) per day
+    :param n_jitters_per_day: number of irregular sample intervals (1-3 ms too long) per day
+    :param dtype: dtype of the accelerations
+    :return: timestamps_ms, x, y, z
+    """
+    rng = np.random.RandomState(seed)
+    n_samples = int(round(duration_hours * 3600 * sampling_frequency))
+    samples_per_day = 24 * 3600 * sampling_frequency
+    acc = np.empty((3, n_samples), dtype=dtype)
+
+    previous = np.array([0., 0., 1.])
+    start = 0
+    for day_start in range(0, n_samples, samples_per_day):
+        day_stop = min(day_start + samples_per_day, n_samples)
+        # shorter (partial) days get a proportionally shorter non-wear period
+        non_wear_length = int(non_wear_hours_per_day * 3600 * sampling_frequency * (day_stop - day_start) /
+                              samples_per_day)
+        non_wear_start = day_start + rng.randint(0, max(day_stop - day_start - non_wear_length, 1))
+        non_wear_stop = min(non_wear_start + non_wear_length, day_stop)
+
+        for segment_start, segment_stop, wear in ((start, non_wear_start, True),
+                                                  (non_wear_start, non_wear_stop, False),
+                                                  (non_wear_stop, day_stop, True)):
+            if wear:
+                previous = _wear(acc, segment_start, segment_stop, previous, rng, sampling_frequency,
+                                 walking_fraction, mean_posture_minutes)
+            elif segment_stop > segment_start:
+                previous = _non_wear(acc, segment_start, segment_stop, rng)
+        start = day_stop
+
+    # quantization of the sensor (+-8 g range with 1/256 g resolution)
+    np.multiply(acc, 256, out=acc)
+    np.round(acc, out=acc)
+    np.divide(acc, 256, out=acc)
+
+    timestamps_ms = _timestamps(n_samples, sampling_frequency, start_time_ms, rng, n_gaps_per_day, n_jitters_per_day)
+    return timestamps_ms, acc[0], acc[1], acc[2]
+
+
+def _orientation(rng):
+    # mostly upright orientations with the gravity vector close to the z axis
+    v = rng.normal(0, 1, 3) + np.array([0., 0., 1.5])
+    return v / np.linalg.norm(v)
+
+
+def _wear(acc, start, stop, previous, rng, sampling_frequency, walking_fraction, mean_posture_minutes):
+    while start < stop:
+        length = int(max(rng.exponential(mean_posture_minutes * 60), 30) * sampling_frequency)
+        segment_stop = min(start + length, stop)
+        n = segment_stop - start
+        gravity = _orientation(rng)
+
+        # one second transition from the previous orientation
+        n_transition = min(sampling_frequency, n)
+        w = np.linspace(0, 1, n_transition)[:, np.newaxis]
+        transition = (1 - w) * previous + w * gravity
+        transition /= np.linalg.norm(transition, axis=1, keepdims=True)
+
+        segment = acc[:, start:segment_stop]
+        segment[:] = gravity[:, np.newaxis]
+        segment[:, :n_transition] = transition.T
+        segment += rng.normal(0, 0.01, (3, n)).astype(acc.dtype)
+
+        if rng.uniform() < walking_fraction:
+            t = np.arange(n) / sampling_frequency
+            f = rng.uniform(1.6, 2.2)
+            phase = rng.uniform(0, 2 * np.pi)
+            vertical = 0.3 * np.sin(2 * np.pi * f * t + phase) + 0.1 * np.sin(4 * np.pi * f * t)
+            lateral = 0.1 * np.sin(np.pi * f * t + phase)
+            segment[2] += vertical.astype(acc.dtype)
+            segment[0] += lateral.astype(acc.dtype)
+            segment += rng.normal(0, 0.05, (3, n)).astype(acc.dtype)
+
+        previous = gravity
+        start = segment_stop
+    return previous
+
+
+def _non_wear(acc, start, stop, rng):
+    # device lying flat on a table, only sensor noise below the non-wear threshold
+    gravity = np.array([0., 0., -1.]) + rng.normal(0, 0.02, 3)
+    gravity /= np.linalg.norm(gravity)
+    segment = acc[:, start:stop]
+    segment[:] = gravity[:, np.newaxis]
+    segment += rng.normal(0, 0.002, segment.shape).astype(acc.dtype)
+    return gravity
+
+
+def _timestamps(n_samples, sampling_frequency, start_time_ms, rng, n_gaps_per_day, n_jitters_per_day):
+    delta_ms = int(round(1000 / sampling_frequency))
+    n_days = n_samples / (24 * 3600 * sampling_frequency)
+    increments = np.zeros(n_samples, dtype=np.int64)
+
+    n_gaps = int(np.ceil(n_gaps_per_day * n_days))
+    positions = rng.randint(1, max(n_samples, 2), n_gaps)
+    np.add.at(increments, positions, rng.randint(60, 1800, n_gaps) * 1000)
+
+    n_jitters = int(np.ceil(n_jitters_per_day * n_days))
+    positions = rng.randint(1, max(n_samples, 2), n_jitters)
+    np.add.at(increments, positions, rng.randint(1, 4, n_jitters))
+
+    timestamps_ms = np.cumsum(increments)
+    timestamps_ms += start_time_ms + np.arange(n_samples, dtype=np.int64) * delta_ms
+    return timestamps_ms
@@ -1,24 +1,25 @@
 import sys
 
+from ax3_pipeline.cwa import read_cwa
 from ax3_pipeline.pipeline_blocks.compositions import SequentialComposition, ParallelComposition
 from ax3_pipeline.pipeline_blocks.features import ApproximateVelocity, ApproximateDistance, TimeDomainSummaryStatistics, \
     EnmoSummaryStatistics, ActivityClasses, TotalEnergy, SpectralEntropy
 from ax3_pipeline.pipeline_blocks.filters import LowpassButterworthFilter, HighpassButterworthFilter
 from ax3_pipeline.pipeline_blocks.misc import EpochGenerator, TrapezoidalIntegrator, VectorMagnitude, \
-    EuclideanNormMinusOne, Dft1d
+    EuclideanNormMinusOne, PowerSpectrum
 from ax3_pipeline.pipeline_blocks.postprocessors import FeatureConcat, NonWeartimeCalculator
+from ax3_pipeline.pipeline_blocks.signals import StackAxes
 
 
-if __name__ == "__main__":
-
-    timestamps_ms = sys.argv[1]
-    x = sys.argv[2]
-    y = sys.argv[3]
-    z = sys.argv[4]
+def build_pipeline(timestamps_ms):
+    """
+    :param timestamps_ms: sample timestamps of the recording
+    :return: the example pipeline computing all epoch features of the recording (input x, y, z)
+    """
+    epoch_gen = EpochGenerator(timestamps_ms=timestamps_ms, defer_bad_epoch_removal=True)
 
-    epoch_gen = EpochGenerator(timestamps_ms=timestamps_ms)
-
-    pipeline = SequentialComposition(
+    return SequentialComposition(
+        StackAxes(start_time_ms=timestamps_ms[0]),
         LowpassButterworthFilter(),
         ParallelComposition(
             SequentialComposition(
@@ -46,7 +47,7 @@ if __name__ == "__main__":
                     EnmoSummaryStatistics(),
                     ActivityClasses(),
                     SequentialComposition(
-                        Dft1d(),
+                        PowerSpectrum(),
                         ParallelComposition(
                             TotalEnergy(),
                             SpectralEntropy()
@@ -55,9 +56,21 @@ if __name__ == "__main__":
                 )
             )
         ),
-        FeatureConcat(epoch_gen.timestamps),
+        FeatureConcat(epoch_gen),
         NonWeartimeCalculator()
     )
 
+
+if __name__ == "__main__":
+
+    if len(sys.argv) == 2:
+        timestamps_ms, x, y, z = read_cwa(sys.argv[1])
+    else:
+        timestamps_ms = sys.argv[1]
+        x = sys.argv[2]
+        y = sys.argv[3]
+        z = sys.argv[4]
+
+    pipeline = build_pipeline(timestamps_ms)
     df = pipeline.process(x, y, z)[0]
     df.to_csv("test_acc_pipeline.csv")
@@ -24,6 +24,7 @@ setup(
     packages=find_packages(),
     install_requires=["markdown==3.0.1", "numpy>=1.16.2", "pandas>=0.24.2", "statsmodels>=0.9.0",
                       "scipy==1.2.1", "pyhrv==0.3.2", "matplotlib", "seaborn"],  # if it doesn't work try replacing >= with ==
+    extras_require={"parquet": ["pyarrow"]},
     test_suite='nose.collector',
     tests_require=['nose', "pandas"],
     zip_safe=False,
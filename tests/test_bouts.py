@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ax3_pipeline.pipeline_blocks.postprocessors import BoutDefinition, find_bouts, _merge_bout_runs
+
+MVPA = BoutDefinition("mvpa", ("moderate",), 600, 0.2)
+
+
+def _epochs(*segments):
+    """
+    :param segments: (minutes, in class) of consecutive 5s epochs
+    """
+    moderate = np.concatenate([np.full(int(minutes * 12), in_class, dtype=np.int8) for minutes, in_class in segments])
+    index = pd.date_range("2020-01-01 08:00", periods=len(moderate), freq="5s")
+    return pd.DataFrame({"moderate": moderate}, index=index)
+
+
+def _reference_merge(starts, ends, seconds, n_in_class, epoch_length_s, max_interruption_s, min_fraction):
+    """
+    Sequential greedy merge visiting every run.
+    """
+    merged_starts, merged_ends = [starts[0]], [ends[0]]
+    for start, end in zip(starts[1:], ends[1:]):
+        first, last = merged_starts[-1], merged_ends[-1]
+        in_class_s = (n_in_class[end + 1] - n_in_class[first]) * epoch_length_s
+        duration = seconds[end] - seconds[first] + epoch_length_s
+        if seconds[start] - seconds[last] <= max_interruption_s + epoch_length_s + 1e-6 and \
+                in_class_s >= min_fraction * duration - 1e-6:
+            merged_ends[-1] = end
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+    return np.array(merged_starts), np.array(merged_ends)
+
+
+class FindBoutsTest(unittest.TestCase):
+
+    def test_pure_bout(self):
+        bouts = find_bouts(_epochs((5, 0), (10, 1), (5, 0)), [MVPA], 5)
+        self.assertEqual(len(bouts), 1)
+        self.assertEqual(bouts.start[0], pd.Timestamp("2020-01-01 08:05"))
+        self.assertEqual(bouts.end[0], pd.Timestamp("2020-01-01 08:15"))
+        self.assertAlmostEqual(bouts.duration_s[0], 600)
+        self.assertAlmostEqual(bouts.fraction[0], 1)
+
+    def test_too_short(self):
+        self.assertEqual(len(find_bouts(_epochs((9.5, 1), (5, 0)), [MVPA], 5)), 0)
+
+    def test_allowed_interruption(self):
+        bouts = find_bouts(_epochs((5, 1), (1, 0), (5, 1), (5, 0)), [MVPA], 5)
+        self.assertEqual(len(bouts), 1)
+        self.assertAlmostEqual(bouts.duration_s[0], 660)
+        self.assertAlmostEqual(bouts.fraction[0], 10 / 11)
+
+    def test_interruption_too_long(self):
+        # the interruption exceeds 0.2 * 600s, the halves are too short on their own
+        self.assertEqual(len(find_bouts(_epochs((5, 1), (2.5, 0), (5, 1)), [MVPA], 5)), 0)
+
+    def test_bout_followed_by_sparse_activity(self):
+        # joining all runs would fail the fraction condition (12 of 16 minutes), the valid part is kept
+        bouts = find_bouts(_epochs((10, 1), (2, 0), (1, 1), (2, 0), (1, 1), (5, 0)), [MVPA], 5)
+        self.assertEqual(len(bouts), 1)
+        self.assertEqual(bouts.start[0], pd.Timestamp("2020-01-01 08:00"))
+        self.assertAlmostEqual(bouts.duration_s[0], 780)
+        self.assertAlmostEqual(bouts.fraction[0], 11 / 13)
+
+    def test_fraction_holds_for_every_bout(self):
+        rng = np.random.RandomState(0)
+        df = _epochs(*[(rng.randint(1, 24) / 12, rng.rand() < 0.7) for _ in range(2000)])
+        bouts = find_bouts(df, [MVPA], 5)
+        self.assertGreater(len(bouts), 0)
+        self.assertTrue(np.all(bouts.fraction >= 0.8 - 1e-9))
+        self.assertTrue(np.all(bouts.duration_s >= 600))
+        for start, end, fraction in zip(bouts.start, bouts.end, bouts.fraction):
+            self.assertAlmostEqual(df.moderate[start:end - pd.Timedelta("5s")].mean(), fraction)
+
+    def test_missing_epochs_interrupt(self):
+        df = _epochs((12, 1))
+        df = df.drop(df.index[60:120])
+        bouts = find_bouts(df, [MVPA], 5)
+        self.assertEqual(len(bouts), 0)
+
+    def test_merge_equals_sequential_greedy_merge(self):
+        rng = np.random.RandomState(1)
+        for p_in_class in (0.3, 0.6, 0.9):
+            mask = rng.rand(20000) < p_in_class
+            starts = np.flatnonzero(mask & ~np.concatenate([[False], mask[:-1]]))
+            ends = np.flatnonzero(mask & ~np.concatenate([mask[1:], [False]]))
+            seconds = np.arange(len(mask)) * 5.
+            n_in_class = np.concatenate([[0], np.cumsum(mask)])
+            for max_interruption_s, min_fraction in ((10, 0.8), (30, 0.6), (60, 0.5), (120, 0.8)):
+                args = starts, ends, seconds, n_in_class, 5., max_interruption_s, min_fraction
+                expected = _reference_merge(*args)
+                merged = _merge_bout_runs(*args)
+                np.testing.assert_array_equal(merged[0], expected[0])
+                np.testing.assert_array_equal(merged[1], expected[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ax3_pipeline.pipeline_blocks.caching import CachedProcessor, DiskCache
+from ax3_pipeline.pipeline_blocks.compositions import SequentialComposition
+from ax3_pipeline.pipeline_blocks.filters import HighpassButterworthFilter, LowpassButterworthFilter
+from ax3_pipeline.pipeline_blocks.misc import EpochGenerator, PowerSpectrum
+from ax3_pipeline.pipeline_blocks.signals import Signal
+
+
+class CachedProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DiskCache(self.directory)
+        self.x = np.random.RandomState(0).normal(size=10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_output(self):
+        expected = LowpassButterworthFilter().process(self.x)[0]
+        cached = CachedProcessor(LowpassButterworthFilter(), self.cache)
+        key = cached.key(self.x)
+        self.assertIsNone(self.cache.get(key))
+        np.testing.assert_array_equal(cached.process(self.x)[0], expected)
+        np.testing.assert_array_equal(self.cache.get(key)[0], expected)
+        # equal parameters share the entry, other parameters and inputs do not
+        self.assertEqual(CachedProcessor(LowpassButterworthFilter(), self.cache).key(self.x), key)
+        self.assertNotEqual(CachedProcessor(LowpassButterworthFilter(order=2), self.cache).key(self.x), key)
+        self.assertNotEqual(cached.key(self.x[1:]), key)
+
+    def test_signals_are_memory_mapped(self):
+        signal = Signal.from_axes(self.x, 2 * self.x, 3 * self.x, start_time_ms=np.int64(1600000000000))
+        epochs = EpochGenerator().process(signal)[0]
+        spectrum = PowerSpectrum().process(epochs)[0]
+        self.cache.put("key", (signal, spectrum))
+        loaded, loaded_spectrum = self.cache.get("key")
+
+        self.assertIsInstance(loaded.data, np.memmap)
+        np.testing.assert_array_equal(loaded.data, signal.data)
+        self.assertEqual((loaded.sampling_frequency, loaded.start_time_ms, loaded.axes),
+                         (signal.sampling_frequency, signal.start_time_ms, signal.axes))
+        self.assertIsInstance(loaded_spectrum.data.power, np.memmap)
+        np.testing.assert_array_equal(loaded_spectrum.data.power, spectrum.data.power)
+        self.assertEqual(loaded_spectrum.data.n_samples, spectrum.data.n_samples)
+        self.assertFalse(any(f.endswith(".pkl") for f in os.listdir(os.path.join(self.directory, "key"))))
+
+    def test_processors_with_callbacks_are_not_cacheable(self):
+        f = LowpassButterworthFilter()
+        self.assertTrue(f.cacheable)
+        f.add_callback(print)
+        self.assertFalse(f.cacheable)
+        with self.assertRaises(ValueError):
+            CachedProcessor(f, self.cache)
+        with self.assertRaises(ValueError):
+            CachedProcessor(SequentialComposition(HighpassButterworthFilter(), f), self.cache)
+
+    def test_callbacks_added_after_construction(self):
+        f = LowpassButterworthFilter()
+        cached = CachedProcessor(f, self.cache)
+        f.add_callback(print)
+        with self.assertRaises(ValueError):
+            cached.process(self.x)
+
+
+if __name__ == "__main__":
+    unittest.main()
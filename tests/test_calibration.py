@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from ax3_pipeline.pipeline_blocks.calibration import AutoCalibration
+
+N_SAMPLES_PER_EPOCH = 1000
+
+
+def _recording(offset, scale, temperature_coefficient, seed=0):
+    """
+    Stationary epochs in various orientations at 20-26 degrees, interleaved with active epochs at 35 degrees, so the
+    mean temperature of the stationary epochs differs from the mean of all samples.
+    :return: true and raw (3, n_samples) accelerations, temperature and stationary mask (per sample)
+    """
+    rng = np.random.RandomState(seed)
+    true, temperature, stationary = [], [], []
+    for i in range(240):
+        if i % 4 == 3:
+            true.append(rng.normal(0., 0.5, (3, N_SAMPLES_PER_EPOCH)))
+            temperature.append(np.full(N_SAMPLES_PER_EPOCH, 35.))
+            stationary.append(np.zeros(N_SAMPLES_PER_EPOCH, dtype=bool))
+        else:
+            direction = rng.normal(size=3)
+            direction /= np.linalg.norm(direction)
+            true.append(direction[:, None] + rng.normal(0., 0.003, (3, N_SAMPLES_PER_EPOCH)))
+            temperature.append(np.full(N_SAMPLES_PER_EPOCH, 20. + 6. * rng.rand()))
+            stationary.append(np.ones(N_SAMPLES_PER_EPOCH, dtype=bool))
+    true, temperature, stationary = np.hstack(true), np.concatenate(temperature), np.concatenate(stationary)
+    reference = np.mean(temperature[stationary])
+    raw = (true - offset[:, None] - temperature_coefficient[:, None] * (temperature - reference)) / scale[:, None]
+    return true, raw, temperature, stationary
+
+
+def _stationary_error(axes, stationary):
+    means = np.stack([a[stationary].reshape(-1, N_SAMPLES_PER_EPOCH).mean(axis=1) for a in axes], axis=1)
+    return np.mean(np.abs(np.linalg.norm(means, axis=1) - 1))
+
+
+class AutoCalibrationTest(unittest.TestCase):
+
+    def test_temperature_calibration(self):
+        offset, scale = np.array([0.03, -0.02, 0.05]), np.array([1.02, 0.98, 1.01])
+        temperature_coefficient = np.array([0.004, -0.003, 0.005])
+        true, raw, temperature, stationary = _recording(offset, scale, temperature_coefficient)
+
+        calibration = AutoCalibration(temperature=temperature, inplace=False)
+        calibrated = calibration.process(*raw)
+        r = calibration.result
+        self.assertTrue(r.success)
+        self.assertAlmostEqual(r.reference_temperature, np.mean(temperature[stationary]))
+        self.assertNotAlmostEqual(r.reference_temperature, np.mean(temperature), places=1)
+        np.testing.assert_allclose(r.temperature_coefficient, temperature_coefficient, atol=1e-4)
+
+        # the applied correction matches the fit
+        error = _stationary_error(calibrated, stationary)
+        self.assertLess(error, 1e-3)
+        self.assertAlmostEqual(error, r.error_after, delta=1e-4)
+        self.assertLess(error, _stationary_error(raw, stationary) / 10)
+        for c, t in zip(calibrated, true):
+            np.testing.assert_allclose(c[stationary], t[stationary], atol=2e-3)
+
+    def test_without_temperature(self):
+        offset, scale = np.array([0.03, -0.02, 0.05]), np.array([1.02, 0.98, 1.01])
+        _, raw, _, stationary = _recording(offset, scale, np.zeros(3))
+
+        calibration = AutoCalibration(inplace=False)
+        calibrated = calibration.process(*raw)
+        self.assertTrue(calibration.result.success)
+        self.assertTrue(np.isnan(calibration.result.reference_temperature))
+        self.assertAlmostEqual(_stationary_error(calibrated, stationary), calibration.result.error_after, delta=1e-4)
+
+
+if __name__ == "__main__":
+    unittest.main()
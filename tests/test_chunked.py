@@ -0,0 +1,90 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ax3_pipeline.pipeline_blocks.compositions import ChunkedComposition, ParallelComposition, SequentialComposition
+from ax3_pipeline.pipeline_blocks.features import ApproximateVelocity, ApproximateDistance, \
+    TimeDomainSummaryStatistics, EnmoSummaryStatistics, ActivityClasses, TotalEnergy, SpectralEntropy
+from ax3_pipeline.pipeline_blocks.filters import LowpassButterworthFilter, HighpassButterworthFilter
+from ax3_pipeline.pipeline_blocks.misc import EpochGenerator, TrapezoidalIntegrator, VectorMagnitude, \
+    EuclideanNormMinusOne, PowerSpectrum
+from ax3_pipeline.pipeline_blocks.postprocessors import FeatureConcat
+from ax3_pipeline.pipeline_blocks.signals import StackAxes
+
+
+def _recording(n_epochs=600, seed=0):
+    rng = np.random.RandomState(seed)
+    n = n_epochs * 500
+    t = 1600000000000 + np.arange(n) * 10
+    # two timestamp glitches produce bad epochs
+    t[200 * 500 + 3:] += 4
+    t[450 * 500 + 7:] += 3
+    phase = np.arange(n) / 50
+    x = 0.1 * np.sin(phase) + rng.normal(0, 0.05, n)
+    y = 0.5 + 0.2 * np.sin(phase / 3) + rng.normal(0, 0.05, n)
+    z = 0.8 + rng.normal(0, 0.05, n)
+    return t, x, y, z
+
+
+def _processors(timestamps_ms, stacked, defer):
+    epoch_gen = EpochGenerator(timestamps_ms=timestamps_ms, defer_bad_epoch_removal=defer)
+    return ([StackAxes(start_time_ms=timestamps_ms[0])] if stacked else []) + [
+        LowpassButterworthFilter(),
+        ParallelComposition(
+            SequentialComposition(
+                HighpassButterworthFilter(), epoch_gen,
+                ParallelComposition(
+                    SequentialComposition(
+                        TrapezoidalIntegrator(), VectorMagnitude(),
+                        ParallelComposition(ApproximateVelocity(),
+                                            SequentialComposition(TrapezoidalIntegrator(cumulative=False),
+                                                                  ApproximateDistance()))),
+                    TimeDomainSummaryStatistics())),
+            SequentialComposition(
+                EuclideanNormMinusOne(), epoch_gen,
+                ParallelComposition(EnmoSummaryStatistics(), ActivityClasses(),
+                                    SequentialComposition(PowerSpectrum(),
+                                                          ParallelComposition(TotalEnergy(), SpectralEntropy()))))),
+        FeatureConcat(epoch_gen)]
+
+
+class ChunkedCompositionTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.t, self.x, self.y, self.z = _recording()
+
+    def _assert_equivalent(self, stacked, defer, n_epochs_per_chunk):
+        full = SequentialComposition(*_processors(self.t, stacked, defer)).process(self.x, self.y, self.z)[0]
+        chunked = ChunkedComposition(*_processors(self.t, stacked, defer), n_epochs_per_chunk=n_epochs_per_chunk)
+        df = chunked.process(self.x, self.y, self.z)[0]
+
+        self.assertEqual(list(df.columns), list(full.columns))
+        self.assertTrue(df.index.equals(full.index))
+        pd.testing.assert_series_equal(df.dtypes, full.dtypes)
+        np.testing.assert_allclose(df.to_numpy(np.float64), full.to_numpy(np.float64), rtol=1e-4, atol=1e-5)
+
+    def test_matches_full_execution(self):
+        self._assert_equivalent(stacked=False, defer=False, n_epochs_per_chunk=128)
+
+    def test_matches_full_execution_with_deferred_removal(self):
+        self._assert_equivalent(stacked=False, defer=True, n_epochs_per_chunk=97)
+
+    def test_matches_full_execution_of_signals(self):
+        self._assert_equivalent(stacked=True, defer=True, n_epochs_per_chunk=250)
+
+    def test_single_chunk(self):
+        self._assert_equivalent(stacked=False, defer=False, n_epochs_per_chunk=1000)
+
+    def test_iter_chunks(self):
+        chunked = ChunkedComposition(*_processors(self.t, False, False), n_epochs_per_chunk=128)
+        lengths = [len(o[0]) for o in chunked.iter_chunks(self.x, self.y, self.z)]
+        # 5 chunks, the bad epochs at 200 and 450 are removed
+        self.assertEqual(len(lengths), 5)
+        self.assertEqual(sum(lengths), 598)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ax3_pipeline.daily_features import DailyFeatureEngine, daily_features
+
+
+class DailyFeatureEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        index = pd.date_range("2021-01-01 03:00", periods=720 * 24 * 2, freq="5s")
+        self.df = pd.DataFrame({"mean_enmo": rng.rand(len(index)) * 0.2,
+                                "x_std": rng.rand(len(index)) * 0.1}, index=index)
+
+    def test_features_with_missing_columns_are_skipped(self):
+        r = daily_features(self.df)
+        self.assertIn("relative_daily_mvpa", r.columns)
+        # y_std and z_std are missing
+        self.assertNotIn("mean_daily_std_sum", r.columns)
+        self.assertNotIn("total_daily_distance", r.columns)
+
+    def test_registered_feature(self):
+        engine = DailyFeatureEngine().register("active_std", lambda df: df.x_std.where(df.mean_enmo > 0.1), "mean",
+                                               columns=["x_std", "mean_enmo"])
+        r = engine.process(self.df)
+        expected = self.df.x_std.where(self.df.mean_enmo > 0.1).groupby(self.df.index.floor("D")).mean()
+        np.testing.assert_allclose(r["active_std"].to_numpy(), expected.to_numpy())
+
+        engine.register("skipped", lambda df: df.y_std, columns=["y_std"])
+        self.assertNotIn("skipped", engine.process(self.df).columns)
+
+    def test_errors_of_registered_features_propagate(self):
+        engine = DailyFeatureEngine().register("typo", lambda df: df.mean_enm, columns=["mean_enmo"])
+        with self.assertRaises(AttributeError):
+            engine.process(self.df)
+        engine = DailyFeatureEngine().register("undeclared", lambda df: df["y_std"])
+        with self.assertRaises(KeyError):
+            engine.process(self.df)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ax3_pipeline.pipeline_blocks.misc import EpochGenerator
+from ax3_pipeline.pipeline_blocks.postprocessors import FeatureConcat
+from ax3_pipeline.pipeline_blocks.signals import Signal
+
+
+def _reference_epochs(timestamps_ms, d, n_samples_per_epoch):
+    """
+    Epochs and epoch start timestamps as returned by the original (copying) implementation.
+    """
+    delta_t = int(np.median(np.diff(timestamps_ms)))
+    timestamps_ms = timestamps_ms.reshape(-1, n_samples_per_epoch)
+    bad_epoch_indices = np.where(np.diff(timestamps_ms) != delta_t)[0]
+    return (np.delete(d.reshape(-1, n_samples_per_epoch), bad_epoch_indices, axis=0),
+            np.delete(timestamps_ms, bad_epoch_indices, axis=0)[:, 0])
+
+
+class EpochGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        rng = np.random.RandomState(0)
+        self.t = 1600000000000 + np.arange(100 * 500) * 10
+        # gaps inside of epochs 10, 11 (two gaps), 42 and at the boundary between epochs 70 and 71
+        for i in (10 * 500 + 3, 11 * 500 + 1, 11 * 500 + 400, 42 * 500 + 250, 71 * 500):
+            self.t[i:] += 7
+        self.x = rng.normal(size=len(self.t))
+
+    def test_matches_reference(self):
+        epochs, timestamps = _reference_epochs(self.t, self.x, 500)
+        epoch_gen = EpochGenerator(self.t)
+        np.testing.assert_array_equal(epoch_gen.process(self.x)[0], epochs)
+        np.testing.assert_array_equal(epoch_gen.timestamps, timestamps)
+        self.assertEqual(len(timestamps), 97)
+
+    def test_views_without_bad_epochs(self):
+        epochs = EpochGenerator().process(self.x)[0]
+        self.assertEqual(epochs.shape, (100, 500))
+        self.assertTrue(np.shares_memory(epochs, self.x))
+        series = pd.Series(self.x)
+        epochs = EpochGenerator().process(series)[0]
+        self.assertTrue(np.shares_memory(epochs, series.to_numpy()))
+
+    def test_deferred_removal(self):
+        epoch_gen = EpochGenerator(self.t, defer_bad_epoch_removal=True)
+        epochs = epoch_gen.process(self.x)[0]
+        self.assertEqual(epochs.shape, (100, 500))
+        self.assertTrue(np.shares_memory(epochs, self.x))
+        self.assertEqual(np.flatnonzero(~epoch_gen.valid_epochs).tolist(), [10, 11, 42])
+
+        reference, timestamps = _reference_epochs(self.t, self.x, 500)
+        df = FeatureConcat(epoch_gen).process(pd.Series(epochs.mean(axis=1), name="mean"))[0]
+        np.testing.assert_array_equal(df["mean"].to_numpy(), reference.mean(axis=1))
+        np.testing.assert_array_equal(df.index, pd.to_datetime(timestamps, unit="ms"))
+
+    def test_overlapping_windows(self):
+        epoch_gen = EpochGenerator(n_samples_per_epoch=1000, n_samples_per_hop=500)
+        epochs = epoch_gen.process(self.x)[0]
+        self.assertEqual(epochs.shape, (99, 1000))
+        self.assertTrue(np.shares_memory(epochs, self.x))
+        self.assertFalse(epochs.flags.writeable)
+        for i in (0, 1, 50, 98):
+            np.testing.assert_array_equal(epochs[i], self.x[i * 500:i * 500 + 1000])
+
+    def test_overlapping_windows_with_timestamps(self):
+        epoch_gen = EpochGenerator(self.t, n_samples_per_epoch=1000, n_samples_per_hop=500)
+        # windows containing any of the gaps are bad (also the one across the boundary of epochs 70 and 71)
+        valid = np.ones(99, dtype=bool)
+        valid[[9, 10, 11, 41, 42, 70]] = False
+        epochs = epoch_gen.process(self.x)[0]
+        self.assertEqual(len(epochs), np.count_nonzero(valid))
+        starts = np.flatnonzero(valid) * 500
+        np.testing.assert_array_equal(epoch_gen.timestamps, self.t[starts])
+        np.testing.assert_array_equal(epochs[20], self.x[starts[20]:starts[20] + 1000])
+
+    def test_partial_epochs(self):
+        x = self.x[:1250]
+        epochs = EpochGenerator().process(x)[0]
+        self.assertEqual(epochs.shape, (2, 500))
+        self.assertTrue(np.shares_memory(epochs, x))
+
+        epochs = EpochGenerator(partial_epochs="pad").process(x)[0]
+        self.assertEqual(epochs.shape, (3, 500))
+        np.testing.assert_array_equal(epochs[2, :250], x[1000:])
+        np.testing.assert_array_equal(epochs[2, 250:], x[-1])
+
+        with self.assertRaises(ValueError):
+            EpochGenerator(partial_epochs="error").process(x)
+
+    def test_partial_epochs_with_timestamps(self):
+        epoch_gen = EpochGenerator(self.t[:1250])
+        self.assertEqual(len(epoch_gen.timestamps), 2)
+        self.assertEqual(epoch_gen.process(self.x[:1250])[0].shape, (2, 500))
+        epoch_gen = EpochGenerator(self.t[:1250], partial_epochs="pad")
+        np.testing.assert_array_equal(epoch_gen.timestamps, self.t[[0, 500, 1000]])
+
+    def test_missing_samples(self):
+        missing = np.zeros(len(self.t), dtype=bool)
+        missing[[30 * 500, 55 * 500 + 499]] = True
+        epoch_gen = EpochGenerator(self.t, missing_samples=missing, defer_bad_epoch_removal=True)
+        self.assertEqual(np.flatnonzero(~epoch_gen.valid_epochs).tolist(), [10, 11, 30, 42, 55])
+        with self.assertRaises(ValueError):
+            EpochGenerator(missing_samples=missing)
+
+    def test_signal(self):
+        signal = Signal.from_axes(self.x, 2 * self.x, 3 * self.x, start_time_ms=self.t[0])
+        epochs = EpochGenerator(self.t).process(signal)[0]
+        reference, _ = _reference_epochs(self.t, self.x, 500)
+        self.assertEqual(epochs.data.shape, (3,) + reference.shape)
+        np.testing.assert_array_equal(epochs.data[1], 2 * reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ax3_pipeline.pipeline_blocks.postprocessors import NonWeartimeCalculator
+
+
+def _reference_non_weartime(e, min_duration, max_std, min_between_time_s):
+    """
+    Per-episode loop of the original implementation (with the merge of short interruptions taking effect).
+    """
+    still = (e['x_std'] < max_std) & (e['y_std'] < max_std) & (e['z_std'] < max_std)
+    starts = e.index[still & ~still.shift(1, fill_value=False)]
+    ends = e.index[still & ~still.shift(-1, fill_value=False)]
+    intervals = [(start, end) for start, end in zip(starts, ends) if end > start + np.timedelta64(min_duration, 's')]
+
+    merged = []
+    for start, end in intervals:
+        if merged and start.timestamp() - merged[-1][1].timestamp() < min_between_time_s:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    nw = still.astype(np.float64)
+    for start, end in merged:
+        nw[start:end] = np.nan
+    return nw
+
+
+def _epochs(n_epochs, seed):
+    rng = np.random.RandomState(seed)
+    # alternating wear and still periods of random length, still periods partly longer than the minimum non-wear
+    # duration and wear periods partly shorter than the minimum interruption
+    lengths = np.where(np.arange(n_epochs // 100) % 2 == 1, rng.choice([10, 100, 800, 1500], size=n_epochs // 100),
+                       rng.choice([5, 50, 500, 2000], size=n_epochs // 100))
+    still = np.concatenate([np.full(n, i % 2 == 1) for i, n in enumerate(lengths)])[:n_epochs]
+    still = np.pad(still, (0, n_epochs - len(still)))
+    std = np.where(still, rng.uniform(0, 0.012, (3, n_epochs)), rng.uniform(0.005, 0.2, (3, n_epochs)))
+    index = pd.date_range("2020-01-01", periods=n_epochs, freq="5s")
+    # a few missing epochs
+    keep = rng.rand(n_epochs) > 0.01
+    return pd.DataFrame({"x_std": std[0], "y_std": std[1], "z_std": std[2], "mean_enmo": rng.rand(n_epochs)},
+                        index=index)[keep]
+
+
+class NonWeartimeCalculatorTest(unittest.TestCase):
+
+    def test_matches_reference_loop(self):
+        for seed in range(5):
+            for min_duration, min_between in ((3600, 3600), (600, 1800), (60, 0)):
+                e = _epochs(20000, seed)
+                reference = _reference_non_weartime(e, min_duration, 13 / 1000, min_between)
+                NonWeartimeCalculator.lable_non_weartime(e, min_duration, 13 / 1000, min_between)
+                np.testing.assert_array_equal(e["nw"].to_numpy(), reference.to_numpy())
+
+    def test_removes_non_wear_epochs(self):
+        e = _epochs(20000, 0)
+        nw = _reference_non_weartime(e, 3600, 13 / 1000, 3600)
+        self.assertTrue(nw.isna().any())
+        df = NonWeartimeCalculator().process(e)[0]
+        self.assertTrue(df.index.equals(e.index[nw.notna()]))
+        self.assertEqual(list(df.columns), list(e.columns))
+
+    def test_keeps_non_wear_epochs(self):
+        e = _epochs(5000, 1)
+        df = NonWeartimeCalculator(remove=False).process(e)[0]
+        self.assertEqual(len(df), len(e))
+        self.assertIn("nw", df.columns)
+
+    def test_without_non_wear(self):
+        e = _epochs(5000, 2)
+        e[["x_std", "y_std", "z_std"]] = 0.1
+        df = NonWeartimeCalculator().process(e)[0]
+        self.assertTrue(df.equals(e))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ax3_pipeline.pipeline_blocks.compositions import ParallelComposition, SequentialComposition
+from ax3_pipeline.pipeline_blocks.filters import LowpassButterworthFilter, HighpassButterworthFilter
+from ax3_pipeline.pipeline_blocks.misc import VectorMagnitude, EuclideanNormMinusOne
+from ax3_pipeline.pipeline_blocks.profiling import Profiler
+
+
+def _pipeline():
+    return SequentialComposition(
+        LowpassButterworthFilter(),
+        ParallelComposition(
+            SequentialComposition(HighpassButterworthFilter(), VectorMagnitude()),
+            SequentialComposition(HighpassButterworthFilter(cutoff_frequency=0.5), VectorMagnitude()),
+            SequentialComposition(EuclideanNormMinusOne())
+        )
+    )
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.data = [rng.normal(size=10000) for _ in range(3)]
+
+    def _profile(self, pipeline):
+        with Profiler() as profiler:
+            pipeline.process(*self.data)
+        return profiler
+
+    def test_equally_named_processors_are_kept_apart(self):
+        summary = self._profile(_pipeline()).summary()
+        magnitudes = summary[summary.name == "VectorMagnitude"]
+        self.assertEqual(sorted(magnitudes.index), [
+            "0_SequentialComposition/1_ParallelComposition/0_SequentialComposition/1_VectorMagnitude",
+            "0_SequentialComposition/1_ParallelComposition/1_SequentialComposition/1_VectorMagnitude"])
+        self.assertEqual(magnitudes.calls.tolist(), [1, 1])
+        self.assertEqual(len(summary), 11)
+
+    def test_executor_records_keep_their_parent(self):
+        sequential = self._profile(_pipeline()).to_frame()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            concurrent = self._profile(_pipeline().use_executor(executor)).to_frame()
+        self.assertEqual(sorted(concurrent.path), sorted(sequential.path))
+        for path, depth in zip(concurrent.path, concurrent.depth):
+            self.assertEqual(depth, path.count("/"))
+        self.assertGreater(concurrent.thread_id.nunique(), 1)
+
+    def test_graph_nodes(self):
+        pipeline = _pipeline()
+        records = self._profile(pipeline.compile()).to_frame()
+        self.assertEqual(records.path.nunique(), len(records))
+        self.assertEqual(records.path.iloc[-1], "0_ProcessingGraph")
+        self.assertEqual(sorted(records[records.name == "VectorMagnitude"].depth), [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()